@@ -41,6 +41,7 @@ setup(
         'pysqlite3',
         'psycopg2',
         'pymongo',
+        'openpyxl',
 	'matplotlib'
     ],
     classifiers=[
@@ -0,0 +1,45 @@
+import os
+import shutil
+import numpy as np
+import pytest
+import soundfile as sf
+
+
+def writeNoise(path, seconds=1.0, sr=8000, seed=0):
+    rng = np.random.RandomState(seed)
+    sf.write(path, rng.uniform(-0.5, 0.5, int(seconds * sr)), sr,
+             subtype="PCM_16")
+    return path
+
+
+def note(orid, start, end, low, high, name):
+    return {"notetype": "interval", "orid": orid, "file_start": 0.0,
+            "file_end": 1.0, "start_time": start, "end_time": end,
+            "duration": abs(end - start), "min_freq": low, "max_freq": high,
+            "verts": None, "wkt": None, "label": {"name": name},
+            "groups": {}, "metadata": {}}
+
+
+@pytest.fixture
+def mediaDir(tmp_path):
+    path = tmp_path / "media"
+    path.mkdir()
+    for i in range(6):
+        writeNoise(str(path / ("f" + str(i) + ".wav")), seed=i)
+    return str(path)
+
+
+@pytest.fixture
+def mediaRows(mediaDir):
+    return [{"path": os.path.join(mediaDir, "f" + str(i) + ".wav"),
+             "timeexp": 1,
+             "n": i}
+            for i in range(6)]
+
+
+@pytest.fixture
+def colDir(tmp_path):
+    path = tmp_path / "collections"
+    path.mkdir()
+    yield str(path)
+    shutil.rmtree(str(path), ignore_errors=True)
@@ -0,0 +1,36 @@
+import numpy as np
+import pytest
+import soundfile as sf
+from yuntu.core.audio.base import Audio
+from yuntu.core.audio.utils import writeStreamChunks
+from conftest import writeNoise
+
+
+def chunkAudio(path):
+    return Audio({"path": path, "timeexp": 1})
+
+
+@pytest.mark.parametrize("seconds", [10.3, 10.7, 8.0])
+def test_single_pass_chunks_match_masked_chunks(tmp_path, seconds):
+    path = writeNoise(str(tmp_path / "long.wav"), seconds=seconds)
+    streamed = chunkAudio(path).writeChunks(str(tmp_path / "s"), chop=2,
+                                            thresh=1)
+    masked = chunkAudio(path).writeChunks(str(tmp_path / "m"), chop=2,
+                                          thresh=1, singlePass=False)
+
+    assert [c["tlimits"] for c in streamed] == [c["tlimits"] for c in masked]
+    for s, m in zip(streamed, masked):
+        sig, sr = sf.read(s["path"])
+        expected, _ = sf.read(m["path"])
+        assert sig.shape == expected.shape
+        assert sig.shape[0] == int((s["tlimits"][1] - s["tlimits"][0]) * sr)
+        assert np.array_equal(sig, expected)
+
+
+def test_open_last_chunk_on_block_boundary(tmp_path):
+    blocks = [np.full(1000, 0.1, dtype=np.float32),
+              np.full(1000, 0.2, dtype=np.float32)]
+    paths = [str(tmp_path / "a.wav"), str(tmp_path / "b.wav")]
+    writeStreamChunks(iter(blocks), 8000, 1, [(0, 1000), (1000, None)], paths)
+
+    assert [sf.info(p).frames for p in paths] == [1000, 1000]
@@ -0,0 +1,41 @@
+import numpy as np
+import pytest
+import soundfile as sf
+import librosa
+from yuntu.core.audio.utils import read, readWindow
+
+
+@pytest.fixture(scope="module")
+def wavPath(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp("audio") / "noise.wav")
+    rng = np.random.RandomState(0)
+    sf.write(path, rng.uniform(-0.5, 0.5, 8000 * 5).astype(np.float32), 8000,
+             subtype="FLOAT")
+    return path
+
+
+@pytest.mark.parametrize("offset,duration", [(0.0, None),
+                                             (2.01, 1.3),
+                                             (0.0001, 0.5),
+                                             (1.23456, 0.777),
+                                             (4.9999, 1.0),
+                                             (0.3, None)])
+def test_read_window_matches_librosa(wavPath, offset, duration):
+    expected, expectedSr = librosa.load(wavPath,
+                                        sr=None,
+                                        offset=offset,
+                                        duration=duration,
+                                        mono=False)
+    sig, sr = readWindow(wavPath, None, offset, duration)
+
+    assert sr == expectedSr
+    assert sig.shape == expected.shape
+    assert np.array_equal(sig, expected)
+
+
+def test_read_uses_window(wavPath):
+    sig, sr = read(wavPath, None, 2.01, 1.3)
+    expected, _ = librosa.load(wavPath, sr=None, offset=2.01, duration=1.3,
+                               mono=False)
+
+    assert np.array_equal(sig, expected)
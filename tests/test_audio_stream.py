@@ -0,0 +1,30 @@
+import numpy as np
+import pytest
+import scipy.signal
+from yuntu.core.audio.utils import readBlocks, spectrogram, streamSpectrogram, \
+    streamResample, read
+from conftest import writeNoise
+
+
+@pytest.mark.parametrize("blockSize", [100, 511, 512, 4096, 100000])
+def test_stream_spectrogram_equals_one_shot(tmp_path, blockSize):
+    path = writeNoise(str(tmp_path / "a.wav"), seconds=2.3)
+    sig, _ = read(path, None)
+    expected = spectrogram(sig, 1024, 256)
+    blocks = list(streamSpectrogram(readBlocks(path, blockSize), 1024, 256))
+
+    assert np.array_equal(np.concatenate(blocks, axis=1), expected)
+
+
+@pytest.mark.parametrize("blockSize", [97, 1000, 8192])
+@pytest.mark.parametrize("outSr", [4000, 6000, 11025, 22050])
+def test_stream_resample_equals_resample_poly(tmp_path, blockSize, outSr):
+    path = writeNoise(str(tmp_path / "a.wav"), seconds=1.7)
+    sig, sr = read(path, None)
+    gcd = np.gcd(sr, outSr)
+    expected = scipy.signal.resample_poly(sig, outSr // gcd, sr // gcd)
+    blocks = list(streamResample(readBlocks(path, blockSize), sr, outSr))
+    result = np.concatenate(blocks)
+
+    assert result.shape == expected.shape
+    assert np.allclose(result, expected, rtol=0, atol=1e-6)
@@ -0,0 +1,57 @@
+import pickle
+import sqlite3
+import numpy as np
+from yuntu.core.cache.base import specCache, getSpecCache
+
+
+def entryHits(cache):
+    cnn = sqlite3.connect(cache.indexPath)
+    rows = cnn.execute("SELECT key,hits FROM entries").fetchall()
+    cnn.close()
+    return dict(rows)
+
+
+def test_cache_get_does_not_write_until_flush(tmp_path):
+    cache = specCache(str(tmp_path / "cache"), flushEvery=1000)
+    spec = np.arange(12, dtype=np.float32).reshape(3, 4)
+    assert cache.put("md5", {"n_fft": 4}, spec)
+    connection = cache.connection
+
+    for _ in range(5):
+        assert np.array_equal(cache.get("md5", {"n_fft": 4}), spec)
+    assert cache.get("md5", {"n_fft": 8}) is None
+
+    assert cache.connection is connection
+    assert list(entryHits(cache).values()) == [0]
+
+    assert cache.flush() == 6
+    assert list(entryHits(cache).values()) == [5]
+    stats = cache.stats()
+    assert stats["hits"] == 5
+    assert stats["misses"] == 1
+    assert stats["entries"] == 1
+
+
+def test_cache_flushes_every_n_lookups(tmp_path):
+    cache = specCache(str(tmp_path / "cache"), flushEvery=3)
+    cache.put("md5", {}, np.zeros(4))
+    for _ in range(3):
+        cache.get("md5", {})
+    assert list(entryHits(cache).values()) == [3]
+
+
+def test_cache_close_and_pickle(tmp_path):
+    cache = specCache(str(tmp_path / "cache"))
+    cache.put("md5", {}, np.ones(4))
+    cache.get("md5", {})
+    copy = pickle.loads(pickle.dumps(cache))
+    cache.close()
+    assert cache.connection is None
+    assert copy.stats()["hits"] == 1
+    assert np.array_equal(copy.get("md5", {}), np.ones(4))
+
+
+def test_shared_cache_per_directory(tmp_path):
+    dirPath = str(tmp_path / "cache")
+    assert getSpecCache(dirPath) is getSpecCache(dirPath)
+    assert getSpecCache(dirPath) is not getSpecCache(dirPath, maxSize=10)
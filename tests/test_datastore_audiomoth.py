@@ -0,0 +1,39 @@
+import struct
+import pytest
+from yuntu.core.datastore.utils import readAudioMothFile
+
+COMMENT = (b"Recorded at 10:20:30 01/02/2020 (UTC) by AudioMoth 0123456789ABCDEF"
+           b" at gain setting 2 while battery state was 4.5V.")
+
+
+def writeAudioMoth(path, formatTag=1, nframes=800, sr=8000):
+    comment = COMMENT + b"\x00" * (len(COMMENT) % 2)
+    info = b"INFO" + b"ICMT" + struct.pack("<I", len(comment)) + comment
+    data = b"\x00\x00" * nframes
+    fmt = struct.pack("<HHIIHH", formatTag, 1, sr, sr * 2, 2, 16)
+    body = (b"WAVE" + b"fmt " + struct.pack("<I", len(fmt)) + fmt +
+            b"LIST" + struct.pack("<I", len(info)) + info +
+            b"data" + struct.pack("<I", len(data)) + data)
+    with open(path, "wb") as f:
+        f.write(b"RIFF" + struct.pack("<I", len(body)) + body)
+    return path
+
+
+def test_header_and_wav_info(tmp_path):
+    obj = readAudioMothFile(writeAudioMoth(str(tmp_path / "a.wav")))
+
+    assert obj["time"] == "10:20:30 01/02/2020"
+    assert obj["tZone"] == "UTC"
+    assert obj["device_id"] == "0123456789ABCDEF"
+    assert obj["gain"] == 2.0 and obj["voltage"] == 4.5
+    assert obj["wav_info"]["samplerate"] == 8000
+    assert obj["wav_info"]["length"] == 800
+
+
+@pytest.mark.parametrize("formatTag", [3, 0xFFFE])
+def test_unsupported_wav_header_keeps_record(tmp_path, formatTag):
+    obj = readAudioMothFile(writeAudioMoth(str(tmp_path / "a.wav"),
+                                           formatTag))
+
+    assert obj["device_id"] == "0123456789ABCDEF"
+    assert "wav_info" not in obj
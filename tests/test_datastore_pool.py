@@ -0,0 +1,49 @@
+import threading
+import psycopg2
+import psycopg2.extensions
+import pytest
+from yuntu.core.datastore.methods import BlockingConnectionPool
+
+
+class FakeInfo(object):
+    transaction_status = psycopg2.extensions.TRANSACTION_STATUS_IDLE
+
+
+class FakeConnection(object):
+    def __init__(self):
+        self.closed = False
+        self.info = FakeInfo()
+
+    def close(self):
+        self.closed = True
+
+    def rollback(self):
+        pass
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    monkeypatch.setattr(psycopg2, "connect", lambda *args, **kwargs: FakeConnection())
+    return BlockingConnectionPool(1, 2, "dbname=fake")
+
+
+def test_pool_waits_for_a_free_connection(pool):
+    first = pool.getconn()
+    pool.getconn()
+    got = []
+    waiter = threading.Thread(target=lambda: got.append(pool.getconn()))
+    waiter.start()
+    waiter.join(0.2)
+    assert waiter.is_alive()
+
+    pool.putconn(first)
+    waiter.join(5)
+    assert not waiter.is_alive()
+    assert len(got) == 1
+
+
+def test_pool_timeout_names_maxconn(pool):
+    pool.getconn()
+    pool.getconn()
+    with pytest.raises(ValueError, match="maxconn"):
+        pool.getconn(timeout=0.05)
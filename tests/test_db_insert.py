@@ -0,0 +1,67 @@
+import os
+import shutil
+from yuntu.collection.base import simpleCollection
+from conftest import writeNoise
+
+
+def tables(col):
+    cursor = col.db.connection.cursor()
+    cursor.row_factory = None
+    return {table: cursor.execute("SELECT COUNT(*) FROM " + table).fetchone()[0]
+            for table in ["original", "parsed", "manifest"]}
+
+
+def test_unchanged_files_are_skipped(colDir, mediaRows):
+    col = simpleCollection("c", dirPath=colDir)
+    first = col.insertMedia(mediaRows)
+    second = col.insertMedia(mediaRows)
+
+    assert first["new"] == 6
+    assert second["skipped"] == 6 and second["new"] == 0
+    assert tables(col) == {"original": 6, "parsed": 6, "manifest": 6}
+
+
+def test_touched_file_keeps_its_orid(colDir, mediaRows):
+    col = simpleCollection("c", dirPath=colDir)
+    col.insertMedia(mediaRows[:1])
+    os.utime(mediaRows[0]["path"], ns=(1, 1))
+    report = col.insertMedia(mediaRows[:1])
+
+    assert report["changed"] == 1
+    assert tables(col) == {"original": 1, "parsed": 1, "manifest": 1}
+
+
+def test_changed_content_updates_in_place(colDir, mediaRows):
+    col = simpleCollection("c", dirPath=colDir)
+    col.insertMedia(mediaRows[:1])
+    before = col.getMetadata(iterate=False)[0]
+    writeNoise(mediaRows[0]["path"], seconds=2.0, seed=99)
+    report = col.insertMedia(mediaRows[:1])
+    after = col.getMetadata(iterate=False)[0]
+
+    assert report["changed"] == 1
+    assert after["orid"] == before["orid"]
+    assert after["md5"] != before["md5"]
+    assert tables(col) == {"original": 1, "parsed": 1, "manifest": 1}
+
+
+def test_duplicates_are_skipped_without_originals(colDir, mediaRows):
+    col = simpleCollection("c", dirPath=colDir)
+    copy = mediaRows[0]["path"] + ".copy.wav"
+    shutil.copyfile(mediaRows[0]["path"], copy)
+    report = col.insertMedia([mediaRows[0], dict(mediaRows[0], path=copy)])
+
+    assert report["new"] == 1 and report["skipped"] == 1
+    assert tables(col) == {"original": 1, "parsed": 1, "manifest": 2}
+
+
+def test_dropped_media_can_be_inserted_again(colDir, mediaRows):
+    col = simpleCollection("c", dirPath=colDir)
+    col.insertMedia(mediaRows)
+    col.dropMedia(query={"metadata.n": 5})
+    assert col.getSize()["count"] == 5
+
+    report = col.insertMedia(mediaRows)
+
+    assert report["new"] == 1 and report["skipped"] == 5
+    assert col.getSize()["count"] == 6
@@ -0,0 +1,36 @@
+from yuntu.collection.base import simpleCollection
+from conftest import note
+
+
+def annotate(col, names):
+    orids = {row["metadata"]["n"]: row["orid"]
+             for row in col.getMetadata(iterate=False)}
+    col.annotate([note(orids[n], 0.1, 0.2, None, None, name)
+                  for n, name in names])
+
+
+def annotationsByMd5(col):
+    md5s = {row["orid"]: row["md5"] for row in col.getMetadata(iterate=False)}
+    return sorted([(md5s[row["orid"]], row["label"]["name"])
+                   for row in col.getAnnotations(iterate=False)])
+
+
+def test_merge_remaps_orids_and_annotations(colDir, mediaRows):
+    col = simpleCollection("a", dirPath=colDir)
+    col.insertMedia(mediaRows[:3])
+    annotate(col, [(0, "a0"), (2, "a2")])
+    other = simpleCollection("b", dirPath=colDir)
+    other.insertMedia(mediaRows[2:])
+    annotate(other, [(2, "a2"), (2, "b2"), (4, "b4"), (5, "b5")])
+    expected = sorted(set(annotationsByMd5(col) + annotationsByMd5(other)))
+
+    report = col.merge(other)
+
+    rows = col.getMetadata(iterate=False)
+    assert report["media"] == 3
+    assert report["orphans"] == 0
+    assert len(rows) == 6
+    assert len(set(row["md5"] for row in rows)) == 6
+    assert len(set(row["orid"] for row in rows)) == 6
+    assert annotationsByMd5(col) == expected
+    assert report["annotations"] == 3
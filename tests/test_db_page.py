@@ -0,0 +1,51 @@
+import pytest
+from yuntu.collection.base import simpleCollection
+
+
+def pages(col, limit, orderBy):
+    orids = []
+    token = None
+    while True:
+        page = col.getMetadataPage(limit=limit, orderBy=orderBy, token=token)
+        assert len(page["items"]) <= limit
+        orids += [row["orid"] for row in page["items"]]
+        token = page["next"]
+        if token is None:
+            return orids
+
+
+@pytest.mark.parametrize("orderBy", [None, "orid", "-orid", "metadata.site",
+                                     "-metadata.site", "metadata.missing"])
+@pytest.mark.parametrize("limit", [1, 4, 6, 10])
+def test_pages_cover_every_row_once(colDir, mediaRows, orderBy, limit):
+    for row in mediaRows:
+        row["site"] = row["n"] % 2
+    col = simpleCollection("c", dirPath=colDir)
+    col.insertMedia(mediaRows)
+
+    orids = pages(col, limit, orderBy)
+    assert sorted(orids) == sorted(set(orids))
+    assert len(orids) == 6
+
+
+def test_page_token_is_stable_across_inserts(colDir, mediaRows):
+    col = simpleCollection("c", dirPath=colDir)
+    col.insertMedia(mediaRows[:4])
+    first = col.getMetadataPage(limit=2, orderBy="orid")
+    col.insertMedia(mediaRows[4:])
+    second = col.getMetadataPage(limit=10, orderBy="orid",
+                                 token=first["next"])
+
+    assert [row["orid"] for row in first["items"]] == [1, 2]
+    assert [row["orid"] for row in second["items"]] == [3, 4, 5, 6]
+
+
+def test_page_token_rejects_other_order(colDir, mediaRows):
+    col = simpleCollection("c", dirPath=colDir)
+    col.insertMedia(mediaRows)
+    token = col.getMetadataPage(limit=2, orderBy="metadata.n")["next"]
+
+    with pytest.raises(ValueError):
+        col.getMetadataPage(limit=2, orderBy="-metadata.n", token=token)
+    with pytest.raises(ValueError):
+        col.getMetadataPage(limit=2, token="not a token")
@@ -0,0 +1,27 @@
+from yuntu.collection.base import simpleCollection
+from conftest import note
+
+
+def names(col, key, window):
+    return sorted([row["label"]["name"] for row in
+                   col.getAnnotations(query={key: window}, iterate=False)])
+
+
+def test_window_queries_order_inverted_bounds(colDir, mediaRows):
+    col = simpleCollection("c", dirPath=colDir)
+    col.insertMedia(mediaRows[:1])
+    orid = col.getMetadata(iterate=False)[0]["orid"]
+    col.annotate([note(orid, 2.0, 5.0, 500.0, 2000.0, "ordered"),
+                  note(orid, 5.0, 2.0, 2000.0, 500.0, "inverted"),
+                  note(orid, 2.0, 5.0, None, None, "unbounded")])
+
+    assert names(col, "$overlaps", {"start_time": 3.0, "end_time": 4.0}) == \
+        ["inverted", "ordered", "unbounded"]
+    assert names(col, "$overlaps", {"min_freq": 2500.0}) == ["unbounded"]
+    assert names(col, "$overlaps", {"min_freq": 1500.0, "max_freq": 1800.0}) == \
+        ["inverted", "ordered", "unbounded"]
+    assert names(col, "$within", {"start_time": 3.0, "end_time": 6.0}) == []
+    assert names(col, "$within", {"start_time": 1.0, "end_time": 6.0}) == \
+        ["inverted", "ordered", "unbounded"]
+    assert names(col, "$within", {"min_freq": 400.0, "max_freq": 2500.0}) == \
+        ["inverted", "ordered"]
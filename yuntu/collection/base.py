@@ -59,6 +59,7 @@ class simpleCollection(metaCollection):
         self.name = name
         self.virtual = virtual
         self.metadata = metadata
+        self.specCache = None
 
         if self.virtual:
             self.dirPath = None
@@ -115,6 +116,17 @@ class simpleCollection(metaCollection):
                  iterate=True):
         return colMethods.collectionQuery(self, orid, query, iterate)
 
+    def getMediaPage(self,
+                     query=None,
+                     limit=100,
+                     orderBy=None,
+                     token=None):
+        return colMethods.collectionQueryPage(self,
+                                              query,
+                                              limit,
+                                              orderBy,
+                                              token)
+
     def getAnnotatedMedia(self,
                           noteid=None,
                           query=None,
@@ -128,6 +140,19 @@ class simpleCollection(metaCollection):
                                                       subgroup,
                                                       iterate)
 
+    def getAnnotatedMediaPage(self,
+                              query=None,
+                              media_fields=None,
+                              subgroup=None,
+                              limit=100,
+                              token=None):
+        return colMethods.collectionGetAnnotatedMediaPage(self,
+                                                          query,
+                                                          media_fields,
+                                                          subgroup,
+                                                          limit,
+                                                          token)
+
     def getMetadata(self,
                     orid=None,
                     query=None,
@@ -137,6 +162,17 @@ class simpleCollection(metaCollection):
                                                 query,
                                                 iterate)
 
+    def getMetadataPage(self,
+                        query=None,
+                        limit=100,
+                        orderBy=None,
+                        token=None):
+        return colMethods.collectionGetMetadataPage(self,
+                                                    query,
+                                                    limit,
+                                                    orderBy,
+                                                    token)
+
     def getAnnotations(self,
                        noteid=None,
                        query=None,
@@ -146,6 +182,17 @@ class simpleCollection(metaCollection):
                                                    query,
                                                    iterate)
 
+    def getAnnotationsPage(self,
+                           query=None,
+                           limit=100,
+                           orderBy=None,
+                           token=None):
+        return colMethods.collectionGetAnnotationsPage(self,
+                                                       query,
+                                                       limit,
+                                                       orderBy,
+                                                       token)
+
     def getSignals(self,
                    orid=None,
                    query=None,
@@ -174,10 +221,20 @@ class simpleCollection(metaCollection):
 
     def insertMedia(self,
                     input,
-                    parseSeq=None):
+                    parseSeq=None,
+                    workers=None,
+                    batchSize=1000,
+                    processes=False,
+                    incremental=True,
+                    prefetch=None):
         return colMethods.collectionInsert(self,
                                            input,
-                                           parseSeq)
+                                           parseSeq,
+                                           workers,
+                                           batchSize,
+                                           processes,
+                                           incremental,
+                                           prefetch)
 
     def annotate(self,
                  dataArr):
@@ -188,28 +245,57 @@ class simpleCollection(metaCollection):
                   where=None,
                   query=None):
         return colMethods.collectionDropMedia(self,
-                                              where,
-                                              query)
+                                              where=where,
+                                              query=query)
 
     def pullDatastore(self,
                       dsDict,
-                      parseSeq=None):
+                      parseSeq=None,
+                      workers=None,
+                      batchSize=1000,
+                      processes=False,
+                      incremental=True,
+                      prefetch=None):
         return colMethods.collectionPullDatastore(self,
                                                   dsDict,
-                                                  parseSeq)
+                                                  parseSeq,
+                                                  workers,
+                                                  batchSize,
+                                                  processes,
+                                                  incremental,
+                                                  prefetch)
 
     def transformMetadata(self,
                           parseSeq,
                           id=None,
                           where=None,
                           query=None,
-                          operation="append"):
+                          operation="append",
+                          chunkSize=1000,
+                          workers=None):
         return colMethods.collectionTransform(self,
                                               parseSeq,
                                               id,
                                               where,
                                               query,
-                                              operation)
+                                              operation,
+                                              chunkSize,
+                                              workers)
+
+    def merge(self,
+              other,
+              parseSeq=None,
+              otherParseSeq=None,
+              operation="append",
+              chunkSize=1000,
+              workers=None):
+        return colMethods.collectionMerge(self,
+                                          other,
+                                          parseSeq,
+                                          otherParseSeq,
+                                          operation,
+                                          chunkSize,
+                                          workers)
 
     def getSize(self,
                 where=None,
@@ -218,6 +304,63 @@ class simpleCollection(metaCollection):
                                             where,
                                             query)
 
+    def indexField(self,
+                   path,
+                   table="parsed"):
+        return colMethods.collectionIndexField(self,
+                                               path,
+                                               table)
+
+    def dropFieldIndex(self,
+                       path,
+                       table="parsed"):
+        return colMethods.collectionDropFieldIndex(self,
+                                                   path,
+                                                   table)
+
+    def getIndexedFields(self):
+        return colMethods.collectionGetIndexedFields(self)
+
+    def buildResampledMedia(self,
+                            dirPath=None,
+                            out_sr=24000,
+                            media_format="wav",
+                            chop=60,
+                            thresh=1,
+                            orid=None,
+                            query=None,
+                            iterate=False,
+                            nworkers=None,
+                            maxInFlight=None,
+                            resume=True):
+        return colMethods.collectionBuildResampledMedia(self,
+                                                        dirPath,
+                                                        out_sr,
+                                                        media_format,
+                                                        chop,
+                                                        thresh,
+                                                        orid,
+                                                        query,
+                                                        iterate,
+                                                        nworkers,
+                                                        maxInFlight,
+                                                        resume)
+
+    def getResampledChunks(self,
+                           out_sr=None,
+                           chop=None,
+                           orid=None,
+                           md5=None,
+                           iterate=True,
+                           out_dir=None):
+        return colMethods.collectionGetResampledChunks(self,
+                                                       out_sr,
+                                                       chop,
+                                                       orid,
+                                                       md5,
+                                                       iterate,
+                                                       out_dir)
+
     def dump(self,
              dirPath,
              overwrite=False):
@@ -227,17 +370,29 @@ class simpleCollection(metaCollection):
 
     def materialize(self,
                     dirPath=None,
-                    overwrite=False):
+                    overwrite=False,
+                    linkMode="auto",
+                    workers=8):
         return colMethods.collectionMaterialize(self,
                                                 dirPath,
-                                                overwrite)
+                                                overwrite,
+                                                linkMode,
+                                                workers)
 
     def doggyBag(self,
                  dirPath="",
-                 outName=None):
+                 outName=None,
+                 overwrite=True,
+                 archive=None,
+                 linkMode="auto",
+                 workers=8):
         return colMethods.collectionDoggyBag(self,
                                              dirPath,
-                                             outName)
+                                             outName,
+                                             overwrite,
+                                             archive,
+                                             linkMode,
+                                             workers)
 
     def toDisk(self,
                dirPath,
@@ -246,6 +401,19 @@ class simpleCollection(metaCollection):
                                            dirPath,
                                            overwrite)
 
+    def enableSpecCache(self,
+                        maxSize=None,
+                        dirPath=None):
+        return colMethods.collectionEnableSpecCache(self,
+                                                    maxSize,
+                                                    dirPath)
+
+    def disableSpecCache(self):
+        return colMethods.collectionDisableSpecCache(self)
+
+    def getCacheStats(self):
+        return colMethods.collectionGetCacheStats(self)
+
     def server(self,
                port=9797):
         return colMethods.collectionServer(self,
@@ -284,10 +452,20 @@ class timedCollection(simpleCollection):
 
     def insertMedia(self,
                     input,
-                    parseSeq=None):
+                    parseSeq=None,
+                    workers=None,
+                    batchSize=1000,
+                    processes=False,
+                    incremental=True,
+                    prefetch=None):
         return colMethods.collectionTimedInsert(self,
                                                 input,
-                                                parseSeq)
+                                                parseSeq,
+                                                workers,
+                                                batchSize,
+                                                processes,
+                                                incremental,
+                                                prefetch)
 
     def build(self,
               dbDump=None):
@@ -301,3 +479,160 @@ class timedCollection(simpleCollection):
                 return self.buildTime()
             else:
                 return True
+
+
+class shardedCollection(metaCollection):
+    __metaclass__ = ABCMeta
+
+    def __init__(self,
+                 name,
+                 dirPath="",
+                 shardKey="datastore",
+                 timeField="datetime",
+                 timeFormat='%d-%m-%Y %H:%M:%S',
+                 metadata=None,
+                 workers=4,
+                 overwrite=False):
+        self.name = name
+        self.virtual = False
+        self.metadata = metadata
+        self.specCache = None
+        self.workers = workers
+        self.shardClass = simpleCollection
+        self.shards = {}
+        self.dirPath = dirPath
+        self.colPath = colMethods.collectionPath(self)
+        self.info = {"name": self.name,
+                     "dirPath": dirPath,
+                     "creation": None,
+                     "modification": None,
+                     "connPath": None,
+                     "type": "shardedCollection",
+                     "shardKey": shardKey,
+                     "timeField": timeField,
+                     "timeFormat": timeFormat,
+                     "shards": [],
+                     "metadata": metadata}
+
+        colMethods.collectionShardedInit(self, overwrite)
+
+    def getType(self):
+        return "shardedCollection"
+
+    def getShards(self):
+        return list(self.info["shards"])
+
+    def getShard(self,
+                 shardName):
+        return self.shards[shardName]
+
+    def build(self):
+        return colMethods.collectionShardedInit(self, True)
+
+    def load(self):
+        return colMethods.collectionShardedInit(self, False)
+
+    def getMedia(self,
+                 orid=None,
+                 query=None,
+                 iterate=True,
+                 shards=None):
+        return colMethods.collectionShardedQuery(self,
+                                                 orid,
+                                                 query,
+                                                 iterate,
+                                                 shards)
+
+    def getMetadata(self,
+                    orid=None,
+                    query=None,
+                    iterate=True,
+                    shards=None):
+        return colMethods.collectionShardedGetMetadata(self,
+                                                       orid,
+                                                       query,
+                                                       iterate,
+                                                       shards)
+
+    def getAnnotations(self,
+                       noteid=None,
+                       query=None,
+                       iterate=True,
+                       shards=None):
+        return colMethods.collectionShardedGetAnnotations(self,
+                                                          noteid,
+                                                          query,
+                                                          iterate,
+                                                          shards)
+
+    def insertMedia(self,
+                    input,
+                    parseSeq=None,
+                    workers=None,
+                    batchSize=1000,
+                    processes=False,
+                    incremental=True,
+                    prefetch=None):
+        return colMethods.collectionShardedInsert(self,
+                                                  input,
+                                                  parseSeq,
+                                                  workers,
+                                                  batchSize,
+                                                  processes,
+                                                  incremental,
+                                                  prefetch)
+
+    def annotate(self,
+                 dataArr):
+        return colMethods.collectionShardedAnnotate(self,
+                                                    dataArr)
+
+    def dropMedia(self,
+                  where=None,
+                  query=None,
+                  shards=None):
+        return colMethods.collectionShardedDropMedia(self,
+                                                     where=where,
+                                                     query=query,
+                                                     shards=shards)
+
+    def transformMetadata(self,
+                          parseSeq,
+                          id=None,
+                          where=None,
+                          query=None,
+                          operation="append",
+                          chunkSize=1000,
+                          shards=None):
+        return colMethods.collectionShardedTransform(self,
+                                                     parseSeq,
+                                                     id,
+                                                     where,
+                                                     query,
+                                                     operation,
+                                                     chunkSize,
+                                                     shards)
+
+    def getSize(self,
+                where=None,
+                query=None,
+                shards=None):
+        return colMethods.collectionShardedGetSize(self,
+                                                   where,
+                                                   query,
+                                                   shards)
+
+    def dump(self,
+             dirPath,
+             overwrite=False):
+        return colMethods.collectionShardedDump(self,
+                                                dirPath,
+                                                overwrite)
+
+    def materialize(self,
+                    dirPath=None,
+                    overwrite=False):
+        raise ValueError("Sharded collections can not be materialized as a whole. Use getShard.")
+
+    def serve(self):
+        raise ValueError("Sharded collections can not be served as a whole. Use getShard.")
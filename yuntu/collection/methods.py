@@ -4,18 +4,29 @@ import json
 import shutil
 import time
 import errno
+import queue
+import threading
+import datetime
+import tarfile
+import zipfile
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from yuntu.core.db.base import embeddedDb, RAMDb
+from yuntu.core.cache.base import specCache
 from yuntu.core.db.methods import lDbUpdateField, lDbTimedInsert,\
-    lDbCrossSelectAnn
-from yuntu.core.db.utils import addTimeFields, loadParser
+    lDbCrossSelectAnn, lDbCheckpoint, lDbCrossSelectAnnPage, \
+    lDbResampledDone, lDbRecordResampled, lDbResampledChunks, lDbUpdatePaths
+from yuntu.core.db.utils import addTimeFields, loadParser, stripName
 from yuntu.core.datastore.base import simpleDatastore, directDatastore,\
-    mongodbDatastore, audioMothDatastore, postgresqlDatastore
+    mongodbDatastore, audioMothDatastore, postgresqlDatastore, csvDatastore,\
+    xlsDatastore
 from yuntu.collection.server import yuntuServer
 from yuntu.collection.utils import audioIterator, audioArray, annAudioArray,\
     annAudioIterator, annotationIterator, metadataIterator, metadataArray, \
-    signalIterator, signalArray, specIterator, specArray, buildColDirStruct
+    signalIterator, signalArray, specIterator, specArray, buildColDirStruct, \
+    resampledJob, mediaTransferJob
 from yuntu.core.common.utils import loadJsonFile, dumpJsonFile, binaryMD5,\
-    cleanDirectory
+    cleanDirectory, boundedMap, prefetchIterator, linkOrCopy
 
 
 def collectionPersistParser(col,
@@ -117,7 +128,7 @@ def collectionBuild(col,
 def collectionLoad(col):
     collectionLoadInfo(col)
     dbDump = None
-    if os.path.splitext(col.info["connPath"])[1] == ".sql":
+    if col.info["connPath"].endswith(".sql") or col.info["connPath"].endswith(".sql.gz"):
         dbDump = col.info["connPath"]
     col.db = embeddedDb(col.name, os.path.join(
         col.colPath, "db"), dbDump, False)
@@ -127,9 +138,54 @@ def collectionLoad(col):
     col.info["creation"] = strtime
     col.info["dirPath"] = os.path.abspath(col.info["dirPath"])
 
+    return collectionInitSpecCache(col)
+
+
+def collectionInitSpecCache(col):
+    col.specCache = None
+    if "specCache" in col.info:
+        if col.info["specCache"] is not None:
+            conf = col.info["specCache"]
+            col.specCache = specCache(conf["dirPath"], conf["maxSize"])
+
+    return True
+
+
+def collectionEnableSpecCache(col,
+                              maxSize=None,
+                              dirPath=None):
+    if dirPath is None:
+        if col.virtual:
+            raise ValueError("'dirPath' is mandatory for virtual collections.")
+        dirPath = os.path.join(col.colPath, "cache", "specs")
+
+    col.info["specCache"] = {"dirPath": os.path.abspath(dirPath),
+                             "maxSize": maxSize}
+    collectionInitSpecCache(col)
+
+    if not col.virtual:
+        return collectionSaveInfo(col)
+
     return True
 
 
+def collectionDisableSpecCache(col):
+    col.info["specCache"] = None
+    col.specCache = None
+
+    if not col.virtual:
+        return collectionSaveInfo(col)
+
+    return True
+
+
+def collectionGetCacheStats(col):
+    if col.specCache is None:
+        return None
+
+    return col.specCache.stats()
+
+
 def collectionVirtualInit(col,
                           dbDump=None):
     col.db = RAMDb(col.name, dump=dbDump)
@@ -149,7 +205,14 @@ def collectionAnnotate(col,
 
 def collectionInsert(col,
                      input,
-                     parseSeq):
+                     parseSeq,
+                     workers=None,
+                     batchSize=1000,
+                     processes=False,
+                     incremental=True,
+                     prefetch=None):
+    if parseSeq is None:
+        parseSeq = []
     for i in range(len(parseSeq)):
         parseSeq[i] = collectionPersistParser(col, parseSeq[i])
 
@@ -158,12 +221,25 @@ def collectionInsert(col,
     else:
         ds = directDatastore(input)
 
-    return col.db.insert(ds.getData(), parseSeq)
+    return col.db.insert(ds.getData(),
+                         parseSeq,
+                         workers=workers,
+                         batchSize=batchSize,
+                         processes=processes,
+                         incremental=incremental,
+                         prefetch=prefetch)
 
 
 def collectionTimedInsert(col,
                           input,
-                          parseSeq):
+                          parseSeq,
+                          workers=None,
+                          batchSize=1000,
+                          processes=False,
+                          incremental=True,
+                          prefetch=None):
+    if parseSeq is None:
+        parseSeq = []
     for i in range(len(parseSeq)):
         parseSeq[i] = collectionPersistParser(col, parseSeq[i])
 
@@ -176,35 +252,168 @@ def collectionTimedInsert(col,
                           parseSeq,
                           col.timeField,
                           col.tzField,
-                          col.timeFormat)
+                          col.timeFormat,
+                          workers,
+                          batchSize,
+                          processes,
+                          incremental,
+                          prefetch)
 
 
 def collectionPullDatastore(col,
                             dsDict,
-                            parseSeq):
+                            parseSeq,
+                            workers=None,
+                            batchSize=1000,
+                            processes=False,
+                            incremental=True,
+                            prefetch=None):
     if dsDict["type"] == "mongodb":
         ds = mongodbDatastore(dsDict)
-        return col.insertMedia(ds, parseSeq)
     elif dsDict["type"] == "audioMoth":
         ds = audioMothDatastore(dsDict)
-        return col.insertMedia(ds, parseSeq)
     elif dsDict["type"] == "postgresql":
         ds = postgresqlDatastore(dsDict)
-        return col.insertMedia(ds, parseSeq)
+    elif dsDict["type"] == "csv":
+        ds = csvDatastore(dsDict)
+    elif dsDict["type"] == "xls":
+        ds = xlsDatastore(dsDict)
     else:
         raise ValueError("Datastore not implemented")
 
+    return col.insertMedia(ds, parseSeq, workers, batchSize, processes,
+                           incremental, prefetch)
+
 
 def collectionTransform(col,
                         parseSeq,
                         id=None,
                         where=None,
                         query=None,
-                        operation="append"):
+                        operation="append",
+                        chunkSize=1000,
+                        workers=None):
     for i in range(len(parseSeq)):
         parseSeq[i] = collectionPersistParser(col, parseSeq[i])
 
-    return col.db.transform(parseSeq, id, where, query, operation)
+    return col.db.transform(parseSeq, id, where, query, operation,
+                            chunkSize, workers)
+
+
+def collectionParserSources(col):
+    parserDicts = {}
+    if col.virtual:
+        for fname in col.db.parsers:
+            parserDicts[fname] = col.db.parsers[fname]["parserDict"]
+
+    for row in col.db.select(freeSt="DISTINCT parse_seq FROM parsed"):
+        for parserDict in row["parse_seq"]:
+            if parserDict["path"] not in parserDicts:
+                parserDicts[parserDict["path"]] = parserDict
+
+    return parserDicts
+
+
+def collectionConsolidateParsers(col,
+                                 other):
+    parserDicts = collectionParserSources(other)
+    for fname in parserDicts:
+        if other.virtual:
+            source = other.db.parsers[fname]["source"]
+            func = other.db.parsers[fname]["func"]
+        else:
+            srcPath = os.path.join(other.colPath, "parsers", fname)
+            pFile = open(srcPath)
+            source = [line for line in pFile]
+            pFile.close()
+            func = None
+
+        if col.virtual:
+            if fname not in col.db.parsers:
+                if func is None:
+                    func = loadParser(parserDicts[fname],
+                                      os.path.join(other.colPath, "parsers"))
+                col.db.parsers[fname] = {"parserDict": parserDicts[fname],
+                                         "source": source,
+                                         "func": func}
+        else:
+            newPath = os.path.join(col.colPath, "parsers", fname)
+            if not os.path.exists(newPath):
+                out = open(newPath, "w")
+                for line in source:
+                    out.write(line)
+                out.close()
+
+    return True
+
+
+def collectionMergeMedia(col,
+                         other,
+                         workers=None):
+    # Internal media of 'other' is placed in the target media directory so
+    # that relative paths keep resolving after the merge.
+    known = set(row["md5"] for row in col.db.select(fields=["md5"],
+                                                    lazy=True))
+    otherMediaPath = os.path.join(other.colPath, "media")
+    newMediaPath = os.path.join(col.colPath, "media")
+    if not os.path.exists(newMediaPath):
+        os.mkdir(newMediaPath)
+
+    def jobs():
+        for row in other.db.select(fields=["path", "md5"], lazy=True):
+            path = row["path"]
+            if os.path.dirname(path) == "" and row["md5"] not in known:
+                yield (path,
+                       os.path.join(otherMediaPath, path),
+                       os.path.join(newMediaPath, path),
+                       row["md5"])
+
+    report = {}
+    for result in collectionTransferMedia(jobs(),
+                                          workers=workers or 8,
+                                          report=report):
+        pass
+
+    return report
+
+
+def collectionMerge(col,
+                    other,
+                    parseSeq=None,
+                    otherParseSeq=None,
+                    operation="append",
+                    chunkSize=1000,
+                    workers=None):
+    if other is col or (not col.virtual and other.colPath == col.colPath):
+        raise ValueError("Can not merge a collection with itself")
+
+    collectionConsolidateParsers(col, other)
+    confs = []
+    for seq in [parseSeq, otherParseSeq]:
+        conf = None
+        if seq is not None and len(seq) > 0:
+            for i in range(len(seq)):
+                seq[i] = collectionPersistParser(col, seq[i])
+            conf = {"parseSeq": seq,
+                    "operation": operation,
+                    "chunkSize": chunkSize,
+                    "workers": workers}
+        confs.append(conf)
+
+    mediaDir = None
+    if not other.virtual:
+        if col.virtual:
+            mediaDir = os.path.join(other.colPath, "media")
+        else:
+            collectionMergeMedia(col, other, workers)
+
+    report = col.db.merge(other.db, confs[0], confs[1], mediaDir)
+    col.info["modification"] = time.strftime("%d-%m-%Y %H:%M:%S",
+                                             time.gmtime())
+    if not col.virtual:
+        collectionSaveInfo(col)
+
+    return report
 
 
 def collectionDropMedia(col,
@@ -228,12 +437,24 @@ def collectionQuery(col,
                     id=None,
                     query=None,
                     iterate=True):
-    matches = col.db.find(id, query)
+    matches = col.db.find(id, query, lazy=iterate)
     internal_data_dir = os.path.join(col.colPath, "media")
     if iterate:
-        return audioIterator(matches, internal_data_dir)
+        return audioIterator(matches, internal_data_dir, col.specCache)
     else:
-        return audioArray(matches, internal_data_dir)
+        return audioArray(matches, internal_data_dir, col.specCache)
+
+
+def collectionQueryPage(col,
+                        query=None,
+                        limit=100,
+                        orderBy=None,
+                        token=None):
+    matches, nextToken = col.db.findPage(query, "parsed", limit, orderBy, token)
+    internal_data_dir = os.path.join(col.colPath, "media")
+
+    return {"items": audioArray(matches, internal_data_dir, col.specCache),
+            "next": nextToken}
 
 
 def collectionGetAnnotations(col,
@@ -242,7 +463,7 @@ def collectionGetAnnotations(col,
                              iterate=True):
     if noteid is not None:
         query = {"id": noteid}
-    matches = col.db.find(query=query, table="annotations")
+    matches = col.db.find(query=query, table="annotations", lazy=iterate)
 
     if iterate:
         return annotationIterator(matches)
@@ -250,11 +471,22 @@ def collectionGetAnnotations(col,
         return matches
 
 
+def collectionGetAnnotationsPage(col,
+                                 query=None,
+                                 limit=100,
+                                 orderBy=None,
+                                 token=None):
+    matches, nextToken = col.db.findPage(query, "annotations", limit, orderBy,
+                                         token)
+
+    return {"items": matches, "next": nextToken}
+
+
 def collectionGetMetadata(col,
                           id=None,
                           query=None,
                           iterate=True):
-    matches = col.db.find(id, query)
+    matches = col.db.find(id, query, lazy=iterate)
     internal_data_dir = os.path.join(col.colPath, "media")
     if iterate:
         return metadataIterator(matches, internal_data_dir)
@@ -262,17 +494,31 @@ def collectionGetMetadata(col,
         return metadataArray(matches, internal_data_dir)
 
 
+def collectionGetMetadataPage(col,
+                              query=None,
+                              limit=100,
+                              orderBy=None,
+                              token=None):
+    matches, nextToken = col.db.findPage(query, "parsed", limit, orderBy, token)
+    internal_data_dir = os.path.join(col.colPath, "media")
+
+    return {"items": metadataArray(matches, internal_data_dir),
+            "next": nextToken}
+
+
 def collectionGetSignals(col,
                          id=None,
                          query=None,
                          readSr=None,
                          iterate=True):
-    matches = col.db.find(id, query)
+    matches = col.db.find(id, query, lazy=iterate)
     internal_data_dir = os.path.join(col.colPath, "media")
     if iterate:
-        return signalIterator(matches, internal_data_dir, readSr)
+        return signalIterator(matches, internal_data_dir, readSr,
+                              col.specCache)
     else:
-        return signalArray(matches, internal_data_dir, readSr)
+        return signalArray(matches, internal_data_dir, readSr,
+                           col.specCache)
 
 
 def collectionGetSpecs(col,
@@ -282,20 +528,22 @@ def collectionGetSpecs(col,
                        n_fft=1024,
                        hop_length=512,
                        iterate=True):
-    matches = col.db.find(id, query)
+    matches = col.db.find(id, query, lazy=iterate)
     internal_data_dir = os.path.join(col.colPath, "media")
     if iterate:
         return specIterator(matches,
                             internal_data_dir,
                             readSr,
                             n_fft,
-                            hop_length)
+                            hop_length,
+                            col.specCache)
     else:
         return specArray(matches,
                          internal_data_dir,
                          readSr,
                          n_fft,
-                         hop_length)
+                         hop_length,
+                         col.specCache)
 
 
 def collectionBuildResampledMedia(col,
@@ -306,7 +554,10 @@ def collectionBuildResampledMedia(col,
                                   thresh=1,
                                   orid=None,
                                   query=None,
-                                  iterate=False):
+                                  iterate=False,
+                                  nworkers=None,
+                                  maxInFlight=None,
+                                  resume=True):
     rsdir = "sr_" + str(out_sr)
     if col.virtual and dirPath is None:
         raise ValueError("'dirPath' is mandatory for virtual collections.")
@@ -318,27 +569,104 @@ def collectionBuildResampledMedia(col,
     if not os.path.exists(out_dir):
         os.makedirs(out_dir)
 
-    media = col.getMedia(orid=orid, query=query, iterate=iterate)
+    if nworkers is None:
+        nworkers = os.cpu_count() or 1
+
+    done = set()
+    if resume:
+        done = lDbResampledDone(col.db, out_sr, chop, thresh, media_format,
+                                out_dir)
+    report = {"done": 0, "skipped": 0, "failed": 0}
+
+    def jobs():
+        for row in col.getMetadata(orid, query, iterate=False):
+            if row["md5"] in done:
+                report["skipped"] += 1
+                continue
+            yield (row["media_info"],
+                   os.path.join(out_dir, row["md5"]),
+                   chop,
+                   thresh,
+                   media_format,
+                   out_sr,
+                   row["md5"],
+                   row["orid"])
+
+    def results():
+        if nworkers == 1:
+            for args in jobs():
+                yield resampledJob(*args)
+        else:
+            inFlight = maxInFlight
+            if inFlight is None:
+                inFlight = 2 * nworkers
+            with ProcessPoolExecutor(max_workers=nworkers) as executor:
+                for result in boundedMap(executor,
+                                         resampledJob,
+                                         jobs(),
+                                         inFlight):
+                    yield result
+
+    def f():
+        for md5, rowOrid, chunks, error in results():
+            if error is not None:
+                print("Error resampling media :", md5, error)
+                report["failed"] += 1
+                continue
+            lDbRecordResampled(col.db, md5, rowOrid, out_sr, chop, thresh,
+                               media_format, out_dir, chunks)
+            report["done"] += 1
+            yield chunks
+
+        print("Resampled media: " + str(report))
 
     if iterate:
-        def f():
-            for au in media:
-                yield au.writeChunks(basePath=os.path.join(out_dir, au.md5),
-                                     chop=chop,
-                                     thresh=thresh,
-                                     media_format=media_format,
-                                     sr=out_sr)
         return f()
-    return [au.writeChunks(basePath=os.path.join(out_dir, au.md5),
-                           chop=chop,
-                           thresh=thresh,
-                           media_format=media_format,
-                           sr=out_sr) for au in media]
+    return [result for result in f()]
+
+
+def collectionGetResampledChunks(col,
+                                 out_sr=None,
+                                 chop=None,
+                                 orid=None,
+                                 md5=None,
+                                 iterate=True,
+                                 out_dir=None):
+    return lDbResampledChunks(col.db, out_sr, chop, orid, md5, lazy=iterate,
+                              out_dir=out_dir)
+
+
+def collectionTransferMedia(jobs,
+                            linkMode="auto",
+                            workers=8,
+                            maxInFlight=None,
+                            report=None):
+    if report is None:
+        report = {}
+    for key in ["hardlink", "reflink", "copy", "skipped", "failed"]:
+        report.setdefault(key, 0)
+    if maxInFlight is None:
+        maxInFlight = 4 * workers
+
+    args = ((key, src, dst, md5, linkMode) for key, src, dst, md5 in jobs)
+    with ThreadPoolExecutor(workers) as executor:
+        for result in boundedMap(executor,
+                                 mediaTransferJob,
+                                 args,
+                                 maxInFlight):
+            key, src, dst, method, error = result
+            if error is not None:
+                print("Media not transferred (" + src + "). Error: " + error)
+                report["failed"] += 1
+            else:
+                report[method] += 1
+            yield result
 
 
 def collectionDump(col,
                    dirPath,
-                   overwrite=False):
+                   overwrite=False,
+                   linkMode=None):
     if col.virtual:
         return collectionVirtualDump(col,
                                      dirPath,
@@ -354,52 +682,40 @@ def collectionDump(col,
     if os.path.exists(newColPath):
         if overwrite:
             shutil.rmtree(newColPath)
-            try:
-                shutil.copytree(oldColPath,
-                                newColPath)
-            except OSError as e:
-                if e.errno == errno.ENOTDIR:
-                    shutil.copy(oldColPath,
-                                newColPath)
-                else:
-                    print('Collection not dumped. Error: %s' % e)
         else:
             raise ValueError(
                 "Collection directory exists. Please set overwrite=True.")
 
-    return newColPath
-
+    oldMediaPath = os.path.join(oldColPath, "media") + os.sep
 
-def collectionDoggyBag(col,
-                       dirPath="",
-                       outName=None,
-                       overwrite=True):
-    if outName is None:
-        outName = "doggy_bag_" + col.name
-    doggy_path = os.path.join(dirPath,
-                              outName)
+    def copyFunction(src, dst):
+        if linkMode is not None and src.startswith(oldMediaPath):
+            linkOrCopy(src, dst, linkMode)
+        else:
+            shutil.copy2(src, dst)
+        return dst
+
+    lDbCheckpoint(col.db)
+    try:
+        shutil.copytree(oldColPath,
+                        newColPath,
+                        copy_function=copyFunction)
+    except OSError as e:
+        if e.errno == errno.ENOTDIR:
+            shutil.copy(oldColPath,
+                        newColPath)
+        else:
+            print('Collection not dumped. Error: %s' % e)
 
-    if os.path.exists(doggy_path):
-        if not overwrite:
-            raise ValueError("Output path exists but overwrite is False")
-    else:
-        os.makedirs(doggy_path)
+    return newColPath
 
-    doggy_media_dir = os.path.join(doggy_path,
-                                   "media")
-    if not os.path.exists(doggy_media_dir):
-        os.makedirs(doggy_media_dir)
 
-    matches = col.db.select()
+def collectionDoggyBagRows(col):
+    matches = col.db.select(fields=["path", "md5", "metadata"])
     fieldnames = list(set(["path", "md5"] + ["fname"] +
                           [key for key in matches[0]["metadata"].keys()]))
-    with open(os.path.join(doggy_path, 'metadata.csv'), mode='w') as f:
-        writer = csv.DictWriter(f,
-                                delimiter='|',
-                                quotechar='"',
-                                fieldnames=fieldnames,
-                                quoting=csv.QUOTE_MINIMAL)
-        writer.writeheader()
+
+    def f():
         for row in matches:
             oriPath = row["path"]
 
@@ -421,13 +737,116 @@ def collectionDoggyBag(col,
                 if isinstance(metadata[key], dict):
                     metadata[key] = json.dumps(metadata[key])
 
-            writer.writerow(metadata)
-            shutil.copyfile(oriPath, os.path.join(doggy_media_dir, fname))
+            yield metadata, oriPath, fname, md5
+
+    return fieldnames, f()
+
+
+def collectionDoggyBagWriter(f,
+                             fieldnames):
+    writer = csv.DictWriter(f,
+                            delimiter='|',
+                            quotechar='"',
+                            fieldnames=fieldnames,
+                            quoting=csv.QUOTE_MINIMAL)
+    writer.writeheader()
+    return writer
+
+
+def collectionDoggyBagArchive(col,
+                              doggy_path,
+                              outName,
+                              archive,
+                              overwrite):
+    formats = {"tar": "w|", "tar.gz": "w|gz", "zip": None}
+    if archive not in formats:
+        raise ValueError("Unknown archive format. Options: " +
+                         str(list(formats.keys())))
+
+    outPath = doggy_path + "." + archive
+    if os.path.exists(outPath) and not overwrite:
+        raise ValueError("Output path exists but overwrite is False")
+
+    fieldnames, rows = collectionDoggyBagRows(col)
+    if archive == "zip":
+        bag = zipfile.ZipFile(outPath, "w", zipfile.ZIP_STORED)
+        add = bag.write
+    else:
+        bag = tarfile.open(outPath, formats[archive])
+        add = bag.add
+
+    with bag:
+        with tempfile.TemporaryDirectory() as tmpDir:
+            metaPath = os.path.join(tmpDir, "metadata.csv")
+            with open(metaPath, mode='w') as f:
+                writer = collectionDoggyBagWriter(f, fieldnames)
+                for metadata, oriPath, fname, md5 in rows:
+                    writer.writerow(metadata)
+                    add(oriPath, os.path.join(outName, "media", fname))
+            add(metaPath, os.path.join(outName, "metadata.csv"))
+
+    return outPath
+
+
+def collectionDoggyBag(col,
+                       dirPath="",
+                       outName=None,
+                       overwrite=True,
+                       archive=None,
+                       linkMode="auto",
+                       workers=8):
+    if outName is None:
+        outName = "doggy_bag_" + col.name
+    doggy_path = os.path.join(dirPath,
+                              outName)
+
+    if archive is not None:
+        return collectionDoggyBagArchive(col,
+                                         doggy_path,
+                                         outName,
+                                         archive,
+                                         overwrite)
+
+    if os.path.exists(doggy_path):
+        if not overwrite:
+            raise ValueError("Output path exists but overwrite is False")
+    else:
+        os.makedirs(doggy_path)
+
+    doggy_media_dir = os.path.join(doggy_path,
+                                   "media")
+    if not os.path.exists(doggy_media_dir):
+        os.makedirs(doggy_media_dir)
+
+    fieldnames, rows = collectionDoggyBagRows(col)
+    with open(os.path.join(doggy_path, 'metadata.csv'), mode='w') as f:
+        writer = collectionDoggyBagWriter(f, fieldnames)
+
+        def jobs():
+            for metadata, oriPath, fname, md5 in rows:
+                writer.writerow(metadata)
+                yield (fname,
+                       oriPath,
+                       os.path.join(doggy_media_dir, fname),
+                       md5)
+
+        report = {}
+        for result in collectionTransferMedia(jobs(),
+                                              linkMode,
+                                              workers,
+                                              report=report):
+            pass
+
+    print("Doggy bag media: " + str(report))
+
+    return doggy_path
 
 
 def collectionMaterialize(col,
                           dirPath=None,
-                          overwrite=False):
+                          overwrite=False,
+                          linkMode="auto",
+                          workers=8):
     if col.virtual:
         if dirPath is None:
             raise ValueError(
@@ -435,14 +854,17 @@ def collectionMaterialize(col,
                 materialization.")
         return collectionVirtualMaterialize(col,
                                             dirPath,
-                                            overwrite)
+                                            overwrite,
+                                            linkMode,
+                                            workers)
 
     col.db.close()
 
     if dirPath is not None:
         newColPath = collectionDump(col,
                                     dirPath,
-                                    overwrite)
+                                    overwrite,
+                                    linkMode)
     else:
         newColPath = col.colPath
 
@@ -454,31 +876,28 @@ def collectionMaterialize(col,
     newDb = embeddedDb(col.name,
                        os.path.join(newColPath, "db"),
                        False)
-    matches = newDb.select()
-
-    for row in matches:
-        md5 = row["md5"]
-        orid = row["orid"]
-        oldPath = row["path"]
-
-        if os.path.dirname(oldPath) == "":
-            oldPath = os.path.join(col.colPath,
-                                   "media",
-                                   oldPath)
-
-        newName = md5 + ".wav"
-        newPath = os.path.join(newMediaPath, newName)
-
-        if newPath != oldPath:
-            shutil.copyfile(oldPath, newPath)
-            lDbUpdateField(newDb, "original_path", oldPath, orid)
-            lDbUpdateField(newDb, "path", newName, orid)
-            newMediaInfo = dict(row["media_info"])
-            newMediaInfo["path"] = newName
-            lDbUpdateField(newDb,
-                           "media_info",
-                           json.dumps(newMediaInfo),
-                           orid)
+
+    def jobs():
+        for row in newDb.select(fields=["orid", "path", "md5",
+                                        "media_info"]):
+            md5 = row["md5"]
+            oldPath = row["path"]
+
+            if os.path.dirname(oldPath) == "":
+                oldPath = os.path.join(col.colPath,
+                                       "media",
+                                       oldPath)
+
+            newName = md5 + ".wav"
+            newPath = os.path.join(newMediaPath, newName)
+
+            if newPath != oldPath:
+                yield ((row["orid"], newName, dict(row["media_info"])),
+                       oldPath,
+                       newPath,
+                       md5)
+
+    collectionMaterializeMedia(newDb, jobs(), linkMode, workers)
 
     newDb.close()
     col.db.connect()
@@ -486,6 +905,27 @@ def collectionMaterialize(col,
     return newColPath
 
 
+def collectionMaterializeMedia(db,
+                               jobs,
+                               linkMode="auto",
+                               workers=8):
+    updates = []
+    report = {}
+    for key, src, dst, method, error in collectionTransferMedia(jobs,
+                                                                 linkMode,
+                                                                 workers,
+                                                                 report=report):
+        if error is None:
+            orid, newPath, newMediaInfo = key
+            newMediaInfo["path"] = newPath
+            updates.append((orid, src, newPath, newMediaInfo))
+
+    lDbUpdatePaths(db, updates)
+    print("Materialized media: " + str(report))
+
+    return report
+
+
 def collectionParsersToDisk(col,
                             parserDir):
     parsers = col.db.parsers
@@ -508,11 +948,12 @@ def collectionPersistVirtualStructure(col,
         strtime = time.strftime("%d-%m-%Y %H:%M:%S", time.gmtime())
         collectionParsersToDisk(col,
                                 os.path.join(newColPath, "parsers"))
-        sqlPath = col.db.dump(os.path.join(
-            newColPath, "sql", col.name + "_" + strtime + ".sql"),
+        connPath = col.db.backup(os.path.join(
+            newColPath, "db", col.name + ".sqlite"),
             overwrite=overwrite)
-        dinfo["connPath"] = os.path.abspath(sqlPath)
+        dinfo["connPath"] = os.path.abspath(connPath)
         dinfo["dirPath"] = dirPath
+        dinfo["modification"] = strtime
         return dumpJsonFile(os.path.join(newColPath, "info.json"), dinfo)
 
 
@@ -535,46 +976,47 @@ def collectionVirtualDump(col,
 
 def collectionVirtualMaterialize(col,
                                  dirPath,
-                                 overwrite=False):
+                                 overwrite=False,
+                                 linkMode="auto",
+                                 workers=8):
     newColPath = os.path.join(dirPath, col.name)
+    if os.path.exists(newColPath) and not overwrite:
+        raise ValueError(
+            "Collection directory exists. Please set overwrite=True.")
     if buildColDirStruct(newColPath):
         newMediaPath = os.path.join(newColPath, "media")
 
         if not os.path.exists(newMediaPath):
             os.mkdir(newMediaPath)
 
-        for row in col.db.select():
-            md5 = row["md5"]
-            orid = row["orid"]
-            oldPath = row["path"]
-            newPath = os.path.join(newMediaPath, md5 + ".wav")
+        def jobs():
+            for row in col.db.select(fields=["orid", "path", "md5",
+                                             "media_info"]):
+                md5 = row["md5"]
+                oldPath = row["path"]
+                newPath = os.path.join(newMediaPath, md5 + ".wav")
 
-            if newPath != oldPath:
-                shutil.copyfile(oldPath, newPath)
-                lDbUpdateField(col.db, "original_path", oldPath, orid)
-                lDbUpdateField(col.db, "path", newPath, orid)
-                newMediaInfo = dict(row["media_info"])
-                newMediaInfo["path"] = newPath
-                lDbUpdateField(col.db, "media_info",
-                               json.dumps(newMediaInfo), orid)
+                if newPath != oldPath:
+                    yield ((row["orid"], newPath, dict(row["media_info"])),
+                           oldPath,
+                           newPath,
+                           md5)
 
-        return collectionVirtualDump(col, dirPath, overwrite)
+        collectionMaterializeMedia(col.db, jobs(), linkMode, workers)
+
+        return collectionPersistVirtualStructure(col, dirPath, overwrite)
 
 
 def collectionToDisk(col,
                      dirPath,
                      overwrite=False):
     if col.virtual:
-        newColPath = os.path.join(dirPath, col.name)
         if collectionVirtualDump(col, dirPath, overwrite):
-            statements = col.db.asStatements()
             col.db.close()
             col.__init__(col.name,
                          dirPath=dirPath,
                          metadata=col.metadata,
-                         virtual=False,
-                         dbDump=statements,
-                         overwrite=overwrite)
+                         virtual=False)
             return True
     else:
         raise ValueError("Collection is not virtual")
@@ -586,6 +1028,22 @@ def collectionGetSize(col,
     return col.db.count(where, query)
 
 
+def collectionIndexField(col,
+                         path,
+                         table="parsed"):
+    return col.db.indexField(path, table)
+
+
+def collectionDropFieldIndex(col,
+                             path,
+                             table="parsed"):
+    return col.db.dropFieldIndex(path, table)
+
+
+def collectionGetIndexedFields(col):
+    return col.db.getIndexedFields()
+
+
 def collectionBuildTime(col):
     for row in addTimeFields(col.db.find(),
                              col.timeField,
@@ -615,12 +1073,410 @@ def collectionGetAnnotatedMedia(col,
         query = {"id": noteid}
 
     internal_data_dir = os.path.join(col.colPath, "media")
-    matches = [x["results"] for x in lDbCrossSelectAnn(col.db,
+    matches = (x["results"] for x in lDbCrossSelectAnn(col.db,
                                                        query,
                                                        media_fields,
-                                                       subgroup)]
+                                                       subgroup,
+                                                       lazy=iterate))
+    if not iterate:
+        matches = list(matches)
+
+    if iterate:
+        return annAudioIterator(matches, internal_data_dir, col.specCache)
+    return annAudioArray(matches, internal_data_dir, col.specCache)
+
+
+def collectionGetAnnotatedMediaPage(col,
+                                    query=None,
+                                    media_fields=None,
+                                    subgroup=None,
+                                    limit=100,
+                                    token=None):
+    rows, nextToken = lDbCrossSelectAnnPage(col.db,
+                                            query,
+                                            media_fields,
+                                            subgroup,
+                                            limit,
+                                            token)
+    internal_data_dir = os.path.join(col.colPath, "media")
+
+    return {"items": annAudioArray([x["results"] for x in rows],
+                                   internal_data_dir,
+                                   col.specCache),
+            "next": nextToken}
+
+
+def collectionShardName(col,
+                        dataObj):
+    shardKey = col.info["shardKey"]
+    if shardKey == "datastore":
+        value = dataObj["datastore"]["hash"]
+    elif shardKey == "month":
+        value = datetime.datetime.strptime(
+            dataObj["metadata"][col.info["timeField"]],
+            col.info["timeFormat"]).strftime("%Y%m")
+    else:
+        value = dataObj["metadata"]
+        for field in shardKey.split("."):
+            value = value[field]
+
+    name = stripName(str(value))
+    if name == "":
+        raise ValueError("Empty shard name for value " + str(value))
+
+    return name
+
+
+def collectionOpenShard(col,
+                        shardName):
+    if shardName not in col.shards:
+        shard = col.shardClass(shardName,
+                               dirPath=os.path.join(col.colPath, "shards"))
+        shard.db.parsersDir = os.path.join(col.colPath, "parsers")
+        shard.db.share()
+        col.shards[shardName] = shard
+        if shardName not in col.info["shards"]:
+            col.info["shards"].append(shardName)
+            collectionSaveInfo(col)
+
+    return col.shards[shardName]
+
+
+def collectionShardedInit(col,
+                          overwrite=False):
+    if collectionExists(col):
+        if overwrite:
+            print("Overwriting previous collection...")
+            shutil.rmtree(col.colPath)
+        else:
+            print("Loading previous collection...")
+            collectionLoadInfo(col)
+            for shardName in col.info["shards"]:
+                collectionOpenShard(col, shardName)
+            return True
+
+    buildColDirStruct(col.colPath)
+    shardsPath = os.path.join(col.colPath, "shards")
+    if not os.path.exists(shardsPath):
+        os.mkdir(shardsPath)
+    strtime = time.strftime("%d-%m-%Y %H:%M:%S", time.gmtime())
+    col.info["creation"] = strtime
+    col.info["dirPath"] = os.path.abspath(col.info["dirPath"])
+
+    return collectionSaveInfo(col)
+
+
+def collectionShardMap(col,
+                       func,
+                       shards=None,
+                       workers=None):
+    if shards is None:
+        shards = col.info["shards"]
+    shards = [shardName for shardName in shards if shardName in col.shards]
+    if len(shards) == 0:
+        return []
+
+    if workers is None:
+        workers = col.workers
+    workers = max(1, min(workers, len(shards)))
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(func, col.shards[shardName])
+                   for shardName in shards]
+        return [(shardName, future.result())
+                for shardName, future in zip(shards, futures)]
+
+
+def collectionShardStream(col,
+                          func,
+                          shards=None,
+                          workers=None,
+                          maxSize=1000,
+                          timeout=0.1):
+    # Rows of every shard as they are produced; at most 'workers' shards are
+    # read at a time and at most 'maxSize' rows wait in memory.
+    if shards is None:
+        shards = col.info["shards"]
+    shards = [shardName for shardName in shards if shardName in col.shards]
+    if workers is None:
+        workers = col.workers
+    workers = max(1, min(workers, max(1, len(shards))))
+    items = queue.Queue(maxsize=maxSize)
+    stop = threading.Event()
+    done = object()
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                items.put(item, timeout=timeout)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce(shardName):
+        try:
+            for row in func(col.shards[shardName]):
+                if not put((shardName, row, None)):
+                    return
+            put((shardName, done, None))
+        except BaseException as e:
+            put((shardName, done, e))
+
+    def f():
+        if len(shards) == 0:
+            return
+        executor = ThreadPoolExecutor(max_workers=workers)
+        try:
+            for shardName in shards:
+                executor.submit(produce, shardName)
+            pending = len(shards)
+            while pending > 0:
+                shardName, row, error = items.get()
+                if row is done:
+                    if error is not None:
+                        raise error
+                    pending -= 1
+                    continue
+                yield shardName, row
+        finally:
+            stop.set()
+            executor.shutdown(wait=True)
+
+    return f()
+
+
+def collectionShardedInsert(col,
+                            input,
+                            parseSeq,
+                            workers=None,
+                            batchSize=1000,
+                            processes=False,
+                            incremental=True,
+                            prefetch=None):
+    if parseSeq is None:
+        parseSeq = []
+    for i in range(len(parseSeq)):
+        parseSeq[i] = collectionPersistParser(col, parseSeq[i])
+
+    if isinstance(input, simpleDatastore):
+        ds = input
+    else:
+        ds = directDatastore(input)
+
+    report = {"new": 0, "changed": 0, "skipped": 0, "errors": 0}
+    buffers = {}
+    pending = {}
+
+    def collect(shardName):
+        if shardName in pending:
+            result = pending.pop(shardName).result()
+            for key in report:
+                report[key] += result[key]
+
+    def submit(executor, shardName):
+        collect(shardName)
+        shard = collectionOpenShard(col, shardName)
+        pending[shardName] = executor.submit(shard.db.insert,
+                                             buffers.pop(shardName),
+                                             parseSeq,
+                                             None,
+                                             workers,
+                                             batchSize,
+                                             processes,
+                                             incremental)
+
+    data = ds.getData()
+    if prefetch is not None:
+        data = prefetchIterator(data, prefetch)
+
+    with ThreadPoolExecutor(max_workers=col.workers) as executor:
+        for dataObj in data:
+            try:
+                shardName = collectionShardName(col, dataObj)
+            except Exception:
+                print("Error routing metadata :", dataObj)
+                report["errors"] += 1
+                continue
+
+            if shardName not in buffers:
+                buffers[shardName] = []
+            buffers[shardName].append(dataObj)
+            if len(buffers[shardName]) >= batchSize:
+                submit(executor, shardName)
+
+        for shardName in list(buffers.keys()):
+            submit(executor, shardName)
+        for shardName in list(pending.keys()):
+            collect(shardName)
+
+    print("Inserted files (all shards): " + str(report))
+
+    return report
+
+
+def collectionShardedMatches(col,
+                             id=None,
+                             query=None,
+                             table="parsed",
+                             iterate=True,
+                             shards=None):
+    def find(shard):
+        return shard.db.find(id, query, table=table, lazy=iterate)
+
+    def tag(shardName, row):
+        row["shard"] = shardName
+        if table == "parsed":
+            path = row["media_info"]["path"]
+            if os.path.dirname(path) == "":
+                row["media_info"]["path"] = os.path.join(
+                    col.shards[shardName].colPath, "media", path)
+        return row
+
+    if iterate:
+        return (tag(shardName, row) for shardName, row in
+                collectionShardStream(col, find, shards))
+
+    return [tag(shardName, row)
+            for shardName, rows in collectionShardMap(col, find, shards)
+            for row in rows]
+
+
+def collectionShardedQuery(col,
+                           id=None,
+                           query=None,
+                           iterate=True,
+                           shards=None):
+    matches = collectionShardedMatches(col, id, query, "parsed", iterate,
+                                       shards)
+    internal_data_dir = os.path.join(col.colPath, "media")
+    if iterate:
+        return audioIterator(matches, internal_data_dir, col.specCache)
+    else:
+        return audioArray(matches, internal_data_dir, col.specCache)
+
+
+def collectionShardedGetMetadata(col,
+                                 id=None,
+                                 query=None,
+                                 iterate=True,
+                                 shards=None):
+    matches = collectionShardedMatches(col, id, query, "parsed", iterate,
+                                       shards)
     internal_data_dir = os.path.join(col.colPath, "media")
+    if iterate:
+        return metadataIterator(matches, internal_data_dir)
+    else:
+        return metadataArray(matches, internal_data_dir)
 
+
+def collectionShardedGetAnnotations(col,
+                                    noteid=None,
+                                    query=None,
+                                    iterate=True,
+                                    shards=None):
+    if noteid is not None:
+        query = {"id": noteid}
+    matches = collectionShardedMatches(col, None, query, "annotations",
+                                       iterate, shards)
     if iterate:
-        return annAudioIterator(matches, internal_data_dir)
-    return annAudioArray(matches, internal_data_dir)
+        return annotationIterator(matches)
+    else:
+        return matches
+
+
+def collectionShardedAnnotate(col,
+                              dataArr):
+    groups = {}
+    for dataObj in dataArr:
+        if "shard" not in dataObj:
+            raise ValueError("Annotations of sharded collections need a 'shard' field")
+        if dataObj["shard"] not in col.shards:
+            raise ValueError("Unknown shard " + str(dataObj["shard"]))
+        if dataObj["shard"] not in groups:
+            groups[dataObj["shard"]] = []
+        groups[dataObj["shard"]].append(dataObj)
+
+    def annotate(shard):
+        return shard.db.annotate(groups[shard.name])
+
+    collectionShardMap(col, annotate, list(groups.keys()))
+
+    return True
+
+
+def collectionShardedGetSize(col,
+                             where=None,
+                             query=None,
+                             shards=None):
+    def count(shard):
+        return shard.db.count(where, query)["count"]
+
+    return {"count": sum([result for shardName, result
+                          in collectionShardMap(col, count, shards)])}
+
+
+def collectionShardedDropMedia(col,
+                               id=None,
+                               where=None,
+                               query=None,
+                               shards=None):
+    def drop(shard):
+        return collectionDropMedia(shard, id=id, where=where, query=query)
+
+    removed = []
+    for shardName, rows in collectionShardMap(col, drop, shards):
+        for row in rows:
+            row["shard"] = shardName
+            removed.append(row)
+
+    return removed
+
+
+def collectionShardedTransform(col,
+                               parseSeq,
+                               id=None,
+                               where=None,
+                               query=None,
+                               operation="append",
+                               chunkSize=1000,
+                               shards=None):
+    for i in range(len(parseSeq)):
+        parseSeq[i] = collectionPersistParser(col, parseSeq[i])
+
+    def transform(shard):
+        return shard.db.transform(parseSeq, id, where, query, operation,
+                                  chunkSize)
+
+    return dict(collectionShardMap(col, transform, shards))
+
+
+def collectionShardedDump(col,
+                          dirPath,
+                          overwrite=False):
+    newColPath = os.path.join(dirPath, col.name)
+    if os.path.abspath(newColPath) == col.colPath:
+        return newColPath
+    if os.path.exists(newColPath):
+        if not overwrite:
+            raise ValueError(
+                "Collection directory exists. Please set overwrite=True.")
+        shutil.rmtree(newColPath)
+
+    os.makedirs(newColPath)
+    buildColDirStruct(newColPath)
+    newShardsPath = os.path.join(newColPath, "shards")
+    os.mkdir(newShardsPath)
+    for fname in os.listdir(os.path.join(col.colPath, "parsers")):
+        shutil.copy(os.path.join(col.colPath, "parsers", fname),
+                    os.path.join(newColPath, "parsers", fname))
+
+    def dump(shard):
+        return collectionDump(shard, newShardsPath, overwrite)
+
+    collectionShardMap(col, dump)
+    dinfo = col.info.copy()
+    dinfo["dirPath"] = os.path.abspath(dirPath)
+    dumpJsonFile(os.path.join(newColPath, "info.json"), dinfo)
+
+    return newColPath
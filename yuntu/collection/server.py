@@ -27,6 +27,9 @@ class colAction(object):
     def __call__(self, *args):
         orid = request.args.get("orid")
         query = request.args.get("query")
+        limit = request.args.get("limit")
+        orderBy = request.args.get("order_by")
+        token = request.args.get("token")
 
         if orid is not None:
             orid = int(orid)
@@ -35,7 +38,21 @@ class colAction(object):
 
         self.db.connect()
 
-        matches = self.db.find(orid, query)
+        nextToken = None
+        if limit is not None:
+            if orid is not None:
+                query = {"orid": orid}
+            try:
+                matches, nextToken = self.db.findPage(query,
+                                                      limit=int(limit),
+                                                      orderBy=orderBy,
+                                                      token=token)
+            except ValueError:
+                self.db.close()
+                self.response = Response(status=400, headers={})
+                return self.response
+        else:
+            matches = self.db.find(orid, query)
         kwargs = {}
 
         if self.methodName in ["getSpecs", "getSignals"]:
@@ -63,7 +80,9 @@ class colAction(object):
         try:
             result = self.action(**kwargs)
 
-            if self.methodName == "getSignals":
+            if self.methodName == "getMetadata":
+                result = [dict(r) for r in result]
+            elif self.methodName == "getSignals":
                 result = [{"id": r["id"], "md5":r["md5"],
                            "signal":r["signal"].tolist()} for r in result]
             elif self.methodName == "getSpecs":
@@ -72,6 +91,9 @@ class colAction(object):
                            "freqs": r["freqs"].tolist(),
                            "spec":r["spec"].tolist()} for r in result]
 
+            if limit is not None:
+                result = {"items": result, "next": nextToken}
+
             self.response = Response(response=json.dumps(
                 result), status=200, headers={})
             return self.response
@@ -88,8 +110,7 @@ class yuntuServer(object):
                  port=9797):
         self.colInfo = collection.info
         if collection.db.connPath == ":memory:":
-            dump = collection.db.asStatements()
-            self.db = RAMDb(collection.db.name, dump)
+            self.db = RAMDb(collection.db.name, collection.db)
         else:
             self.db = embeddedDb(collection.db.name,
                                  collection.db.dirPath,
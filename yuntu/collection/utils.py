@@ -1,31 +1,37 @@
 import os
 from yuntu.core.audio.base import Audio, AnnotatedAudio
+from yuntu.core.common.utils import linkOrCopy
 
 
 def audioIterator(dataArr,
-                  mediaDir):
+                  mediaDir,
+                  specCache=None):
     for row in dataArr:
         path = row["media_info"]["path"]
         if os.path.dirname(path) == "":
             row["media_info"]["path"] = os.path.join(mediaDir, path)
 
-        yield Audio(row["media_info"], fromConfig=True)
+        yield Audio(row["media_info"], fromConfig=True,
+                    specCache=specCache)
 
 
 def audioArray(dataArr,
-               mediaDir):
+               mediaDir,
+               specCache=None):
     for i in range(len(dataArr)):
         row = dataArr[i]
         path = row["media_info"]["path"]
         if os.path.dirname(path) == "":
             dataArr[i]["media_info"]["path"] = os.path.join(mediaDir, path)
 
-    return [Audio(row["media_info"], fromConfig=True)
+    return [Audio(row["media_info"], fromConfig=True,
+                  specCache=specCache)
             for row in dataArr]
 
 
 def annAudioIterator(dataArr,
-                     mediaDir):
+                     mediaDir,
+                     specCache=None):
     for row in dataArr:
         path = row["media_info"]["path"]
         if os.path.dirname(path) == "":
@@ -34,11 +40,13 @@ def annAudioIterator(dataArr,
         yield AnnotatedAudio(row["media_info"],
                              metadata=row,
                              fromConfig=True,
-                             annotations=row["data"])
+                             annotations=row["data"],
+                             specCache=specCache)
 
 
 def annAudioArray(dataArr,
-                  mediaDir):
+                  mediaDir,
+                  specCache=None):
     for i in range(len(dataArr)):
         row = dataArr[i]
         path = row["media_info"]["path"]
@@ -48,7 +56,8 @@ def annAudioArray(dataArr,
     return [AnnotatedAudio(row["media_info"],
                            metadata=row,
                            fromConfig=True,
-                           annotations=row["data"]) for row in dataArr]
+                           annotations=row["data"],
+                           specCache=specCache) for row in dataArr]
 
 
 def metadataArray(dataArr,
@@ -64,30 +73,31 @@ def metadataArray(dataArr,
 
 def metadataIterator(dataArr,
                      mediaDir):
-    for i in range(len(dataArr)):
-        row = dataArr[i]
+    for row in dataArr:
         path = row["media_info"]["path"]
         if os.path.dirname(path) == "":
-            dataArr[i]["media_info"]["path"] = os.path.join(mediaDir, path)
+            row["media_info"]["path"] = os.path.join(mediaDir, path)
 
-        yield dataArr[i]
+        yield row
 
 
 def annotationIterator(dataArr):
-    for i in range(len(dataArr)):
-        yield dataArr[i]
+    for row in dataArr:
+        yield row
 
 
 def signalArray(dataArr,
                 mediaDir,
-                readSr):
+                readSr,
+                specCache=None):
     results = []
     for i in range(len(dataArr)):
         row = dataArr[i]
         path = row["media_info"]["path"]
         if os.path.dirname(path) == "":
             dataArr[i]["media_info"]["path"] = os.path.join(mediaDir, path)
-        au = Audio(row["media_info"], fromConfig=True)
+        au = Audio(row["media_info"], fromConfig=True,
+                   specCache=specCache)
         if readSr is not None:
             au.setReadSr(readSr)
         signal = au.getSignal()
@@ -101,20 +111,21 @@ def signalArray(dataArr,
 
 def signalIterator(dataArr,
                    mediaDir,
-                   readSr):
-    for i in range(len(dataArr)):
-        row = dataArr[i]
+                   readSr,
+                   specCache=None):
+    for row in dataArr:
         path = row["media_info"]["path"]
         if os.path.dirname(path) == "":
-            dataArr[i]["media_info"]["path"] = os.path.join(mediaDir, path)
-        au = Audio(row["media_info"], fromConfig=True)
+            row["media_info"]["path"] = os.path.join(mediaDir, path)
+        au = Audio(row["media_info"], fromConfig=True,
+                   specCache=specCache)
         if readSr is not None:
             au.setReadSr(readSr)
         signal = au.getSignal()
         au.clearMedia()
 
-        yield {"id": dataArr[i]["orid"],
-               "md5": dataArr[i]["md5"],
+        yield {"id": row["orid"],
+               "md5": row["md5"],
                "signal": signal}
 
 
@@ -122,14 +133,16 @@ def specArray(dataArr,
               mediaDir,
               readSr,
               n_fft,
-              hop_length):
+              hop_length,
+              specCache=None):
     results = []
     for i in range(len(dataArr)):
         row = dataArr[i]
         path = row["media_info"]["path"]
         if os.path.dirname(path) == "":
             dataArr[i]["media_info"]["path"] = os.path.join(mediaDir, path)
-        au = Audio(row["media_info"], fromConfig=True)
+        au = Audio(row["media_info"], fromConfig=True,
+                   specCache=specCache)
         if readSr is not None:
             au.setReadSr(readSr)
         freqs, spec = au.getSpec(n_fft=n_fft, hop_length=hop_length)
@@ -146,24 +159,70 @@ def specIterator(dataArr,
                  mediaDir,
                  readSr,
                  n_fft,
-                 hop_length):
-    for i in range(len(dataArr)):
-        row = dataArr[i]
+                 hop_length,
+                 specCache=None):
+    for row in dataArr:
         path = row["media_info"]["path"]
         if os.path.dirname(path) == "":
-            dataArr[i]["media_info"]["path"] = os.path.join(mediaDir, path)
-        au = Audio(row["media_info"], fromConfig=True)
+            row["media_info"]["path"] = os.path.join(mediaDir, path)
+        au = Audio(row["media_info"], fromConfig=True,
+                   specCache=specCache)
         if readSr is not None:
             au.setReadSr(readSr)
         freqs, spec = au.getSpec(n_fft=n_fft, hop_length=hop_length)
         au.clearMedia()
 
-        yield {"id": dataArr[i]["orid"],
-               "md5": dataArr[i]["md5"],
+        yield {"id": row["orid"],
+               "md5": row["md5"],
                "freqs": freqs,
                "spec": spec}
 
 
+def resampledChunks(media_info,
+                    basePath,
+                    chop,
+                    thresh,
+                    media_format,
+                    out_sr):
+    au = Audio(media_info, fromConfig=True)
+
+    return au.writeChunks(basePath=basePath,
+                          chop=chop,
+                          thresh=thresh,
+                          media_format=media_format,
+                          sr=out_sr)
+
+
+def resampledJob(media_info,
+                 basePath,
+                 chop,
+                 thresh,
+                 media_format,
+                 out_sr,
+                 md5,
+                 orid):
+    try:
+        return md5, orid, resampledChunks(media_info,
+                                          basePath,
+                                          chop,
+                                          thresh,
+                                          media_format,
+                                          out_sr), None
+    except Exception as e:
+        return md5, orid, None, repr(e)
+
+
+def mediaTransferJob(key,
+                     src,
+                     dst,
+                     md5,
+                     linkMode):
+    try:
+        return key, src, dst, linkOrCopy(src, dst, linkMode, md5), None
+    except Exception as e:
+        return key, src, dst, None, repr(e)
+
+
 def buildColDirStruct(colPath,
                       parts=["db", "parsers", "sql"]):
     dbPath = os.path.join(colPath, "db")
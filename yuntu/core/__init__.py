@@ -2,10 +2,12 @@ from . import datastore
 from . import db
 from . import common
 from . import audio
+from . import cache
 
 __all__=[
     'audio',
     'db',
     'common',
-    'datastore'
+    'datastore',
+    'cache'
 ]
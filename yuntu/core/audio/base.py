@@ -25,12 +25,14 @@ class Audio(Media):
                  config,
                  readSr=None,
                  fromConfig=False,
-                 metadata={}):
+                 metadata={},
+                 specCache=None):
         self.readSr = readSr
         self.config = config
         self.timeexp = self.config["timeexp"]
         self.path = self.config["path"]
         self.metadata = metadata
+        self.specCache = specCache
 
         if fromConfig:
             self.loadBasicInfo()
@@ -53,6 +55,10 @@ class Audio(Media):
                   sr):
         return auMethods.audioSetReadSr(self, sr)
 
+    def setSpecCache(self,
+                     specCache):
+        return auMethods.audioSetSpecCache(self, specCache)
+
     def setMetadata(self,
                     metadata):
         return auMethods.audioSetMetadata(self,
@@ -91,12 +97,27 @@ class Audio(Media):
                 channel=0,
                 n_fft=1024,
                 hop_length=512,
-                preProcess=None):
+                preProcess=None,
+                stream=False):
         return auMethods.audioGetSpec(self,
                                       channel,
                                       n_fft,
                                       hop_length,
-                                      preProcess)
+                                      preProcess,
+                                      stream)
+
+    def iterSpec(self,
+                 channel=0,
+                 n_fft=1024,
+                 hop_length=512,
+                 preProcess=None,
+                 blockSize=None):
+        return auMethods.audioIterSpec(self,
+                                       channel,
+                                       n_fft,
+                                       hop_length,
+                                       preProcess,
+                                       blockSize)
 
     def getMfcc(self,
                 channel=0,
@@ -129,13 +150,15 @@ class Audio(Media):
                     chop,
                     thresh,
                     media_format="wav",
-                    sr=None):
+                    sr=None,
+                    singlePass=True):
         return auMethods.audioWriteChunks(self,
                                           basePath,
                                           chop,
                                           thresh,
                                           media_format,
-                                          sr)
+                                          sr,
+                                          singlePass)
 
     def listen(self):
         return auMethods.audioListen(self)
@@ -147,11 +170,13 @@ class AnnotatedAudio(Audio):
                  readSr=None,
                  fromConfig=False,
                  metadata=None,
-                 annotations=None):
+                 annotations=None,
+                 specCache=None):
         super(AnnotatedAudio, self).__init__(config,
                                              readSr,
                                              fromConfig,
-                                             metadata)
+                                             metadata,
+                                             specCache)
         self.annotations = {}
         self.groups = {}
         if annotations is not None:
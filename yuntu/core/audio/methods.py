@@ -1,5 +1,10 @@
+import os
+import sys
+import json
+import inspect
 import numpy as np
 import yuntu.core.audio.utils as auUtils
+from yuntu.core.common.utils import fileContentHash
 
 
 def audioLoadBasicInfo(au):
@@ -60,6 +65,77 @@ def audioSetReadSr(au, sr):
     return True
 
 
+def audioSetSpecCache(au,
+                      specCache):
+    au.specCache = specCache
+
+    return True
+
+
+def audioPreProcessId(preProcess):
+    transform = preProcess
+    kwargs = None
+    if isinstance(preProcess, dict):
+        transform = preProcess["transform"]
+        kwargs = preProcess["kwargs"]
+
+    module = getattr(transform, "__module__", None)
+    qualname = getattr(transform, "__qualname__", None)
+    if module is None or qualname is None or "<" in qualname:
+        return None
+
+    # Transforms loaded from parser files share module names, so their
+    # identity is the file that defines them and its content.
+    try:
+        source = inspect.getsourcefile(transform)
+    except TypeError:
+        source = None
+    if source is not None and os.path.isfile(source):
+        source = os.path.abspath(source)
+        sourceHash = fileContentHash(source)
+    elif module in sys.modules:
+        sourceHash = None
+    else:
+        return None
+
+    try:
+        kwargs = json.loads(json.dumps(kwargs, sort_keys=True))
+    except (TypeError, ValueError):
+        return None
+
+    return {"transform": module + "." + qualname,
+            "source": source,
+            "sourceHash": sourceHash,
+            "kwargs": kwargs}
+
+
+def audioSpecCacheParams(au,
+                         channel,
+                         n_fft,
+                         hop_length,
+                         preProcess):
+    md5 = getattr(au, "md5", None)
+    if au.specCache is None or md5 is None:
+        return None
+
+    preProcessId = None
+    if preProcess is not None:
+        preProcessId = audioPreProcessId(preProcess)
+        if preProcessId is None:
+            return None
+
+    sr = au.originalSr
+    if au.readSr is not None:
+        sr = au.readSr
+
+    return {"sr": sr,
+            "channel": channel,
+            "n_fft": n_fft,
+            "hop_length": hop_length,
+            "preProcess": preProcessId,
+            "mask": au.mask}
+
+
 def audioSetMetadata(au,
                      metadata):
     au.metadata = metadata
@@ -130,25 +206,140 @@ def audioGetZcr(au,
                                     hop_length)
 
 
+def audioGetFrameWindow(au):
+    offset = 0.0
+    duration = None
+
+    if au.mask is not None:
+        offset = au.mask[0]
+        duration = au.mask[1] - au.mask[0]
+
+    return auUtils.frameWindow(au.originalSr, au.length, offset, duration)
+
+
+def audioIterSpec(au,
+                  channel=None,
+                  n_fft=1024,
+                  hop_length=512,
+                  preProcess=None,
+                  blockSize=None):
+    if blockSize is None:
+        blockSize = hop_length * 1024
+
+    params = audioSpecCacheParams(au, channel, n_fft, hop_length, preProcess)
+    if params is not None:
+        spec = au.specCache.get(au.md5, params)
+        if spec is not None:
+            ncols = max(1, blockSize // hop_length)
+            return (spec[:, i:i + ncols]
+                    for i in range(0, spec.shape[1], ncols))
+
+    return audioReadSpecBlocks(au,
+                               channel,
+                               n_fft,
+                               hop_length,
+                               preProcess,
+                               blockSize)
+
+
+def audioReadSpecBlocks(au,
+                        channel=None,
+                        n_fft=1024,
+                        hop_length=512,
+                        preProcess=None,
+                        blockSize=None):
+    if preProcess is not None:
+        raise ValueError("Streaming spectrograms do not support preProcess.")
+    if au.readSr is not None and au.readSr != au.originalSr:
+        raise ValueError("Streaming spectrograms are only computed at the " +
+                         "original samplerate.")
+    if channel is not None and channel > au.nchannels - 1:
+        raise ValueError("Channel outside range.")
+    if blockSize is None:
+        blockSize = hop_length * 1024
+
+    start, stop = audioGetFrameWindow(au)
+
+    def f(blocks):
+        for block in blocks:
+            if channel is None:
+                yield auUtils.channelMean(block)
+            else:
+                yield auUtils.sigChannel(block, channel, au.nchannels)
+
+    return auUtils.streamSpectrogram(f(auUtils.readBlocks(au.path,
+                                                          blockSize,
+                                                          start,
+                                                          stop)),
+                                     n_fft,
+                                     hop_length)
+
+
+def audioStreamSpec(au,
+                    channel=None,
+                    n_fft=1024,
+                    hop_length=512,
+                    preProcess=None,
+                    blockSize=None):
+    start, stop = audioGetFrameWindow(au)
+    tbins = 1 + (stop - start) // hop_length
+    spec = np.empty((1 + n_fft // 2, tbins), dtype=np.float32)
+
+    pos = 0
+    for block in audioReadSpecBlocks(au,
+                               channel,
+                               n_fft,
+                               hop_length,
+                               preProcess,
+                               blockSize):
+        ncols = block.shape[1]
+        if pos + ncols > spec.shape[1]:
+            spec = np.concatenate([spec[:, :pos], block], axis=1)
+        else:
+            spec[:, pos:pos + ncols] = block
+        pos += ncols
+
+    return spec[:, :pos], auUtils.specFrequencies(au.originalSr, n_fft)
+
+
 def audioGetSpec(au,
                  channel=None,
                  n_fft=1024,
                  hop_length=512,
-                 preProcess=None):
-    if channel is None:
-        sig = auUtils.channelMean(au.getSignal(preProcess))
+                 preProcess=None,
+                 stream=False):
+    params = audioSpecCacheParams(au, channel, n_fft, hop_length, preProcess)
+    if params is not None:
+        spec = au.specCache.get(au.md5, params)
+        if spec is not None:
+            return spec, auUtils.specFrequencies(params["sr"], n_fft)
+
+    if stream:
+        spec, freqs = audioStreamSpec(au,
+                                      channel,
+                                      n_fft,
+                                      hop_length,
+                                      preProcess)
     else:
-        if channel > au.nchannels - 1:
-            raise ValueError("Channel outside range.")
+        if channel is None:
+            sig = auUtils.channelMean(au.getSignal(preProcess))
+        else:
+            if channel > au.nchannels - 1:
+                raise ValueError("Channel outside range.")
 
-        sig = au.getSignal(preProcess)
-        sig = auUtils.sigChannel(au.getSignal(
-            preProcess), channel, au.nchannels)
+            sig = au.getSignal(preProcess)
+            sig = auUtils.sigChannel(au.getSignal(
+                preProcess), channel, au.nchannels)
 
-    return auUtils.spectrogram(sig,
-                               n_fft=n_fft,
-                               hop_length=hop_length),\
-        auUtils.specFrequencies(au.sr, n_fft)
+        spec = auUtils.spectrogram(sig,
+                                   n_fft=n_fft,
+                                   hop_length=hop_length)
+        freqs = auUtils.specFrequencies(au.sr, n_fft)
+
+    if params is not None:
+        au.specCache.put(au.md5, params, spec)
+
+    return spec, freqs
 
 
 def audioGetMfcc(au,
@@ -194,53 +385,94 @@ def audioWriteMedia(au,
                          "' is not supported yet.")
 
 
+def audioChunkLimits(au,
+                     chop,
+                     thresh=1):
+    duration = au.duration
+    if chop is None or duration < chop:
+        return None
+
+    fchunks = duration / chop
+    if fchunks <= thresh:
+        return None
+
+    nchunks = int(fchunks)
+    residual = fchunks - nchunks
+
+    if residual >= 0.5:
+        nchunks += 1
+
+    return [(float(chop * x), float(min(chop * (x + 1), duration)))
+            for x in range(nchunks)]
+
+
 def audioWriteChunks(au,
                      basePath,
                      chop,
                      thresh=1,
                      media_format="wav",
-                     sr=None):
+                     sr=None,
+                     singlePass=True):
     duration = au.duration
     if sr is not None:
         audioSetReadSr(au, sr)
 
-    results = []
-    if chop is None:
-        out = {"tlimits": [0, duration], "number": 0}
-        out["path"] = audioWriteMedia(
-            au, basePath + "." + media_format, media_format)
-        results = [out]
-    elif duration < chop:
-        out = {"tlimits": [0, duration], "number": 0}
-        out["path"] = audioWriteMedia(
-            au, basePath + "." + media_format, media_format)
-        results = [out]
+    tlimits = audioChunkLimits(au, chop, thresh)
+    if tlimits is None:
+        tlimits = [[0, duration]]
+        paths = [basePath + "." + media_format]
     else:
-        fchunks = duration / chop
-        if fchunks <= thresh:
-            out = {"tlimits": [0, duration], "number": 0}
-            out["path"] = audioWriteMedia(
-                au, basePath + "." + media_format, media_format)
-            results = [out]
-        else:
-            nchunks = int(fchunks)
-            residual = fchunks - nchunks
-
-            if residual >= 0.5:
-                nchunks += 1
-
-            tlimits = [(float(chop * x), float(min(chop * (x + 1), duration)))
-                       for x in range(nchunks)]
-            for i in range(len(tlimits)):
-                au.setMask(tlimits[i][0], tlimits[i][1])
-                out = {"tlimits": tlimits[i], "number": i}
-                out["path"] = audioWriteMedia(
-                    au, basePath + "_chunk_" + str(i) + "." +
-                    media_format, media_format)
-                results.append(out)
-                au.unsetMask()
-
-    return results
+        paths = [basePath + "_chunk_" + str(i) + "." + media_format
+                 for i in range(len(tlimits))]
+
+    if singlePass and os.path.splitext(au.path)[1].lower() in [".wav",
+                                                                 ".flac"]:
+        audioStreamChunks(au, tlimits, paths, media_format)
+    elif len(paths) == 1:
+        audioWriteMedia(au, paths[0], media_format)
+    else:
+        for i in range(len(tlimits)):
+            au.setMask(tlimits[i][0], tlimits[i][1])
+            audioWriteMedia(au, paths[i], media_format)
+            au.unsetMask()
+
+    return [{"tlimits": tlimits[i], "number": i, "path": paths[i]}
+            for i in range(len(tlimits))]
+
+
+def audioStreamChunks(au,
+                      tlimits,
+                      paths,
+                      media_format="wav",
+                      blockSize=262144):
+    if media_format not in ["wav", "flac", "ogg"]:
+        raise ValueError("Writing to '" + media_format +
+                         "' is not supported yet.")
+
+    out_sr = au.originalSr
+    if au.readSr is not None:
+        out_sr = au.readSr
+
+    # Same frames as a masked read of each chunk (see frameWindow).
+    limits = []
+    for i in range(len(tlimits)):
+        offset = tlimits[i][0] / au.timeexp
+        duration = (tlimits[i][1] - tlimits[i][0]) / au.timeexp
+        start = int(offset * out_sr)
+        stop = start + int(duration * out_sr)
+        if i < len(tlimits) - 1:
+            stop = min(stop, int((tlimits[i + 1][0] / au.timeexp) * out_sr))
+        limits.append((start, stop))
+
+    blocks = auUtils.readBlocks(au.path, blockSize)
+    blocks = auUtils.streamResample(blocks, au.originalSr, out_sr)
+
+    return auUtils.writeStreamChunks(blocks,
+                                     out_sr,
+                                     au.nchannels,
+                                     limits,
+                                     paths,
+                                     media_format)
 
 
 def audioSetAnn(ann_au,
@@ -187,6 +187,12 @@ def read(path,
          sr,
          offset=0.0,
          duration=None):
+    if os.path.splitext(path)[1].lower() in [".wav", ".flac"]:
+        try:
+            return readWindow(path, sr, offset, duration)
+        except RuntimeError:
+            pass
+
     return librosa.load(path,
                         sr=sr,
                         offset=offset,
@@ -194,6 +200,181 @@ def read(path,
                         mono=False)
 
 
+def readWindow(path,
+               sr,
+               offset=0.0,
+               duration=None):
+    with sf.SoundFile(path) as media:
+        nativeSr = media.samplerate
+        start, stop = frameWindow(nativeSr, media.frames, offset, duration)
+        if start:
+            media.seek(start)
+        sig = media.read(frames=stop - start,
+                         dtype='float32',
+                         always_2d=False).T
+
+    if sr is None or sr == nativeSr:
+        return sig, nativeSr
+
+    return librosa.resample(sig, orig_sr=nativeSr, target_sr=sr), sr
+
+
+def frameWindow(sr,
+                length,
+                offset=0.0,
+                duration=None):
+    start = 0
+    if offset:
+        start = min(int(offset * sr), length)
+    stop = length
+    if duration is not None:
+        stop = min(start + int(duration * sr), length)
+
+    return start, stop
+
+
+def readBlocks(path,
+               blockSize,
+               start=0,
+               stop=None):
+    with sf.SoundFile(path) as media:
+        if start:
+            media.seek(start)
+        remaining = -1
+        if stop is not None:
+            remaining = stop - start
+        while remaining != 0:
+            frames = blockSize
+            if remaining > 0:
+                frames = min(blockSize, remaining)
+                remaining -= frames
+            block = media.read(frames=frames,
+                               dtype='float32',
+                               always_2d=False)
+            if len(block) == 0:
+                break
+
+            yield block.T
+
+
+def polyphaseFilter(sr,
+                    outSr):
+    g = math.gcd(int(sr), int(outSr))
+    up = int(outSr) // g
+    down = int(sr) // g
+    maxRate = max(up, down)
+    halfLen = 10 * maxRate
+    h = scipy.signal.firwin(2 * halfLen + 1,
+                            1. / maxRate,
+                            window=('kaiser', 5.0)) * up
+    prePad = down - halfLen % down
+    h = np.concatenate([np.zeros(prePad), h])
+
+    return up, down, h, (halfLen + prePad) // down
+
+
+def streamResample(blocks,
+                   sr,
+                   outSr):
+    """Resample consecutive signal blocks keeping filter state.
+
+    Uses the same polyphase filter as scipy.signal.resample_poly, so the
+    concatenated output equals resampling the whole signal at once.
+    """
+    if outSr is None or outSr == sr:
+        for block in blocks:
+            yield block
+        return
+
+    up, down, h, preRemove = polyphaseFilter(sr, outSr)
+    buf = None
+    start = 0
+    nread = 0
+    nextOut = 0
+
+    for block in blocks:
+        if buf is None:
+            buf = block
+        else:
+            buf = np.concatenate([buf, block], axis=-1)
+        nread += block.shape[-1]
+
+        stop = (nread * up - 1) // down + 1
+        base = start * up // down
+        lo = max(nextOut, preRemove)
+        if stop > lo:
+            out = scipy.signal.upfirdn(h, buf, up, down, axis=-1)
+            yield out[..., lo - base:stop - base].astype(np.float32)
+        nextOut = max(nextOut, stop)
+
+        newStart = max(0, nextOut * down - h.size + 1) // up
+        newStart = (newStart // down) * down
+        if newStart > start:
+            buf = buf[..., newStart - start:]
+            start = newStart
+
+    if buf is None:
+        return
+
+    nout = nread * up // down + int((nread * up) % down > 0)
+    stop = preRemove + nout
+    base = start * up // down
+    lo = max(nextOut, preRemove)
+    if stop > lo:
+        padShape = list(buf.shape)
+        padShape[-1] = h.size // up + down + 1
+        buf = np.concatenate([buf, np.zeros(padShape, dtype=buf.dtype)],
+                             axis=-1)
+        out = scipy.signal.upfirdn(h, buf, up, down, axis=-1)
+        yield out[..., lo - base:stop - base].astype(np.float32)
+
+
+def writeStreamChunks(blocks,
+                      sr,
+                      nchannels,
+                      limits,
+                      paths,
+                      media_format="wav"):
+    pos = 0
+    current = 0
+    media = None
+
+    for block in blocks:
+        blockStart = pos
+        pos += block.shape[-1]
+        while current < len(limits):
+            start, stop = limits[current]
+            if media is None and (start < pos or
+                                  (stop is not None and stop <= pos)):
+                media = sf.SoundFile(paths[current], "w", sr, nchannels,
+                                     format=media_format)
+            lo = max(start, blockStart)
+            hi = pos
+            if stop is not None:
+                hi = min(stop, pos)
+            if hi > lo:
+                piece = block[..., lo - blockStart:hi - blockStart]
+                if nchannels > 1:
+                    piece = np.transpose(piece, (1, 0))
+                media.write(piece)
+            if stop is not None and stop <= pos:
+                media.close()
+                media = None
+                current += 1
+            else:
+                break
+
+    while current < len(limits):
+        if media is None:
+            media = sf.SoundFile(paths[current], "w", sr, nchannels,
+                                 format=media_format)
+        media.close()
+        media = None
+        current += 1
+
+    return paths
+
+
 def write(path,
           sig,
           sr,
@@ -241,10 +422,74 @@ def stft(sig,
 
 def spectrogram(sig,
                 n_fft,
-                hop_length):
+                hop_length,
+                center=True):
     return np.abs(stft(sig,
                        n_fft,
-                       hop_length))
+                       hop_length,
+                       center=center))
+
+
+def streamSpectrogram(blocks,
+                      n_fft,
+                      hop_length):
+    """Yield spectrogram column blocks from consecutive signal blocks.
+
+    Frames are taken from the same reflect-padded signal that a centered
+    'spectrogram' call would use, so concatenating all yielded blocks
+    gives the one-shot result.
+    """
+    pad = int(n_fft // 2)
+    head = []
+    headSize = 0
+    buf = None
+    tail = None
+
+    for block in blocks:
+        if buf is None:
+            head.append(block)
+            headSize += block.size
+            if headSize <= pad:
+                continue
+            block = np.concatenate(head)
+            buf = np.pad(block, (pad, 0), mode='reflect')
+        else:
+            buf = np.concatenate([buf, block])
+
+        if tail is None:
+            tail = block[-(pad + 1):]
+        else:
+            tail = np.concatenate([tail, block])[-(pad + 1):]
+
+        spec, buf = specFrames(buf, n_fft, hop_length)
+        if spec is not None:
+            yield spec
+
+    if buf is None:
+        if headSize == 0:
+            return
+        buf = np.pad(np.concatenate(head), pad, mode='reflect')
+    else:
+        buf = np.concatenate([buf,
+                              np.pad(tail, (0, pad), mode='reflect')[-pad:]])
+
+    spec, buf = specFrames(buf, n_fft, hop_length)
+    if spec is not None:
+        yield spec
+
+
+def specFrames(buf,
+               n_fft,
+               hop_length):
+    if buf.size < n_fft:
+        return None, buf
+    nframes = 1 + (buf.size - n_fft) // hop_length
+    spec = spectrogram(buf[:(nframes - 1) * hop_length + n_fft],
+                       n_fft,
+                       hop_length,
+                       center=False)
+
+    return spec, buf[nframes * hop_length:]
 
 
 def specFrequencies(sr, n_fft):
@@ -0,0 +1,112 @@
+import os
+import threading
+from abc import abstractmethod, ABCMeta
+import yuntu.core.cache.methods as cacheMethods
+
+CACHE_REGISTRY = {}
+CACHE_LOCK = threading.Lock()
+
+
+class metaCache(object):
+    __metaclass__ = ABCMeta
+
+    @abstractmethod
+    def get(self, key, params):
+        pass
+
+    @abstractmethod
+    def put(self, key, params, value):
+        pass
+
+    @abstractmethod
+    def stats(self):
+        pass
+
+    @abstractmethod
+    def clear(self):
+        pass
+
+
+class specCache(metaCache):
+    __metaclass__ = ABCMeta
+
+    def __init__(self,
+                 dirPath,
+                 maxSize=None,
+                 flushEvery=256):
+        """
+        On-disk spectrogram store keyed by media md5 and STFT parameters.
+        Arrays are kept as float32 .npy files that are memory-mapped on read;
+        'maxSize' is a budget in bytes enforced by least recently used
+        eviction. Access times and hit counters are written to the index
+        every 'flushEvery' lookups, on put, stats and close.
+        """
+        self.dirPath = dirPath
+        self.maxSize = maxSize
+        self.flushEvery = flushEvery
+        self.indexPath = cacheMethods.cacheIndexPath(self)
+        self.lock = threading.RLock()
+        self.connection = None
+        self.pid = None
+        self.pending = {}
+        self.counts = {"hits": 0, "misses": 0}
+        cacheMethods.cacheBuild(self)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        for key in ["lock", "connection", "pid", "pending", "counts"]:
+            del state[key]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = threading.RLock()
+        self.connection = None
+        self.pid = None
+        self.pending = {}
+        self.counts = {"hits": 0, "misses": 0}
+
+    def getType(self):
+        return "specCache"
+
+    def getConf(self):
+        return {"dirPath": self.dirPath, "maxSize": self.maxSize}
+
+    def get(self,
+            md5,
+            params):
+        return cacheMethods.cacheGet(self,
+                                     md5,
+                                     params)
+
+    def put(self,
+            md5,
+            params,
+            spec):
+        return cacheMethods.cachePut(self,
+                                     md5,
+                                     params,
+                                     spec)
+
+    def stats(self):
+        return cacheMethods.cacheStats(self)
+
+    def clear(self):
+        return cacheMethods.cacheClear(self)
+
+    def flush(self):
+        with self.lock:
+            return cacheMethods.cacheFlush(self)
+
+    def close(self):
+        return cacheMethods.cacheClose(self)
+
+
+def getSpecCache(dirPath,
+                 maxSize=None):
+    """Cache shared by every caller of this process for 'dirPath'."""
+    key = (os.getpid(), os.path.abspath(dirPath), maxSize)
+    with CACHE_LOCK:
+        if key not in CACHE_REGISTRY:
+            CACHE_REGISTRY[key] = specCache(dirPath, maxSize)
+        return CACHE_REGISTRY[key]
@@ -0,0 +1,256 @@
+import os
+import time
+import json
+import sqlite3
+import threading
+import numpy as np
+from yuntu.core.datastore.utils import hashDict
+
+
+def cacheIndexPath(cache):
+    return os.path.join(cache.dirPath, "index.sqlite")
+
+
+def cacheConnect(cache):
+    return sqlite3.connect(cache.indexPath, timeout=30)
+
+
+def cacheConnection(cache):
+    # One index connection per cache object and process; callers hold
+    # cache.lock.
+    if cache.connection is None or cache.pid != os.getpid():
+        cache.connection = sqlite3.connect(cache.indexPath, timeout=30,
+                                           check_same_thread=False)
+        cache.pid = os.getpid()
+        cache.pending = {}
+        cache.counts = {"hits": 0, "misses": 0}
+
+    return cache.connection
+
+
+def cacheRecordAccess(cache,
+                      key,
+                      hit):
+    if hit:
+        hits = cache.pending.get(key, (None, 0))[1]
+        cache.pending[key] = (time.time(), hits + 1)
+        cache.counts["hits"] += 1
+    else:
+        cache.counts["misses"] += 1
+
+    if cache.counts["hits"] + cache.counts["misses"] >= cache.flushEvery:
+        cacheFlush(cache)
+
+
+def cacheFlush(cache):
+    # Deferred access times and counters go to the index in one transaction.
+    if cache.connection is None or cache.pid != os.getpid():
+        return 0
+
+    flushed = cache.counts["hits"] + cache.counts["misses"]
+    if flushed == 0:
+        return 0
+
+    cnn = cache.connection
+    cursor = cnn.cursor()
+    cursor.executemany("""
+        UPDATE entries SET last_access = max(last_access, ?), hits = hits + ?
+            WHERE key = ?
+        """, [(accessed, hits, key)
+              for key, (accessed, hits) in cache.pending.items()])
+    for name in ["hits", "misses"]:
+        if cache.counts[name] > 0:
+            cacheCount(cursor, name, cache.counts[name])
+    cnn.commit()
+    cache.pending = {}
+    cache.counts = {"hits": 0, "misses": 0}
+
+    return flushed
+
+
+def cacheClose(cache):
+    with cache.lock:
+        cacheFlush(cache)
+        if cache.connection is not None and cache.pid == os.getpid():
+            cache.connection.close()
+        cache.connection = None
+
+    return True
+
+
+def cacheBuild(cache):
+    if not os.path.exists(cache.dirPath):
+        os.makedirs(cache.dirPath)
+
+    cnn = cacheConnect(cache)
+    cursor = cnn.cursor()
+    # Lookups from other processes read while a flush or put writes.
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS entries (
+            key TEXT PRIMARY KEY,
+            md5 TEXT NOT NULL,
+            params JSON NOT NULL,
+            path TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            last_access DOUBLE NOT NULL,
+            hits INTEGER NOT NULL DEFAULT 0
+        )
+        """)
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS entries_last_access
+            ON entries (last_access)
+        """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS counters (
+            name TEXT PRIMARY KEY,
+            value INTEGER NOT NULL
+        )
+        """)
+    cursor.executemany("""
+        INSERT OR IGNORE INTO counters (name,value) VALUES (?,0)
+        """, [("hits",), ("misses",), ("evictions",)])
+    cnn.commit()
+    cnn.close()
+
+    return True
+
+
+def cacheKey(md5,
+             params):
+    return hashDict({"md5": md5, "params": params})
+
+
+def cacheCount(cursor,
+               name,
+               n=1):
+    cursor.execute("UPDATE counters SET value = value + ? WHERE name = ?",
+                   (n, name))
+
+
+def cacheGet(cache,
+             md5,
+             params):
+    key = cacheKey(md5, params)
+    with cache.lock:
+        entry = cacheConnection(cache).execute(
+            "SELECT path FROM entries WHERE key = ?", (key,)).fetchone()
+
+    spec = None
+    if entry is not None:
+        path = os.path.join(cache.dirPath, entry[0])
+        try:
+            spec = np.load(path, mmap_mode="r")
+        except (IOError, ValueError):
+            with cache.lock:
+                cnn = cacheConnection(cache)
+                cnn.execute("DELETE FROM entries WHERE key = ?", (key,))
+                cnn.commit()
+
+    with cache.lock:
+        cacheRecordAccess(cache, key, spec is not None)
+
+    return spec
+
+
+def cachePut(cache,
+             md5,
+             params,
+             spec):
+    spec = np.asarray(spec, dtype=np.float32)
+    if cache.maxSize is not None and spec.nbytes > cache.maxSize:
+        return False
+
+    key = cacheKey(md5, params)
+    fname = key + ".npy"
+    path = os.path.join(cache.dirPath, fname)
+    tmpPath = path + "." + str(os.getpid()) + "_" + \
+        str(threading.get_ident()) + ".tmp"
+    with open(tmpPath, "wb") as f:
+        np.save(f, spec)
+    os.replace(tmpPath, path)
+    size = os.path.getsize(path)
+
+    with cache.lock:
+        cnn = cacheConnection(cache)
+        cacheFlush(cache)
+        cursor = cnn.cursor()
+        cursor.execute("""
+            INSERT OR REPLACE INTO entries (key,md5,params,path,size,last_access)
+                VALUES (?,?,?,?,?,?)
+            """, (key, md5, json.dumps(params), fname, size, time.time()))
+        cnn.commit()
+        cacheEvict(cache, cnn)
+
+    return True
+
+
+def cacheEvict(cache,
+               cnn):
+    if cache.maxSize is None:
+        return 0
+
+    cursor = cnn.cursor()
+    total = cursor.execute("SELECT coalesce(sum(size),0) FROM entries")\
+        .fetchone()[0]
+    if total <= cache.maxSize:
+        return 0
+
+    evicted = []
+    for key, fname, size in cursor.execute("""
+            SELECT key,path,size FROM entries ORDER BY last_access ASC
+            """).fetchall():
+        if total <= cache.maxSize:
+            break
+        try:
+            os.remove(os.path.join(cache.dirPath, fname))
+        except OSError:
+            pass
+        evicted.append((key,))
+        total -= size
+
+    cursor.executemany("DELETE FROM entries WHERE key = ?", evicted)
+    cacheCount(cursor, "evictions", len(evicted))
+    cnn.commit()
+
+    return len(evicted)
+
+
+def cacheStats(cache):
+    with cache.lock:
+        cnn = cacheConnection(cache)
+        cacheFlush(cache)
+        cursor = cnn.cursor()
+        stats = {name: value for name, value in
+                 cursor.execute("SELECT name,value FROM counters").fetchall()}
+        entries, size = cursor.execute("""
+            SELECT count(*),coalesce(sum(size),0) FROM entries
+            """).fetchone()
+
+    requests = stats["hits"] + stats["misses"]
+    stats["entries"] = entries
+    stats["size"] = size
+    stats["maxSize"] = cache.maxSize
+    stats["hitRate"] = None
+    if requests > 0:
+        stats["hitRate"] = float(stats["hits"]) / requests
+
+    return stats
+
+
+def cacheClear(cache):
+    with cache.lock:
+        cnn = cacheConnection(cache)
+        cache.pending = {}
+        cache.counts = {"hits": 0, "misses": 0}
+        cursor = cnn.cursor()
+        for row in cursor.execute("SELECT path FROM entries").fetchall():
+            try:
+                os.remove(os.path.join(cache.dirPath, row[0]))
+            except OSError:
+                pass
+        cursor.execute("DELETE FROM entries")
+        cursor.execute("UPDATE counters SET value = 0")
+        cnn.commit()
+
+    return True
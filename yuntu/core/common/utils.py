@@ -2,9 +2,21 @@ import os
 import json
 import hashlib
 import shutil
+import time
+import queue
 import importlib.util
+import errno
+import threading
+from collections import deque
 from importlib import import_module
 
+MODULE_REGISTRY = {}
+MODULE_STATS = {}
+MODULE_LOCK = threading.RLock()
+PREFETCH_DONE = object()
+FICLONE = 0x40049409
+LINK_MODES = ("auto","hardlink","reflink","copy")
+
 def loadMethod(methodName):
     mNameArr = methodName.split(".")
     if len(mNameArr) > 1:
@@ -18,10 +30,43 @@ def loadMethod(methodName):
     else:
         raise ValueError("Only module specified.")
 
+def fileContentHash(path):
+    fullPath = os.path.abspath(path)
+    fstat = os.stat(fullPath)
+    signature = (fstat.st_mtime_ns,fstat.st_size)
+
+    with MODULE_LOCK:
+        if fullPath in MODULE_STATS and MODULE_STATS[fullPath][0] == signature:
+            return MODULE_STATS[fullPath][1]
+
+    md5 = binaryMD5(fullPath)
+    with MODULE_LOCK:
+        MODULE_STATS[fullPath] = (signature,md5)
+
+    return md5
+
+def loadModuleFromFile(path,moduleName):
+    fullPath = os.path.abspath(path)
+    key = (fullPath,fileContentHash(fullPath))
+
+    with MODULE_LOCK:
+        if key not in MODULE_REGISTRY:
+            spec = importlib.util.spec_from_file_location(moduleName,fullPath)
+            modl = importlib.util.module_from_spec(spec)
+            spec.loader.exec_module(modl)
+            MODULE_REGISTRY[key] = modl
+
+        return MODULE_REGISTRY[key]
+
+def clearModuleRegistry():
+    with MODULE_LOCK:
+        MODULE_REGISTRY.clear()
+        MODULE_STATS.clear()
+
+    return True
+
 def loadMethodFromFile(path,methodName):
-    spec = importlib.util.spec_from_file_location(methodName,path)
-    modl = importlib.util.module_from_spec(spec)
-    spec.loader.exec_module(modl)
+    modl = loadModuleFromFile(path,methodName)
 
     mNameArr = methodName.split(".")
     
@@ -76,4 +121,133 @@ def cleanDirectory(folder,dirs=True):
                         shutil.rmtree(file_path)
                 except Exception as e:
                     print(e)
-    return True
\ No newline at end of file
+    return True
+
+def reflinkFile(src,dst):
+    import fcntl
+    with open(src,"rb") as fsrc:
+        with open(dst,"wb") as fdst:
+            try:
+                fcntl.ioctl(fdst.fileno(),FICLONE,fsrc.fileno())
+            except OSError:
+                fdst.close()
+                os.unlink(dst)
+                raise
+
+    return True
+
+def sameFile(src,dst,md5=None):
+    if not os.path.isfile(dst):
+        return False
+    if os.path.samefile(src,dst):
+        return True
+    if os.path.getsize(src) != os.path.getsize(dst):
+        return False
+    if md5 is None:
+        md5 = binaryMD5(src)
+
+    return binaryMD5(dst) == md5
+
+def linkOrCopy(src,dst,mode="auto",md5=None):
+    """Place 'src' at 'dst' sharing storage when possible.
+
+    Destinations already holding the same content are left untouched.
+    Returns the method that was used.
+    """
+    if mode not in LINK_MODES:
+        raise ValueError("Unknown link mode '"+str(mode)+"'. Options: "+str(LINK_MODES))
+    if os.path.lexists(dst):
+        if sameFile(src,dst,md5):
+            return "skipped"
+        os.unlink(dst)
+
+    if mode in ("auto","hardlink"):
+        try:
+            os.link(src,dst)
+            return "hardlink"
+        except OSError as e:
+            if mode == "hardlink" or e.errno not in (errno.EXDEV,errno.EPERM,errno.EMLINK,errno.ENOTSUP,errno.EACCES):
+                raise
+
+    if mode in ("auto","reflink"):
+        try:
+            reflinkFile(src,dst)
+            return "reflink"
+        except (OSError,ImportError):
+            if mode == "reflink":
+                raise
+
+    shutil.copyfile(src,dst)
+
+    return "copy"
+
+
+def boundedMap(executor,func,argsIter,maxInFlight):
+    pending = deque()
+    for args in argsIter:
+        pending.append(executor.submit(func,*args))
+        if len(pending) >= maxInFlight:
+            yield pending.popleft().result()
+
+    while len(pending) > 0:
+        yield pending.popleft().result()
+
+def prefetchIterator(iterable,maxSize=1000,stats=None,timeout=0.1):
+    items = queue.Queue(maxsize=maxSize)
+    stop = threading.Event()
+    if stats is None:
+        stats = {}
+    stats.update({"produced":0,"consumed":0,"sourceSeconds":0.0,
+                  "producerWaitSeconds":0.0,"consumerWaitSeconds":0.0})
+
+    def put(item):
+        start = time.perf_counter()
+        while not stop.is_set():
+            try:
+                items.put(item,timeout=timeout)
+                break
+            except queue.Full:
+                continue
+        stats["producerWaitSeconds"] += time.perf_counter()-start
+
+    def produce():
+        iterator = iter(iterable)
+        error = None
+        try:
+            while not stop.is_set():
+                start = time.perf_counter()
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    break
+                finally:
+                    stats["sourceSeconds"] += time.perf_counter()-start
+                stats["produced"] += 1
+                put((item,None))
+        except BaseException as e:
+            error = e
+        finally:
+            close = getattr(iterator,"close",None)
+            if close is not None:
+                close()
+        put((PREFETCH_DONE,error))
+
+    def consume():
+        producer = threading.Thread(target=produce,daemon=True)
+        producer.start()
+        try:
+            while True:
+                start = time.perf_counter()
+                item,error = items.get()
+                stats["consumerWaitSeconds"] += time.perf_counter()-start
+                if item is PREFETCH_DONE:
+                    if error is not None:
+                        raise error
+                    break
+                stats["consumed"] += 1
+                yield item
+        finally:
+            stop.set()
+            producer.join()
+
+    return consume()
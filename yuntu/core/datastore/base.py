@@ -86,7 +86,14 @@ class audioMothDatastore(activeDatastore):
         inputSpec ~ {
             "type":"audioMoth",
             "conf":{
-                "dataDir":"/foo/"
+                "dataDir":"/foo/",
+                "recursive":True,
+                "patterns":["*.wav","*.WAV"],
+                "modifiedSince":<optional timestamp or iso date>,
+                "wavInfo":True,
+                "md5":False,
+                "workers":8,
+                "prefetch":32
             },
             "metadata":{
                 "description":"Audiomoth datastore."
@@ -112,7 +119,8 @@ class mongodbDatastore(activeDatastore):
                 "target" : <collection_name>,
                 "filter" : <mongo_filter>,
                 "fields" : <foo1:1,foo2:1>,
-                "ukey" : "_id"
+                "ukey" : "_id",
+                "batchSize" : <optional ids per $in query and cursor batch, 1000>
             },
             "metadata": {
                 "description": "Datastore induced by mongodb query",
@@ -138,7 +146,11 @@ class postgresqlDatastore(activeDatastore):
                 "password" : <user_password>
                 "datastore" : <db_name>,
                 "target" : <select_statement>,
-                "ukey" : <id_from_select>
+                "ukey" : <id_from_select>,
+                "fields" : <optional list of columns to project>,
+                "itersize" : <optional rows per server-side fetch, 2000>,
+                "maxconn" : <optional pool size, 4>,
+                "poolTimeout" : <optional seconds to wait for a free connection, no limit>
             },
             "metadata": {
                 "description": "Datastore induced by postgresql query",
@@ -155,18 +167,48 @@ class csvDatastore(activeDatastore):
     __metaclass__ = ABCMeta
 
     def __init__(self,inputSpec):
+        """
+        inputSpec ~ {
+            "type":"csv",
+            "conf":{
+                "path" : <csv_path>,
+                "delimiter" : ",",
+                "dtype" : <optional {column:type} hints>,
+                "encoding" : "utf-8",
+                "ukey" : <optional id column, row number otherwise>,
+                "chunkSize" : 10000
+            },
+            "metadata": {
+                "description": "Datastore induced by csv file",
+            }
+        }
+        """
         self.inputSpec = inputSpec
         self.inputSpec["type"] = "csv"
         
     def getData(self):
-        pass
+        return dsMethods.datastoreCsvGetData(self)
 
 class xlsDatastore(activeDatastore):
     __metaclass__ = ABCMeta
 
     def __init__(self,inputSpec):
+        """
+        inputSpec ~ {
+            "type":"xls",
+            "conf":{
+                "path" : <xlsx_path>,
+                "sheet" : <optional sheet name or index, first sheet otherwise>,
+                "headerRow" : 1,
+                "ukey" : <optional id column, row number otherwise>
+            },
+            "metadata": {
+                "description": "Datastore induced by spreadsheet",
+            }
+        }
+        """
         self.inputSpec = inputSpec
         self.inputSpec["type"] = "xls"
         
     def getData(self):
-        pass
\ No newline at end of file
+        return dsMethods.datastoreXlsGetData(self)
\ No newline at end of file
@@ -1,11 +1,47 @@
-import os
+import uuid
+import threading
 from pymongo import MongoClient
 from bson.objectid import ObjectId
 import datetime
 import psycopg2
 import psycopg2.extras
+import psycopg2.pool
+from psycopg2 import sql
+import pandas as pd
+import openpyxl
 from collections import OrderedDict
-from yuntu.core.datastore.utils import hashDict
+from concurrent.futures import ThreadPoolExecutor
+from yuntu.core.common.utils import boundedMap
+from yuntu.core.datastore.utils import hashDict, normalizeDocument, scanFiles, readAudioMothFile
+
+TRANSPORT_CONF = frozenset(["itersize","maxconn","poolTimeout","batchSize","workers","prefetch","chunkSize"])
+POSTGRES_POOLS = {}
+POSTGRES_LOCK = threading.Lock()
+MONGO_CLIENTS = {}
+MONGO_LOCK = threading.Lock()
+
+
+class BlockingConnectionPool(psycopg2.pool.ThreadedConnectionPool):
+    """Threaded pool whose getconn waits for a free slot instead of raising
+    PoolError once 'maxconn' connections are out."""
+    def __init__(self, minconn, maxconn, *args, **kwargs):
+        self.slots = threading.BoundedSemaphore(maxconn)
+        super(BlockingConnectionPool, self).__init__(minconn, maxconn, *args, **kwargs)
+
+    def getconn(self, key=None, timeout=None):
+        if not self.slots.acquire(timeout=timeout):
+            raise ValueError("Timed out after "+str(timeout)+" s waiting for one of "+str(self.maxconn)+" postgresql connections. Raise 'maxconn' in the datastore configuration or lower concurrent pulls.")
+        try:
+            return super(BlockingConnectionPool, self).getconn(key)
+        except Exception:
+            self.slots.release()
+            raise
+
+    def putconn(self, conn=None, key=None, close=False):
+        try:
+            super(BlockingConnectionPool, self).putconn(conn, key, close)
+        finally:
+            self.slots.release()
 
 
 def datastoreGetSpec(ds):
@@ -32,109 +68,217 @@ def datastoreGetMetadata(ds):
 
 def datastoreGetHash(ds):
     formatedConf = ds.getConf()
+    for key in TRANSPORT_CONF:
+        if key in formatedConf:
+            del formatedConf[key]
 
     return hashDict(formatedConf)
 
+def datastorePostgresqlDsn(dsConf):
+    params = {"dbname":dsConf["datastore"],
+              "user":dsConf["user"],
+              "host":dsConf["host"],
+              "password":dsConf["password"]}
+    if dsConf.get("port") is not None:
+        params["port"] = dsConf["port"]
+
+    return psycopg2.extensions.make_dsn(**params)
+
+def datastorePostgresqlPool(dsConf):
+    dsn = datastorePostgresqlDsn(dsConf)
+    with POSTGRES_LOCK:
+        if dsn not in POSTGRES_POOLS or POSTGRES_POOLS[dsn].closed:
+            POSTGRES_POOLS[dsn] = BlockingConnectionPool(1,dsConf.get("maxconn",4),dsn)
+
+        return POSTGRES_POOLS[dsn]
+
+def datastorePostgresqlClosePools():
+    with POSTGRES_LOCK:
+        for dsn in list(POSTGRES_POOLS.keys()):
+            POSTGRES_POOLS.pop(dsn).closeall()
+
+    return True
+
+def datastorePostgresqlStatement(dsConf):
+    target = dsConf["target"].strip().rstrip(";")
+    fields = dsConf.get("fields")
+    if fields is None:
+        return sql.SQL(target)
+
+    fields = list(fields)
+    if dsConf["ukey"] not in fields:
+        fields = [dsConf["ukey"]]+fields
+
+    return sql.SQL("SELECT {fields} FROM ({target}) AS yuntu_target").format(
+        fields=sql.SQL(",").join([sql.Identifier(field) for field in fields]),
+        target=sql.SQL(target))
+
 def datastorePostgresqlGetData(ds):
     def f(dsSpec):
         dsConf = dsSpec["conf"]
-        conn = psycopg2.connect("dbname='"+dsConf["datastore"]+"' user='"+dsConf["user"]+"' host='"+dsConf["host"]+"' password='"+dsConf["password"]+"'")
-        cur = conn.cursor(cursor_factory = psycopg2.extras.RealDictCursor)
-        cur.execute(dsConf["target"])
-        
-        for row in cur:
-            obj = {}
-            fkey = str(row[dsConf["ukey"]])
-            for key in row.keys():
-                obj[key] = row[key]    
-            obj[dsConf["ukey"]] = fkey
-            
-            yield {"datastore":dsSpec, "source":{"fkey":fkey},"metadata":obj}
-            
+        pool = datastorePostgresqlPool(dsConf)
+        conn = pool.getconn(timeout=dsConf.get("poolTimeout"))
+        cur = None
+        try:
+            cur = conn.cursor(name="yuntu_"+uuid.uuid4().hex,cursor_factory=psycopg2.extras.RealDictCursor)
+            cur.itersize = dsConf.get("itersize",2000)
+            cur.execute(datastorePostgresqlStatement(dsConf))
+
+            for row in cur:
+                obj = dict(row)
+                fkey = str(row[dsConf["ukey"]])
+                obj[dsConf["ukey"]] = fkey
+
+                yield {"datastore":dsSpec, "source":{"fkey":fkey},"metadata":obj}
+        finally:
+            if cur is not None and not cur.closed:
+                cur.close()
+            conn.rollback()
+            pool.putconn(conn)
+
     return f(ds.getSpec())
 
+def datastoreMongodbClient(dsConf):
+    with MONGO_LOCK:
+        if dsConf["host"] not in MONGO_CLIENTS:
+            MONGO_CLIENTS[dsConf["host"]] = MongoClient(dsConf["host"],maxPoolSize = 30)
+
+        return MONGO_CLIENTS[dsConf["host"]]
+
+def datastoreMongodbCloseClients():
+    with MONGO_LOCK:
+        for host in list(MONGO_CLIENTS.keys()):
+            MONGO_CLIENTS.pop(host).close()
+
+    return True
+
+def datastoreMongodbFindIds(collection,ids,fields=None,batchSize=1000):
+    for start in range(0,len(ids),batchSize):
+        chunk = [rId if isinstance(rId,ObjectId) else ObjectId(rId) for rId in ids[start:start+batchSize]]
+        found = {}
+        for obj in collection.find({"_id":{"$in":chunk}},fields):
+            found[obj["_id"]] = obj
+
+        for rId in chunk:
+            if rId in found:
+                yield found[rId]
+            else:
+                print("Record not found in datastore :",str(rId))
+
 def datastoreMongodbGetData(ds):
     def f(dsSpec):
         dsConf = dsSpec["conf"]
-        client = MongoClient(dsConf["host"],maxPoolSize = 30)
+        client = datastoreMongodbClient(dsConf)
         mDb = client[dsConf["datastore"]]
         collection = mDb[dsConf["target"]]
- 
+        fields = dsConf.get("fields")
+        batchSize = dsConf.get("batchSize",1000)
+
         if isinstance(dsConf["filter"],list):
-            for rId in dsConf["filter"]:
-                obj = collection.find_one({"_id":ObjectId(rId)})
-                fkey = str(obj[dsConf["ukey"]])
-                obj[dsConf["ukey"]] = fkey
-                for key in obj:
-                    if isinstance(obj[key],ObjectId):
-                        obj[key] = str(obj[key])
-                    elif isinstance(obj[key],dict):
-                        for dkey in obj[key]:
-                            if isinstance(obj[key][dkey],ObjectId):
-                                obj[key][dkey] = str(obj[key][dkey])
-                            elif isinstance(obj[key][dkey],dict):
-                                for tkey in obj[key][dkey]:
-                                    if isinstance(obj[key][dkey][tkey],ObjectId):
-                                        obj[key][dkey][tkey] = str(obj[key][dkey][tkey])
-                                
-                            
-                yield {"datastore":dsSpec, "source":{"fkey":fkey},"metadata":obj}
+            cursor = datastoreMongodbFindIds(collection,dsConf["filter"],fields,batchSize)
         else:
-            for obj in collection.find(dsConf["filter"],dsConf["fields"]):
-                fkey = str(obj[dsConf["ukey"]])
-                obj[dsConf["ukey"]] = fkey
-                for key in obj:
-                    if isinstance(obj[key],ObjectId):
-                        obj[key] = str(obj[key])
-                    elif isinstance(obj[key],dict):
-                        for dkey in obj[key]:
-                            if isinstance(obj[key][dkey],ObjectId):
-                                obj[key][dkey] = str(obj[key][dkey])
-                            elif isinstance(obj[key][dkey],dict):
-                                for tkey in obj[key][dkey]:
-                                    if isinstance(obj[key][dkey][tkey],ObjectId):
-                                        obj[key][dkey][tkey] = str(obj[key][dkey][tkey])
-                yield {"datastore":dsSpec, "source":{"fkey":fkey},"metadata":obj}
+            cursor = collection.find(dsConf["filter"],fields,batch_size=batchSize)
+
+        for obj in cursor:
+            obj = normalizeDocument(obj)
+            fkey = str(obj[dsConf["ukey"]])
+            obj[dsConf["ukey"]] = fkey
+
+            yield {"datastore":dsSpec, "source":{"fkey":fkey},"metadata":obj}
 
     return f(ds.getSpec())
 
+def datastoreAudioMothScan(dsConf):
+    modifiedSince = dsConf.get("modifiedSince")
+    if isinstance(modifiedSince,str):
+        modifiedSince = datetime.datetime.fromisoformat(modifiedSince).timestamp()
+
+    return scanFiles(dsConf["dataDir"],
+                     dsConf.get("patterns",["*.wav","*.WAV"]),
+                     dsConf.get("recursive",True),
+                     modifiedSince)
+
+def datastoreAudioMothReadFile(path,fkey,wavInfo=True,md5=False):
+    try:
+        return readAudioMothFile(path,wavInfo,md5),fkey,None
+    except Exception as e:
+        return None,fkey,e
+
 def datastoreAudioMothGetData(ds):
     def f(dsSpec):
         dsConf = dsSpec["conf"]
-        dataDir = dsConf["dataDir"]
-        allFiles = []
-        for filename in os.listdir(dsConf["dataDir"]):
-            if filename.endswith(".wav") or filename.endswith(".WAV"): 
-                allFiles.append(filename)
-
-        for i in range(len(allFiles)):
-            fkey = allFiles[i]
-            obj = {}
-            obj["path"] = os.path.join(dsConf["dataDir"],fkey)
-            
-            with open(obj["path"], 'rb') as file:
-                buf_header = file.read(200)
-                try:
-                    obj["voltage"] = float(buf_header[166:169])
-                    obj["time"] = buf_header[68:87].decode("utf-8")
-                    obj["tZone"] = buf_header[89:92].decode("utf-8")
-                    if "-" in buf_header[84:94].decode("utf-8"):
-                        obj["tZone"] = buf_header[84:94].decode("utf-8")
-                    obj["device_id"] = buf_header[107:123].decode("utf-8")
-                    obj["gain"] = float(buf_header[140:141])
-                except:
-                    obj["voltage"] = float(buf_header[168:171])
-                    obj["time"] = buf_header[68:87].decode("utf-8")
-                    obj["tZone"] = buf_header[89:92].decode("utf-8")
-                    if "-" in buf_header[84:94].decode("utf-8"):
-                        obj["tZone"] = buf_header[84:94].decode("utf-8")
-                    obj["device_id"] = buf_header[109:125].decode("utf-8")
-                    obj["gain"] = float(buf_header[142:143])
-
-                file.close()
-                
+        workers = dsConf.get("workers",8)
+        prefetch = dsConf.get("prefetch",4*workers)
+        jobs = ((path,fkey,dsConf.get("wavInfo",True),dsConf.get("md5",False)) for path,fkey in datastoreAudioMothScan(dsConf))
 
-            yield {"datastore":dsSpec, "source":{"fkey":fkey},"metadata":obj}
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for obj,fkey,error in boundedMap(executor,datastoreAudioMothReadFile,jobs,prefetch):
+                if error is not None:
+                    print("Error reading audioMoth file :",fkey,error)
+                    continue
+
+                yield {"datastore":dsSpec, "source":{"fkey":fkey},"metadata":obj}
+
+    return f(ds.getSpec())
+
+def datastoreTableRecord(dsSpec,obj,ukey,rowNumber):
+    obj = normalizeDocument(obj)
+    if ukey is None:
+        fkey = rowNumber
+    else:
+        fkey = str(obj[ukey])
+        obj[ukey] = fkey
+
+    return {"datastore":dsSpec, "source":{"fkey":fkey},"metadata":obj}
+
+def datastoreCsvGetData(ds):
+    def f(dsSpec):
+        dsConf = dsSpec["conf"]
+        ukey = dsConf.get("ukey")
+        reader = pd.read_csv(dsConf["path"],
+                             sep=dsConf.get("delimiter",","),
+                             dtype=dsConf.get("dtype"),
+                             encoding=dsConf.get("encoding","utf-8"),
+                             chunksize=dsConf.get("chunkSize",10000))
+        rowNumber = 0
+        with reader:
+            for chunk in reader:
+                chunk = chunk.astype(object).where(chunk.notna(),None)
+                for obj in chunk.to_dict("records"):
+                    yield datastoreTableRecord(dsSpec,obj,ukey,rowNumber)
+                    rowNumber += 1
+
+    return f(ds.getSpec())
+
+def datastoreXlsGetData(ds):
+    def f(dsSpec):
+        dsConf = dsSpec["conf"]
+        ukey = dsConf.get("ukey")
+        headerRow = dsConf.get("headerRow",1)
+        wb = openpyxl.load_workbook(dsConf["path"],read_only=True,data_only=True)
+        try:
+            sheet = dsConf.get("sheet")
+            if sheet is None:
+                ws = wb.worksheets[0]
+            elif isinstance(sheet,int):
+                ws = wb.worksheets[sheet]
+            else:
+                ws = wb[sheet]
+
+            rows = ws.iter_rows(min_row=headerRow,values_only=True)
+            header = [str(name) if name is not None else None for name in next(rows)]
+            rowNumber = 0
+            for values in rows:
+                if all([value is None for value in values]):
+                    continue
+                obj = {}
+                for name,value in zip(header,values):
+                    if name is not None:
+                        obj[name] = value
+                yield datastoreTableRecord(dsSpec,obj,ukey,rowNumber)
+                rowNumber += 1
+        finally:
+            wb.close()
 
     return f(ds.getSpec())
 
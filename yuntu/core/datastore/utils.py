@@ -1,8 +1,101 @@
+import os
+import wave
+import fnmatch
 import hashlib
 import json
+import datetime
+from bson.objectid import ObjectId
 
 def hashDict(dDict):
     #Not reliable for non str keys (tuples, etc)
     m = hashlib.md5(json.dumps(dDict, sort_keys=True, ensure_ascii=True).encode('utf-8'))
 
-    return m.hexdigest()
\ No newline at end of file
+    return m.hexdigest()
+
+def normalizeDocument(value):
+    if isinstance(value,dict):
+        return {key:normalizeDocument(value[key]) for key in value}
+    if isinstance(value,(list,tuple)):
+        return [normalizeDocument(item) for item in value]
+    if isinstance(value,ObjectId):
+        return str(value)
+    if isinstance(value,(datetime.datetime,datetime.date)):
+        return value.isoformat()
+
+    return value
+
+def scanFiles(dataDir,patterns=None,recursive=True,modifiedSince=None):
+    stack = [dataDir]
+    while len(stack) > 0:
+        current = stack.pop()
+        with os.scandir(current) as it:
+            entries = sorted(it,key=lambda entry: entry.name)
+
+        subdirs = []
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                if recursive:
+                    subdirs.append(entry.path)
+                continue
+            if not entry.is_file():
+                continue
+
+            relPath = os.path.relpath(entry.path,dataDir)
+            if patterns is not None:
+                if not any([fnmatch.fnmatchcase(entry.name,pattern) or fnmatch.fnmatchcase(relPath,pattern) for pattern in patterns]):
+                    continue
+            if modifiedSince is not None and entry.stat().st_mtime < modifiedSince:
+                continue
+
+            yield entry.path,relPath
+
+        stack.extend(reversed(subdirs))
+
+def parseAudioMothHeader(buf_header):
+    obj = {}
+    try:
+        obj["voltage"] = float(buf_header[166:169])
+        obj["time"] = buf_header[68:87].decode("utf-8")
+        obj["tZone"] = buf_header[89:92].decode("utf-8")
+        if "-" in buf_header[84:94].decode("utf-8"):
+            obj["tZone"] = buf_header[84:94].decode("utf-8")
+        obj["device_id"] = buf_header[107:123].decode("utf-8")
+        obj["gain"] = float(buf_header[140:141])
+    except:
+        obj["voltage"] = float(buf_header[168:171])
+        obj["time"] = buf_header[68:87].decode("utf-8")
+        obj["tZone"] = buf_header[89:92].decode("utf-8")
+        if "-" in buf_header[84:94].decode("utf-8"):
+            obj["tZone"] = buf_header[84:94].decode("utf-8")
+        obj["device_id"] = buf_header[109:125].decode("utf-8")
+        obj["gain"] = float(buf_header[142:143])
+
+    return obj
+
+def readAudioMothFile(path,wavInfo=True,md5=False,blockSize=1048576):
+    with open(path,'rb') as file:
+        obj = {"path":path}
+        obj.update(parseAudioMothHeader(file.read(200)))
+
+        if wavInfo:
+            # Headers the wave module rejects (e.g. WAVE_FORMAT_EXTENSIBLE)
+            # are described later from the media itself.
+            file.seek(0)
+            try:
+                wav = wave.open(file)
+                obj["wav_info"] = {"samplerate":wav.getframerate(),
+                                   "nchannels":wav.getnchannels(),
+                                   "sampwidth":wav.getsampwidth(),
+                                   "length":wav.getnframes(),
+                                   "filesize":os.fstat(file.fileno()).st_size}
+            except (wave.Error,EOFError):
+                pass
+
+        if md5:
+            file.seek(0)
+            m = hashlib.md5()
+            for block in iter(lambda: file.read(blockSize),b""):
+                m.update(block)
+            obj["md5"] = m.hexdigest()
+
+    return obj
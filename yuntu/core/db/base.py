@@ -1,3 +1,4 @@
+import os
 from abc import abstractmethod,ABCMeta
 import yuntu.core.db.methods as dbMethods
 
@@ -29,13 +30,16 @@ class metaDb(object):
 class embeddedDb(metaDb):
     __metaclass__ = ABCMeta
 
-    def __init__(self,name,dirPath,dump=None,overwrite=False):
+    def __init__(self,name,dirPath,dump=None,overwrite=False,profile=None):
         self.name = name
         self.dirPath = dirPath
         self.connPath = dbMethods.lDbConnPath(self)
         self.connection = None
         self.parsersDir = None
         self.parsers = None
+        self.indexedFields = {}
+        self.profile = dbMethods.lDbProfile(profile)
+        self.batchDepth = 0
 
         if dbMethods.lDbExists(self):
             if overwrite:
@@ -57,8 +61,8 @@ class embeddedDb(metaDb):
         else:
             return dbMethods.lDbCreateFromDump(self,dump)
 
-    def insert(self,dataArray,parseSeq=[],timeConf=None):
-        return dbMethods.lDbInsert(self,dataArray,parseSeq,timeConf)
+    def insert(self,dataArray,parseSeq=[],timeConf=None,workers=None,batchSize=1000,processes=False,incremental=True,prefetch=None):
+        return dbMethods.lDbInsert(self,dataArray,parseSeq,timeConf,workers,batchSize,processes,incremental,prefetch)
 
     def annotate(self,dataArr):
         return dbMethods.lDbAnnotate(self,dataArr)
@@ -69,47 +73,77 @@ class embeddedDb(metaDb):
     def close(self):
         return dbMethods.lDbClose(self)
 
+    def batch(self):
+        return dbMethods.lDbBatch(self)
+
+    def share(self):
+        return dbMethods.lDbShare(self)
+
     def count(self,where=None,query=None,groupby=None):
         return dbMethods.lDbCount(self,where,query)
 
     def dump(self,path,overwrite=False):
         return dbMethods.lDbDump(self,path,overwrite)
 
-    def find(self,id=None,query=None,table="parsed"):
-        return dbMethods.lDbFind(self,id,query,table)
+    def find(self,id=None,query=None,table="parsed",lazy=False,batchSize=1000,fields=None):
+        return dbMethods.lDbFind(self,id,query,table,lazy,batchSize,fields)
+
+    def findPage(self,query=None,table="parsed",limit=100,orderBy=None,token=None,fields=None):
+        return dbMethods.lDbFindPage(self,query,table,limit,orderBy,token,fields)
 
-    def select(self,id=None,where=None,freeSt=None,table="parsed"):
-        return dbMethods.lDbSelect(self,id,where,freeSt,table)
+    def select(self,id=None,where=None,freeSt=None,table="parsed",params=(),lazy=False,batchSize=1000,fields=None):
+        return dbMethods.lDbSelect(self,id,where,freeSt,table,params,lazy,batchSize,fields)
 
     def remove(self,id=None,where=None,query=None):
-        return dbMethods.lDbRemove(self,id,query)
+        return dbMethods.lDbRemove(self,id,where,query)
 
     def asStatements(self):
         return dbMethods.lDbAsStatements(self)
 
-    def transform(self,parseSeq,id=None,where=None,query=None,operation="append"):
+    def backup(self,path,overwrite=False):
+        return dbMethods.lDbBackup(self,path,overwrite)
+
+    def merge(self,other,conf1=None,conf2=None,mediaDir=None):
+        return dbMethods.lDbMerge(self,other,conf1,conf2,mediaDir)
+
+    def transform(self,parseSeq,id=None,where=None,query=None,operation="append",chunkSize=1000,workers=None):
         wStatement = where
+        params = ()
         if query is not None:
-            wStatement = dbMethods.lDbParseQuery(query)
-        return dbMethods.lDbUpdateParseSeq(self,parseSeq,id,wStatement,operation)
+            wStatement,params = dbMethods.lDbCompileQuery(query,self)
+        return dbMethods.lDbUpdateParseSeq(self,parseSeq,id,wStatement,operation,params,chunkSize,workers)
+
+    def indexField(self,path,table="parsed"):
+        return dbMethods.lDbIndexField(self,path,table)
+
+    def dropFieldIndex(self,path,table="parsed"):
+        return dbMethods.lDbDropIndexedField(self,path,table)
+
+    def getIndexedFields(self):
+        return dbMethods.lDbLoadIndexedFields(self)
 
 
 class RAMDb(embeddedDb):
     __metaclass__ = ABCMeta
-    def __init__(self,name,dump):
+    def __init__(self,name,dump,profile=None):
         self.name = name
         self.connPath = ':memory:'
         self.connection = None
         self.parsersDir = None
         self.parsers = None
+        self.indexedFields = {}
+        self.profile = dbMethods.lDbProfile(profile)
+        self.batchDepth = 0
         self.dirPath = None
         self.build(dump)
 
     def getType(self):
         return 'RAMDb'
 
-    def toDisk(self,dirPath,name=None):
+    def toDisk(self,dirPath,name=None,overwrite=False):
         if name is None:
             name = self.name
 
-        return embeddedDb(name,dirPath,dump=dbMethods.lDbAsStatements(self))
+        dbMethods.lDbBackup(self,os.path.join(dirPath,name+".sqlite"),overwrite)
+
+        return embeddedDb(name,dirPath,profile=self.profile)
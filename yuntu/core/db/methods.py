@@ -1,8 +1,16 @@
 import os
-import shutil
+import re
 import sqlite3
 import json
+import base64
+import gzip
+import tempfile
+import time
+from functools import lru_cache
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 import yuntu.core.db.utils as dbUtils
+from yuntu.core.common.utils import boundedMap, prefetchIterator
 
 
 def lDbParseQuery(query):
@@ -112,6 +120,224 @@ def lDbParseQuery(query):
 
     return fullStatement
 
+FULL_BAND = 3.0e38
+SCHEMA_VERSION = 2
+WINDOW_FIELDS = ["start_time","end_time","min_freq","max_freq"]
+
+def lDbBoundExpressions(prefix=""):
+    # Ordered bounds as stored in annotations_rtree; a missing frequency
+    # spans the full band.
+    lowFreq = "coalesce({p}min_freq,{lo})".format(p=prefix,lo=-FULL_BAND)
+    highFreq = "coalesce({p}max_freq,{hi})".format(p=prefix,hi=FULL_BAND)
+
+    return {"min_time":"min({p}start_time,{p}end_time)".format(p=prefix),
+            "max_time":"max({p}start_time,{p}end_time)".format(p=prefix),
+            "min_freq":"min({lo},{hi})".format(lo=lowFreq,hi=highFreq),
+            "max_freq":"max({lo},{hi})".format(lo=lowFreq,hi=highFreq)}
+
+WINDOW_BOUNDS = lDbBoundExpressions()
+WINDOW_CONSTRAINTS = {
+    "$overlaps":{"start_time":("max_time >= ?",WINDOW_BOUNDS["max_time"]+" >= ?"),
+                 "end_time":("min_time <= ?",WINDOW_BOUNDS["min_time"]+" <= ?"),
+                 "min_freq":("max_freq >= ?",WINDOW_BOUNDS["max_freq"]+" >= ?"),
+                 "max_freq":("min_freq <= ?",WINDOW_BOUNDS["min_freq"]+" <= ?")},
+    "$within":{"start_time":("max_time >= ?",WINDOW_BOUNDS["min_time"]+" >= ?"),
+               "end_time":("min_time <= ?",WINDOW_BOUNDS["max_time"]+" <= ?"),
+               "min_freq":("max_freq >= ?",WINDOW_BOUNDS["min_freq"]+" >= ?"),
+               "max_freq":("min_freq <= ?",WINDOW_BOUNDS["max_freq"]+" <= ?")}
+}
+
+def lDbWindowShape(key,window,params):
+    if not isinstance(window,dict):
+        raise ValueError("'"+key+"' must be used with a dict of window bounds")
+    fields = tuple([field for field in WINDOW_FIELDS if field in window and window[field] is not None])
+    if len(fields) == 0:
+        raise ValueError("'"+key+"' needs at least one of "+str(WINDOW_FIELDS))
+    for field in window:
+        if field not in WINDOW_FIELDS:
+            raise ValueError("Unknown window bound '"+str(field)+"' for '"+key+"'")
+
+    values = [lDbParamValue(window[field]) for field in fields]
+    params.extend(values)
+    params.extend(values)
+
+    return (key,fields)
+
+def lDbWindowStatement(key,fields):
+    constraints = WINDOW_CONSTRAINTS[key]
+    prefilter = " AND ".join([constraints[field][0] for field in fields])
+    refine = " AND ".join([constraints[field][1] for field in fields])
+
+    return "(id IN (SELECT id FROM annotations_rtree WHERE "+prefilter+") AND "+refine+")"
+
+def lDbFieldExpression(key,opShape,indexed=()):
+    for path,column in indexed:
+        if key == path:
+            return column
+
+    if "groups" in key:
+        return "json_extract(groups,'$."+key.replace("groups.","")+"')"
+    elif "label" in key:
+        return "json_extract(label,'$."+key.replace("label.","")+"')"
+    elif "metadata" in key:
+        return "json_extract(metadata,'$."+key.replace("metadata.","")+"')"
+    elif "media_info" in key:
+        return "json_extract(media_info,'$."+key.replace("media_info.","")+"')"
+    elif "parse_seq" in key or "verts" in key:
+        jsfield = "parse_seq"
+        if "parse_seq" not in key:
+            jsfield = "verts"
+        if opShape[0] == "$size":
+            return "json_array_length("+jsfield+")"
+        elif opShape[0] != "$eq":
+            raise ValueError("Not implemented")
+        return "json_extract("+jsfield+",'$"+key.replace(jsfield,"")+"')"
+    else:
+        return key
+
+def lDbParamValue(value):
+    if hasattr(value,"item") and not isinstance(value,(str,bytes)):
+        return value.item()
+    return value
+
+def lDbQueryShape(query,params):
+    shape = []
+    for key in query:
+        if key in ["$or","$and"]:
+            shape.append((key,tuple([lDbQueryShape(subQuery,params) for subQuery in query[key]])))
+        elif key == "$not":
+            shape.append((key,lDbQueryShape(query[key],params)))
+        elif key in WINDOW_CONSTRAINTS:
+            shape.append(lDbWindowShape(key,query[key],params))
+        else:
+            condition = query[key]
+            if isinstance(condition,dict):
+                for op in ["$ne","$gt","$lt","$gte","$lte","$in","$size"]:
+                    if op in condition:
+                        break
+                else:
+                    raise ValueError("Not implemented")
+
+                if op == "$in":
+                    if not isinstance(condition["$in"],list):
+                        raise ValueError("'$in' must be used with a list of values to compare")
+                    params.extend([lDbParamValue(val) for val in condition["$in"]])
+                    shape.append((key,(op,len(condition["$in"]))))
+                else:
+                    params.append(lDbParamValue(condition[op]))
+                    shape.append((key,(op,)))
+            else:
+                params.append(lDbParamValue(condition))
+                shape.append((key,("$eq",)))
+
+    return tuple(shape)
+
+@lru_cache(maxsize=512)
+def lDbCompileShape(shape,indexed=()):
+    operators = {"$eq":" = ?","$ne":" <> ?","$gt":" > ?","$lt":" < ?","$gte":" >= ?","$lte":" <= ?","$size":" = ?"}
+    statements = []
+    for key,sub in shape:
+        if key in ["$or","$and"]:
+            operator = " "+key[1:].upper()+" "
+            statements.append("("+operator.join([lDbCompileShape(subShape,indexed) for subShape in sub])+")")
+        elif key == "$not":
+            statements.append("NOT ("+lDbCompileShape(sub,indexed)+")")
+        elif key in WINDOW_CONSTRAINTS:
+            statements.append(lDbWindowStatement(key,sub))
+        else:
+            subStatement = lDbFieldExpression(key,sub,indexed)
+            if sub[0] == "$in":
+                if sub[1] == 1:
+                    subStatement += " = ?"
+                else:
+                    subStatement += " IN ("+",".join(["?"]*sub[1])+")"
+            else:
+                subStatement += operators[sub[0]]
+            statements.append(subStatement)
+
+    return " AND ".join(statements)
+
+def lDbCompileQuery(query,db=None,table="parsed"):
+    if query is None:
+        return None,()
+    params = []
+    shape = lDbQueryShape(query,params)
+
+    return lDbCompileShape(shape,lDbIndexedPaths(db,table)),tuple(params)
+
+def lDbIndexedPaths(db,table="parsed"):
+    if db is None or not hasattr(db,"indexedFields"):
+        return ()
+    if table not in db.indexedFields:
+        return ()
+
+    return tuple(sorted(db.indexedFields[table].items()))
+
+def lDbFieldColumn(db,field,parentField,table="parsed"):
+    path = parentField+"."+field
+    for ipath,column in lDbIndexedPaths(db,table):
+        if ipath == path:
+            return column
+
+    return dbUtils.jsonExtractFormat(field,parentField)
+
+def lDbIndexedColumnName(path):
+    return "_ix_"+"".join([c if c.isalnum() else "_" for c in path])
+
+def lDbLoadIndexedFields(db):
+    indexedFields = {}
+    cursor = db.connection.cursor()
+    for row in cursor.execute('SELECT tbl,path,col FROM indexed_fields').fetchall():
+        if row["tbl"] not in indexedFields:
+            indexedFields[row["tbl"]] = {}
+        indexedFields[row["tbl"]][row["path"]] = row["col"]
+    db.indexedFields = indexedFields
+
+    return indexedFields
+
+def lDbIndexField(db,path,table="parsed"):
+    if sqlite3.sqlite_version_info < (3,31,0):
+        raise ValueError("Indexed fields need SQLite >= 3.31 (found "+sqlite3.sqlite_version+")")
+    if table not in ["parsed","annotations"]:
+        raise ValueError("Only 'parsed' and 'annotations' fields can be indexed")
+
+    parts = path.split(".")
+    if len(parts) < 2 or parts[0] not in ["metadata","media_info","label","groups"]:
+        raise ValueError("Path should look like 'metadata.field', 'media_info.field', 'label.field' or 'groups.field'")
+    if parts[0] == "media_info" and table != "parsed":
+        raise ValueError("'media_info' only exists in table 'parsed'")
+    if parts[0] in ["label","groups"] and table != "annotations":
+        raise ValueError("'"+parts[0]+"' only exists in table 'annotations'")
+
+    if path in lDbLoadIndexedFields(db).get(table,{}):
+        return db.indexedFields[table][path]
+
+    column = lDbIndexedColumnName(path)
+    cnn = db.connection
+    cursor = cnn.cursor()
+    cursor.execute('ALTER TABLE {tn} ADD COLUMN {col} GENERATED ALWAYS AS ({expr}) VIRTUAL'.format(tn=table,col=column,expr=dbUtils.jsonExtractFormat(".".join(parts[1:]),parts[0])))
+    cursor.execute('CREATE INDEX IF NOT EXISTS {tn}{col} ON {tn}({col})'.format(tn=table,col=column))
+    cursor.execute('INSERT INTO indexed_fields (tbl,path,col) VALUES (?,?,?)',(table,path,column))
+    lDbCommit(db)
+    lDbLoadIndexedFields(db)
+
+    return column
+
+def lDbDropIndexedField(db,path,table="parsed"):
+    indexedFields = lDbLoadIndexedFields(db)
+    if path not in indexedFields.get(table,{}):
+        raise ValueError("Field "+path+" is not indexed in table "+table)
+
+    column = indexedFields[table][path]
+    cnn = db.connection
+    cursor = cnn.cursor()
+    cursor.execute('DROP INDEX IF EXISTS {tn}{col}'.format(tn=table,col=column))
+    cursor.execute('ALTER TABLE {tn} DROP COLUMN {col}'.format(tn=table,col=column))
+    cursor.execute('DELETE FROM indexed_fields WHERE tbl = ? AND path = ?',(table,path))
+    lDbCommit(db)
+    lDbLoadIndexedFields(db)
+
+    return True
 
 
 def lDbConnPath(db):
@@ -124,6 +350,9 @@ def lDbDrop(db):
     dirPath = db.dirPath
     connPath = os.path.join(dirPath,name+".sqlite")
     os.remove(connPath)
+    for suffix in ["-wal","-shm"]:
+        if os.path.isfile(connPath+suffix):
+            os.remove(connPath+suffix)
     return True
 
 def lDbExists(db):
@@ -139,19 +368,260 @@ def lDbNoRowFactory(cursor,row):
     return row
 
 def lDbRowFactory(cursor,row):
-    d = {}
-    for idx, col in enumerate(cursor.description):
-        if col[0] in ["metadata","media_info","parse_seq","source","conf","groups","label","verts","results"]:
-            d[col[0]] = json.loads(row[idx])
-        else:
-            d[col[0]] = row[idx]
-    return d
+    layout = dbUtils.rowLayout(cursor.description)
+
+    return dbUtils.lazyRow(layout,[row[i] for i in layout[3]])
+
+def lDbProjection(fields):
+    if fields is None:
+        return "*"
+    for field in fields:
+        if not field.isidentifier():
+            raise ValueError("Field "+str(field)+" is not a column name")
+
+    return ",".join(fields)
+
+def lDbSchemaVersion(cnn):
+    cursor = cnn.cursor()
+    cursor.row_factory = None
+
+    return cursor.execute("PRAGMA user_version").fetchone()[0]
+
+def lDbCreateExtensions(cnn):
+    # Runs once per database file; 'user_version' records the applied schema.
+    version = lDbSchemaVersion(cnn)
+    if version >= SCHEMA_VERSION:
+        return True
+
+    cursor = cnn.cursor()
+    legacyResampled = version < 2 and lDbRenameLegacyResampled(cnn)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS manifest (
+            path TEXT PRIMARY KEY,
+            size INTEGER NOT NULL,
+            mtime INTEGER NOT NULL,
+            md5 TEXT NOT NULL,
+            orid INTEGER,
+            FOREIGN KEY(orid) REFERENCES original(id)
+        )
+        """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS indexed_fields (
+            tbl TEXT NOT NULL,
+            path TEXT NOT NULL,
+            col TEXT NOT NULL,
+            PRIMARY KEY(tbl,path)
+        )
+        """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS annotations_orid ON annotations(orid)")
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS resampled_media (
+            md5 TEXT NOT NULL,
+            out_sr INTEGER NOT NULL,
+            chop DOUBLE NOT NULL,
+            thresh DOUBLE NOT NULL,
+            media_format TEXT NOT NULL,
+            out_dir TEXT NOT NULL,
+            orid INTEGER,
+            nchunks INTEGER NOT NULL,
+            creation TEXT NOT NULL,
+            PRIMARY KEY(md5,out_sr,chop,thresh,media_format,out_dir)
+        )
+        """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS resampled_chunks (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            md5 TEXT NOT NULL,
+            out_sr INTEGER NOT NULL,
+            chop DOUBLE NOT NULL,
+            thresh DOUBLE NOT NULL,
+            media_format TEXT NOT NULL,
+            out_dir TEXT NOT NULL,
+            orid INTEGER,
+            number INTEGER NOT NULL,
+            start_time DOUBLE NOT NULL,
+            end_time DOUBLE NOT NULL,
+            path TEXT NOT NULL,
+            UNIQUE(md5,out_sr,chop,thresh,media_format,out_dir,number)
+        )
+        """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS resampled_chunks_orid ON resampled_chunks(orid)")
+    if legacyResampled:
+        lDbCopyLegacyResampled(cnn)
+    cnn.commit()
+    lDbCreateAnnotationIndex(cnn)
+    cnn.execute("PRAGMA user_version = {version}".format(version=SCHEMA_VERSION))
+    cnn.commit()
+
+    return True
+
+def lDbRenameLegacyResampled(cnn):
+    # Resampling records written before 'out_dir' was part of their key.
+    cursor = cnn.cursor()
+    cursor.row_factory = None
+    columns = [row[1] for row in cursor.execute("PRAGMA table_info(resampled_media)")]
+    if len(columns) == 0 or "out_dir" in columns:
+        return False
+
+    cursor.execute("DROP INDEX IF EXISTS resampled_chunks_orid")
+    cursor.execute("ALTER TABLE resampled_media RENAME TO resampled_media_legacy")
+    cursor.execute("ALTER TABLE resampled_chunks RENAME TO resampled_chunks_legacy")
+
+    return True
+
+def lDbCopyLegacyResampled(cnn):
+    cursor = cnn.cursor()
+    cursor.row_factory = None
+    chunks = cursor.execute("""
+        SELECT md5,out_sr,chop,thresh,media_format,orid,number,start_time,end_time,path
+            FROM resampled_chunks_legacy
+        """).fetchall()
+    outDirs = {}
+    for row in chunks:
+        outDirs[row[:5]] = os.path.dirname(row[9])
+    cursor.executemany("""
+        INSERT INTO resampled_chunks (md5,out_sr,chop,thresh,media_format,out_dir,orid,number,start_time,end_time,path)
+            VALUES (?,?,?,?,?,?,?,?,?,?,?)
+        """,[row[:5]+(outDirs[row[:5]],)+row[5:] for row in chunks])
+    media = cursor.execute("""
+        SELECT md5,out_sr,chop,thresh,media_format,orid,nchunks,creation
+            FROM resampled_media_legacy
+        """).fetchall()
+    cursor.executemany("""
+        INSERT INTO resampled_media (md5,out_sr,chop,thresh,media_format,out_dir,orid,nchunks,creation)
+            VALUES (?,?,?,?,?,?,?,?,?)
+        """,[row[:5]+(outDirs[row[:5]],)+row[5:] for row in media if row[:5] in outDirs])
+    cursor.execute("DROP TABLE resampled_chunks_legacy")
+    cursor.execute("DROP TABLE resampled_media_legacy")
+
+    return True
+
+def lDbAnnotationBounds(prefix=""):
+    bounds = lDbBoundExpressions(prefix)
+
+    return ",".join([prefix+"id",bounds["min_time"],bounds["max_time"],bounds["min_freq"],bounds["max_freq"],prefix+"orid"])
+
+def lDbCreateAnnotationIndex(cnn):
+    # Rebuilt from scratch: earlier layouts stored unordered bounds.
+    cursor = cnn.cursor()
+    for trigger in ["insert","update","delete"]:
+        cursor.execute("DROP TRIGGER IF EXISTS annotations_rtree_"+trigger)
+    cursor.execute("DROP TABLE IF EXISTS annotations_rtree")
+
+    bounds = lDbAnnotationBounds("new.")
+    try:
+        cursor.execute("""
+            CREATE VIRTUAL TABLE annotations_rtree USING rtree(
+                id,
+                min_time,max_time,
+                min_freq,max_freq,
+                +orid
+            )
+            """)
+    except sqlite3.OperationalError as e:
+        print("Annotation index not available: "+str(e))
+        cnn.rollback()
+        return False
+
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS annotations_rtree_insert AFTER INSERT ON annotations
+        BEGIN
+            INSERT INTO annotations_rtree VALUES ({bounds});
+        END
+        """.format(bounds=bounds))
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS annotations_rtree_update AFTER UPDATE ON annotations
+        BEGIN
+            DELETE FROM annotations_rtree WHERE id = old.id;
+            INSERT INTO annotations_rtree VALUES ({bounds});
+        END
+        """.format(bounds=bounds))
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS annotations_rtree_delete AFTER DELETE ON annotations
+        BEGIN
+            DELETE FROM annotations_rtree WHERE id = old.id;
+        END
+        """)
+    cursor.execute("INSERT INTO annotations_rtree SELECT "+lDbAnnotationBounds()+" FROM annotations")
+    cnn.commit()
+
+    return True
+
+def lDbProfile(profile=None):
+    fullProfile = {"journal_mode":"WAL",
+                   "synchronous":"NORMAL",
+                   "cache_size":-65536,
+                   "mmap_size":268435456,
+                   "temp_store":"MEMORY",
+                   "busy_timeout":30000}
+    if profile is not None:
+        for key in profile:
+            if key not in fullProfile:
+                raise ValueError("Unknown pragma '"+str(key)+"' in connection profile")
+            value = profile[key]
+            if value is not None and not isinstance(value,int) and not str(value).isalnum():
+                raise ValueError("Wrong value for pragma '"+key+"': "+str(value))
+            fullProfile[key] = value
+
+    return fullProfile
+
+def lDbApplyProfile(db,cnn):
+    profile = getattr(db,"profile",None)
+    if profile is None:
+        return False
+    for key in profile:
+        if profile[key] is not None:
+            cnn.execute('PRAGMA {key} = {value}'.format(key=key,value=profile[key]))
+
+    return True
+
+@contextmanager
+def lDbBatch(db):
+    db.batchDepth += 1
+    try:
+        yield db
+    except BaseException:
+        db.batchDepth -= 1
+        if db.batchDepth == 0 and db.connection is not None:
+            db.connection.rollback()
+        raise
+    db.batchDepth -= 1
+    if db.batchDepth == 0:
+        db.connection.commit()
+
+def lDbCheckpoint(db):
+    if db.connection is not None and db.connPath != ":memory:":
+        lDbCommit(db)
+        db.connection.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+    return True
+
+def lDbCommit(db):
+    if getattr(db,"batchDepth",0) == 0:
+        db.connection.commit()
+
+    return True
+
+def lDbOpen(db):
+    return sqlite3.connect(db.connPath,cached_statements=512,check_same_thread=not getattr(db,"shared",False))
+
+def lDbShare(db):
+    if getattr(db,"shared",False):
+        return True
+    db.shared = True
+    if db.connection is not None:
+        lDbClose(db)
+        return lDbConnect(db)
+
+    return True
 
 def lDbConnect(db):
-    connPath = db.connPath
-    cnn = sqlite3.connect(connPath)
+    cnn = lDbOpen(db)
+    lDbApplyProfile(db,cnn)
+    lDbCreateExtensions(cnn)
     cnn.row_factory = lDbRowFactory
     db.connection = cnn
+    lDbLoadIndexedFields(db)
 
     return True
 
@@ -163,8 +633,8 @@ def lDbClose(db):
     return True
 
 def lDbCreateStructure(db):
-    connPath = db.connPath
-    cnn = sqlite3.connect(connPath)
+    cnn = lDbOpen(db)
+    lDbApplyProfile(db,cnn)
     cursor = cnn.cursor()
     cursor.execute("""
         CREATE TABLE IF NOT EXISTS datastores (
@@ -219,93 +689,183 @@ def lDbCreateStructure(db):
         )
         """)
     cnn.commit()
+    lDbCreateExtensions(cnn)
     cnn.row_factory = lDbRowFactory
 
     db.connection = cnn
+    lDbLoadIndexedFields(db)
 
     return True
 
-def lDbCreateFromDump(db,dump):
-    connPath = db.connPath
-    cnn = sqlite3.connect(connPath)
-    cursor = cnn.cursor()
+def lDbOpenDump(dumpPath,mode="r"):
+    if dumpPath.endswith(".gz"):
+        return gzip.open(dumpPath,mode+"t",encoding="utf-8")
 
-    statements = []
-    if not isinstance(dump,list):
-        sql = open(dump,'r')
-        strMem = ""
-        for line in sql:
-            strMem = strMem+line
-            if strMem[-2:-1] == ";":
-                statements.append(strMem)
-                strMem = ""
-
-        sql.close()
-    else:
-        statements = dump
+    return open(dumpPath,mode,encoding="utf-8")
 
-    for st in statements:
-        cursor.execute(st)
-
-    cnn.commit()
+def lDbReadStatements(dump):
+    if isinstance(dump,str):
+        sql = lDbOpenDump(dump,"r")
+        try:
+            strMem = []
+            for line in sql:
+                strMem.append(line)
+                if line.rstrip().endswith(";") and sqlite3.complete_statement("".join(strMem)):
+                    yield "".join(strMem)
+                    strMem = []
+            if len(strMem) > 0 and "".join(strMem).strip() != "":
+                raise ValueError("Dump ends with an incomplete statement")
+        finally:
+            sql.close()
+    else:
+        for st in dump:
+            yield st
+
+def lDbBackup(db,targetPath,overwrite=False,pages=4096):
+    if os.path.isfile(targetPath):
+        if not overwrite:
+            raise ValueError("File exists but 'overwrite' is False")
+        for suffix in ["","-wal","-shm"]:
+            if os.path.isfile(targetPath+suffix):
+                os.remove(targetPath+suffix)
+
+    lDbCommit(db)
+    target = sqlite3.connect(targetPath)
+    try:
+        db.connection.backup(target,pages=pages)
+    finally:
+        target.close()
+
+    return targetPath
+
+def lDbCreateFromDb(db,source):
+    cnn = lDbOpen(db)
+    lDbCommit(source)
+    source.connection.backup(cnn,pages=4096)
+    lDbApplyProfile(db,cnn)
+    lDbCreateExtensions(cnn)
     cnn.row_factory = lDbRowFactory
     db.connection = cnn
+    lDbLoadIndexedFields(db)
 
     return True
 
+def lDbCreateFromDump(db,dump):
+    if hasattr(dump,"connection"):
+        return lDbCreateFromDb(db,dump)
 
+    cnn = lDbOpen(db)
+    lDbApplyProfile(db,cnn)
+    cursor = cnn.cursor()
 
-def lDbParseSeqConcat(row,parseSeq,parsers=None,parsersDir=None):
-    orid = row["orid"]
-    metadata = row["metadata"]
-    metadata = dbUtils.sequentialTransform(metadata,parseSeq,parsers,parsersDir)
-    parse_seq = row["parse_seq"] + parseSeq
+    for st in lDbReadStatements(dump):
+        if st.strip() in ("BEGIN TRANSACTION;","COMMIT;"):
+            continue
+        cursor.execute(st)
 
-    return orid,metadata,parse_seq
+    cnn.commit()
+    lDbCreateExtensions(cnn)
+    cnn.row_factory = lDbRowFactory
+    db.connection = cnn
+    lDbLoadIndexedFields(db)
+
+    return True
 
-def lDbParseSeqOverwrite(row,cursor,parseSeq,parsers=None,parsersDir=None):
-    orid = row["orid"]
-    oriItem = cursor.execute('SELECT * FROM {tn} WHERE id = {orid}'.format(tn="original",orid=orid)).fetchone()
-    metadata = oriItem["metadata"]
-    metadata = dbUtils.sequentialTransform(metadata,parseSeq,parsers,parsersDir)
-    parse_seq = parseSeq
 
-    return orid,metadata,parse_seq
 
-def lDbUpdateParseSeq(db,parseSeq,orid=None,whereSt=None,operation="append"):
-    parsers = db.parsers
-    parsersDir = db.parsersDir
-    cnn = db.connection
-    cursor = cnn.cursor()
+def lDbParseSeqChunks(db,orid=None,whereSt=None,operation="append",params=(),chunkSize=1000):
+    cursor = db.connection.cursor()
 
     if whereSt is not None:
-        matches = cursor.execute('SELECT * FROM {tn} WHERE {whereSt}'.format(tn="parsed",whereSt=whereSt)).fetchall()
+        statement = 'SELECT orid,parse_seq,metadata FROM {tn} WHERE ({whereSt}) AND orid > ? ORDER BY orid LIMIT ?'.format(tn="parsed",whereSt=whereSt)
     elif orid is not None:
-        matches = cursor.execute('SELECT * FROM {tn} WHERE orid = {orid}'.format(tn="parsed",orid=orid)).fetchall()
+        statement = 'SELECT orid,parse_seq,metadata FROM {tn} WHERE orid = ? AND orid > ? ORDER BY orid LIMIT ?'.format(tn="parsed")
+        params = (orid,)
     else:
-        matches = cursor.execute('SELECT * FROM {tn}'.format(tn="parsed",whereSt=whereSt)).fetchall()
-
-    if operation == "append":
-        for row in matches:
-            orid,metadata,parse_seq = lDbParseSeqConcat(row,parseSeq,parsers=parsers,parsersDir=parsersDir)
-            cursor.execute('UPDATE {tn} SET parse_seq = ?, metadata = ? WHERE orid = {orid}'.format(tn="parsed",orid=orid),(json.dumps(parse_seq),json.dumps(metadata)))
-
-    elif operation == "overwrite":
-        for row in matches:
-            orid,metadata,parse_seq = lDbParseSeqOverwrite(row,cursor,parseSeq,parsers=parsers,parsersDir=parsersDir)
-            cursor.execute('UPDATE {tn} SET parse_seq = ?, metadata = ? WHERE orid = {orid}'.format(tn="parsed",orid=orid),(json.dumps(parse_seq),json.dumps(metadata)))
-    else:
-        raise ValueError("Operation "+str(operation)+" not found.")
-
-    cnn.commit()
+        statement = 'SELECT orid,parse_seq,metadata FROM {tn} WHERE orid > ? ORDER BY orid LIMIT ?'.format(tn="parsed")
+        params = ()
+
+    lastOrid = -1
+    while True:
+        rows = cursor.execute(statement,tuple(params)+(lastOrid,chunkSize)).fetchall()
+        if len(rows) == 0:
+            break
+        lastOrid = rows[-1]["orid"]
+
+        if operation == "overwrite":
+            orids = [row["orid"] for row in rows]
+            originals = cursor.execute('SELECT id,metadata FROM {tn} WHERE id IN ({marks})'.format(tn="original",marks=",".join(["?"]*len(orids))),orids).fetchall()
+            originals = {row["id"]:row["metadata"] for row in originals}
+            chunk = [(row["orid"],originals[row["orid"]]) for row in rows]
+        else:
+            chunk = [(row["orid"],row["metadata"]) for row in rows]
 
-    return True
+        yield chunk,{row["orid"]:row["parse_seq"] for row in rows}
 
-def lDbTimedInsert(db,dataArray,parseSeq,timeField,tzField,format='%d-%m-%Y %H:%M:%S'):
-    return db.insert(dataArray,parseSeq,timeConf={"timeField":timeField,"tzField":tzField,"format":format})
+def lDbPoolTransform(executor,jobs,workers):
+    with executor:
+        for result in boundedMap(executor,dbUtils.transformChunk,jobs,2*workers):
+            yield result
 
+def lDbUpdateParseSeq(db,parseSeq,orid=None,whereSt=None,operation="append",params=(),chunkSize=1000,workers=None):
+    if operation not in ["append","overwrite"]:
+        raise ValueError("Operation "+str(operation)+" not found.")
 
-def lDbCrossSelectAnn(db,query,media_fields,subgroup=None):
+    resolved = dbUtils.resolveParseSeq(parseSeq,db.parsers,db.parsersDir)
+    cursor = db.connection.cursor()
+    report = {"updated":0,"failed":[]}
+    parseSeqs = {}
+
+    def chunks():
+        for chunk,seqs in lDbParseSeqChunks(db,orid,whereSt,operation,params,chunkSize):
+            parseSeqs.update(seqs)
+            yield chunk
+
+    if workers is None or not dbUtils.isPureParseSeq(parseSeq,resolved):
+        transformed = (dbUtils.transformChunk(chunk,parseSeq,resolved=resolved) for chunk in chunks())
+    elif db.parsers is None:
+        jobs = ((chunk,parseSeq,None,db.parsersDir) for chunk in chunks())
+        transformed = lDbPoolTransform(ProcessPoolExecutor(max_workers=workers),jobs,workers)
+    else:
+        jobs = ((chunk,parseSeq,None,None,resolved) for chunk in chunks())
+        transformed = lDbPoolTransform(ThreadPoolExecutor(max_workers=workers),jobs,workers)
+
+    with lDbBatch(db):
+        for result in transformed:
+            updates = []
+            for rowOrid,metadata,error in result:
+                oldParseSeq = parseSeqs.pop(rowOrid)
+                if error is not None:
+                    print("Error transforming metadata :",rowOrid,error)
+                    report["failed"].append(rowOrid)
+                    continue
+                newParseSeq = parseSeq
+                if operation == "append":
+                    newParseSeq = oldParseSeq + parseSeq
+                updates.append((json.dumps(newParseSeq),json.dumps(metadata),rowOrid))
+
+            cursor.executemany('UPDATE {tn} SET parse_seq = ?, metadata = ? WHERE orid = ?'.format(tn="parsed"),updates)
+            report["updated"] += len(updates)
+            print("Transformed rows: "+str(report["updated"])+" ("+str(len(report["failed"]))+" failed)")
+
+    return report
+
+def lDbTimedInsert(db,dataArray,parseSeq,timeField,tzField,format='%d-%m-%Y %H:%M:%S',workers=None,batchSize=1000,processes=False,incremental=True,prefetch=None):
+    return db.insert(dataArray,parseSeq,timeConf={"timeField":timeField,"tzField":tzField,"format":format},workers=workers,batchSize=batchSize,processes=processes,incremental=incremental,prefetch=prefetch)
+
+
+def lDbCrossSelectAnn(db,query,media_fields,subgroup=None,lazy=False,batchSize=1000,limit=None,token=None):
+    whereSt,params = lDbCompileQuery(query,db,"annotations")
+    if whereSt is None:
+        whereSt = "1"
+    pageSt = ""
+    if token is not None:
+        value,lastOrid = lDbReadPageToken(token,"annotatedMedia",None)
+        whereSt = "("+whereSt+") AND orid > ?"
+        params = tuple(params)+(lastOrid,)
+    if limit is not None:
+        pageSt = " ORDER BY a.orid LIMIT ?"
+        params = tuple(params)+(int(limit),)
     extra_group_by = ""
     extra_group_att = ""
     if subgroup is not None:
@@ -356,9 +916,9 @@ def lDbCrossSelectAnn(db,query,media_fields,subgroup=None):
                     "'verts',json(verts),'wkt',wkt,'label',json(label),'groups'," + \
                     "json(groups),'metadata',json(metadata)))) as ann_group " + \
                     "FROM annotations WHERE " + \
-                    lDbParseQuery(query) + " GROUP BY orid,"+extra_group_by+") as a " +\
+                    whereSt + " GROUP BY orid,"+extra_group_by+") as a " +\
                     "INNER JOIN parsed as b " + \
-                    "ON a.orid = b.orid GROUP BY a.orid"
+                    "ON a.orid = b.orid GROUP BY a.orid" + pageSt
     else:
         statement = "json_object('orid', a.orid, 'media_info'," + \
                     "json(b.media_info)" + media_att + \
@@ -370,9 +930,20 @@ def lDbCrossSelectAnn(db,query,media_fields,subgroup=None):
                     "'verts',json(a.verts),'wkt',a.wkt,'label',json(a.label),'groups'," + \
                     "json(a.groups),'metadata',json(a.metadata)))) as results " + \
                     "FROM (SELECT * FROM annotations WHERE " + \
-                    lDbParseQuery(query) + ") as a INNER JOIN parsed as b " + \
-                    "ON a.orid = b.orid GROUP BY a.orid"
-    return db.select(freeSt=statement)
+                    whereSt + ") as a INNER JOIN parsed as b " + \
+                    "ON a.orid = b.orid GROUP BY a.orid" + pageSt
+    return db.select(freeSt=statement,params=params,lazy=lazy,batchSize=batchSize)
+
+
+def lDbCrossSelectAnnPage(db,query,media_fields,subgroup=None,limit=100,token=None):
+    if limit is None or int(limit) <= 0:
+        raise ValueError("'limit' should be a positive integer")
+    rows = lDbCrossSelectAnn(db,query,media_fields,subgroup,limit=limit,token=token)
+    nextToken = None
+    if len(rows) == int(limit):
+        nextToken = lDbPageToken("annotatedMedia",None,None,rows[-1]["results"]["orid"])
+
+    return rows,nextToken
 
 
 def lDbAnnotate(db,dataArray):
@@ -409,169 +980,648 @@ def lDbAnnotate(db,dataArray):
            print("Error inserting annotation :",dataObj)
 
 
-    cnn.commit()
+    lDbCommit(db)
 
     return True
 
-def lDbInsert(db,dataArray,parseSeq=[],timeConf=None):
-
-
-    parsers = db.parsers
-    parsersDir = db.parsersDir
-    cnn = db.connection
-    cursor = cnn.cursor()
+def lDbInsertJobs(db,cursor,dataArray,parseSeq,dsIds,incremental=True):
+    resolveError = None
+    try:
+        resolved = dbUtils.resolveParseSeq(parseSeq,db.parsers,db.parsersDir)
+    except Exception as e:
+        resolveError = e
 
     for dataObj in dataArray:
+        job = {"dataObj":dataObj,"original":None,"error":None,"md5":None,"status":None}
         try:
             dsconf = dataObj["datastore"]
             source = dataObj["source"]
             rawMetadata = dataObj["metadata"]
 
-            dsmatches = cursor.execute('SELECT * FROM {tn} WHERE hash = {hash}'.format(tn="datastores",hash="'"+dsconf["hash"]+"'")).fetchall()
+            if dsconf["hash"] not in dsIds:
+                dsmatch = cursor.execute('SELECT id FROM datastores WHERE hash = ?',(dsconf["hash"],)).fetchone()
 
-            if len(dsmatches) > 0:
-                source["source_id"] = dsmatches[0]["id"]
-            else:
-                cursor.execute("""
-                    INSERT INTO datastores (hash,type,conf,metadata)
-                        VALUES (?,?,?,?)
-                    """, (dsconf["hash"],dsconf["type"],json.dumps(dsconf["conf"]),json.dumps(dsconf["metadata"])))
+                if dsmatch is not None:
+                    dsIds[dsconf["hash"]] = dsmatch["id"]
+                else:
+                    cursor.execute("""
+                        INSERT INTO datastores (hash,type,conf,metadata)
+                            VALUES (?,?,?,?)
+                        """, (dsconf["hash"],dsconf["type"],json.dumps(dsconf["conf"]),json.dumps(dsconf["metadata"])))
 
-                source["source_id"] = cursor.lastrowid
+                    dsIds[dsconf["hash"]] = cursor.lastrowid
 
+            source["source_id"] = dsIds[dsconf["hash"]]
+            job["original"] = (json.dumps(source),json.dumps(rawMetadata))
 
-            cursor.execute("""
-                INSERT INTO original (source,metadata)
-                    VALUES (?,?)
-                """, (json.dumps(source),json.dumps(rawMetadata)))
+            if resolveError is not None:
+                raise resolveError
+            metadata = dbUtils.applyParsers(dataObj["metadata"],resolved)
 
-            orid = cursor.lastrowid
-            metadata = dataObj["metadata"]
-            metadata = dbUtils.sequentialTransform(metadata,parseSeq,parsers,parsersDir)
+            job["metadata"] = metadata
+            job["path"] = metadata["path"]
+            job["timeexp"] = metadata["timeexp"]
 
+            if "md5" in metadata:
+                job["md5"] = metadata["md5"]
+            if "wav_info" in metadata:
+                job["wavInfo"] = metadata["wav_info"]
+
+            fstat = os.stat(job["path"])
+            job["size"] = fstat.st_size
+            job["mtime"] = fstat.st_mtime_ns
+            known = cursor.execute("""
+                SELECT m.size,m.mtime,m.orid FROM manifest m
+                    JOIN parsed p ON p.orid = m.orid
+                    WHERE m.path = ?
+                """,(job["path"],)).fetchone()
+
+            if known is None:
+                job["status"] = "new"
+            elif incremental and known["size"] == job["size"] and known["mtime"] == job["mtime"]:
+                job["status"] = "skipped"
+                job["original"] = None
+            else:
+                job["status"] = "changed"
+                job["knownOrid"] = known["orid"]
+        except Exception as e:
+            job["error"] = e
+
+        yield (job,)
+
+def lDbNextId(cursor,table):
+    seq = cursor.execute("SELECT seq FROM sqlite_sequence WHERE name = ?",(table,)).fetchone()
+    maxId = cursor.execute("SELECT max(id) AS maxid FROM {tn}".format(tn=table)).fetchone()
+    lastId = 0
+    if seq is not None and seq["seq"] is not None:
+        lastId = seq["seq"]
+    if maxId["maxid"] is not None:
+        lastId = max(lastId,maxId["maxid"])
+
+    return lastId+1
+
+def lDbParsedRow(job,parseSeq):
+    return (job["md5"],job["path"],job["path"],json.dumps(parseSeq),json.dumps(job["media_info"]),json.dumps(job["metadata"]))
+
+def lDbUpdateChanged(cursor,job,parseSeq):
+    # Rewrites the rows of a file whose content or stat changed in place.
+    orid = job["knownOrid"]
+    if orid is None or cursor.execute("SELECT orid FROM parsed WHERE orid = ?",(orid,)).fetchone() is None:
+        job["status"] = "new"
+        return False
 
+    cursor.execute("""
+        UPDATE OR IGNORE parsed SET md5 = ?,path = ?,original_path = ?,parse_seq = ?,media_info = ?,metadata = ?
+            WHERE orid = ?
+        """,lDbParsedRow(job,parseSeq)+(orid,))
+    if cursor.rowcount == 0:
+        # New content already belongs to another media: the stale row goes away.
+        cursor.execute("DELETE FROM parsed WHERE orid = ?",(orid,))
+        cursor.execute("DELETE FROM original WHERE id = ?",(orid,))
+        job["status"] = "new"
+        return False
 
+    cursor.execute("UPDATE original SET source = ?,metadata = ? WHERE id = ?",job["original"]+(orid,))
+    job["orid"] = orid
 
-            path = metadata["path"]
-            timeexp = metadata["timeexp"]
+    return True
 
-            md5 = None
-            if "md5" in metadata:
-                md5 = metadata["md5"]
+def lDbInsertBatch(db,cursor,batch,parseSeq,report):
+    valid = [job for job in batch if job["error"] is None and job["status"] != "skipped"]
+    for job in valid:
+        if job["status"] == "changed":
+            lDbUpdateChanged(cursor,job,parseSeq)
+
+    fresh = []
+    seen = {}
+    for job in valid:
+        if job["status"] != "new":
+            continue
+        existing = cursor.execute("SELECT orid FROM parsed WHERE md5 = ?",(job["md5"],)).fetchone()
+        if existing is not None:
+            job["orid"] = existing["orid"]
+            job["status"] = "skipped"
+        elif job["md5"] in seen:
+            job["duplicateOf"] = seen[job["md5"]]
+            job["status"] = "skipped"
+        else:
+            seen[job["md5"]] = job
+            fresh.append(job)
+
+    if len(fresh) > 0:
+        nextId = lDbNextId(cursor,"original")
+        for job in fresh:
+            job["orid"] = nextId
+            nextId += 1
+
+    statement = """
+        INSERT INTO parsed (orid,md5,path,original_path,parse_seq,media_info,metadata)
+            VALUES (?,?,?,?,?,?,?)
+        """
+    try:
+        cursor.execute("SAVEPOINT parsed_batch")
+        cursor.executemany(statement,[(job["orid"],)+lDbParsedRow(job,parseSeq) for job in fresh])
+        cursor.execute("RELEASE SAVEPOINT parsed_batch")
+    except sqlite3.Error:
+        cursor.execute("ROLLBACK TO SAVEPOINT parsed_batch")
+        cursor.execute("RELEASE SAVEPOINT parsed_batch")
+        for job in fresh:
+            try:
+                cursor.execute(statement,(job["orid"],)+lDbParsedRow(job,parseSeq))
+            except sqlite3.Error as e:
+                job["error"] = e
+
+    cursor.executemany("""
+        INSERT INTO original (id,source,metadata)
+            VALUES (?,?,?)
+        """, [(job["orid"],)+job["original"] for job in fresh if job["error"] is None])
+
+    for job in valid:
+        if "duplicateOf" in job:
+            if job["duplicateOf"]["error"] is None:
+                job["orid"] = job["duplicateOf"]["orid"]
+            else:
+                job["error"] = job["duplicateOf"]["error"]
 
-            media_info,md5 = dbUtils.describeAudio(path,timeexp,md5)
-            media_info["md5"] = md5
+    cursor.executemany("""
+        INSERT OR REPLACE INTO manifest (path,size,mtime,md5,orid)
+            VALUES (?,?,?,?,?)
+        """, [(job["path"],job["size"],job["mtime"],job["md5"],job["orid"]) for job in valid if job["error"] is None])
 
-            if timeConf is not None:
-                timeField = timeConf["timeField"]
-                tzField = timeConf["tzField"]
-                format = timeConf["format"]
-                metadata = dbUtils.getTimeFields(metadata,media_info,timeField,tzField,format)
+    for job in batch:
+        if job["error"] is not None:
+            print("Error inserting metadata :",job["dataObj"])
+            report["errors"] += 1
+        else:
+            report[job["status"]] += 1
 
-            cursor.execute("""
-                INSERT OR IGNORE INTO parsed (orid,md5,path,original_path,parse_seq,media_info,metadata)
-                    VALUES (?,?,?,?,?,?,?)
-                """, (orid,md5,path,path,json.dumps(parseSeq),json.dumps(media_info),json.dumps(metadata)))
-        except:
-           print("Error inserting metadata :",dataObj)
+    lDbCommit(db)
 
+    return True
 
+def lDbPipelineReport(stats,writeSeconds,batches,elapsed):
+    def rate(items,seconds):
+        if seconds <= 0:
+            return None
+        return items/seconds
+
+    return {"elapsed":elapsed,
+            "source":{"items":stats["produced"],"seconds":stats["sourceSeconds"],
+                      "rate":rate(stats["produced"],stats["sourceSeconds"])},
+            "queue":{"producerWait":stats["producerWaitSeconds"],"consumerWait":stats["consumerWaitSeconds"]},
+            "write":{"items":stats["consumed"],"batches":batches,"seconds":writeSeconds,
+                     "rate":rate(stats["consumed"],writeSeconds)},
+            "throughput":rate(stats["consumed"],elapsed)}
+
+def lDbInsert(db,dataArray,parseSeq=[],timeConf=None,workers=None,batchSize=1000,processes=False,incremental=True,prefetch=None):
+    cnn = db.connection
+    cursor = cnn.cursor()
+    dsIds = {}
+    report = {"new":0,"changed":0,"skipped":0,"errors":0}
+    stats = None
+    if prefetch is not None:
+        stats = {}
+        dataArray = prefetchIterator(dataArray,prefetch,stats)
+    started = time.perf_counter()
+    writeSeconds = 0.0
+    batches = 0
+
+    if workers is None:
+        workers = min(32,(os.cpu_count() or 1)+4)
+
+    if processes:
+        executor = ProcessPoolExecutor(max_workers=workers)
+    else:
+        executor = ThreadPoolExecutor(max_workers=workers)
 
-    cnn.commit()
+    batch = []
+    with executor:
+        jobs = lDbInsertJobs(db,cursor,dataArray,parseSeq,dsIds,incremental)
+        try:
+            for job in boundedMap(executor,dbUtils.describeJob,jobs,4*workers):
+                if job["error"] is None and job["status"] != "skipped" and timeConf is not None:
+                    try:
+                        timeField = timeConf["timeField"]
+                        tzField = timeConf["tzField"]
+                        format = timeConf["format"]
+                        job["metadata"] = dbUtils.getTimeFields(job["metadata"],job["media_info"],timeField,tzField,format)
+                    except Exception as e:
+                        job["error"] = e
+
+                batch.append(job)
+                if len(batch) >= batchSize:
+                    start = time.perf_counter()
+                    lDbInsertBatch(db,cursor,batch,parseSeq,report)
+                    writeSeconds += time.perf_counter()-start
+                    batches += 1
+                    batch = []
+        finally:
+            if prefetch is not None:
+                dataArray.close()
+
+    start = time.perf_counter()
+    lDbInsertBatch(db,cursor,batch,parseSeq,report)
+    writeSeconds += time.perf_counter()-start
+    batches += 1
+    if stats is not None:
+        report["pipeline"] = lDbPipelineReport(stats,writeSeconds,batches,time.perf_counter()-started)
+    print("Inserted files:",report)
+
+    return report
+
+def lDbResampledDone(db,out_sr,chop,thresh,media_format,out_dir):
+    cursor = db.connection.cursor()
+    cursor.execute("""
+        SELECT md5 FROM resampled_media
+            WHERE out_sr = ? AND chop = ? AND thresh = ? AND media_format = ? AND out_dir = ?
+        """,(out_sr,chop,thresh,media_format,os.path.abspath(out_dir)))
+
+    return set([row["md5"] for row in cursor])
+
+def lDbRecordResampled(db,md5,orid,out_sr,chop,thresh,media_format,out_dir,chunks):
+    key = (md5,out_sr,chop,thresh,media_format,os.path.abspath(out_dir))
+    cursor = db.connection.cursor()
+    with lDbBatch(db):
+        cursor.execute("""
+            DELETE FROM resampled_chunks
+                WHERE md5 = ? AND out_sr = ? AND chop = ? AND thresh = ? AND media_format = ? AND out_dir = ?
+            """,key)
+        cursor.executemany("""
+            INSERT INTO resampled_chunks (md5,out_sr,chop,thresh,media_format,out_dir,orid,number,start_time,end_time,path)
+                VALUES (?,?,?,?,?,?,?,?,?,?,?)
+            """,[key+(orid,chunk["number"],chunk["tlimits"][0],chunk["tlimits"][1],chunk["path"]) for chunk in chunks])
+        cursor.execute("""
+            INSERT OR REPLACE INTO resampled_media (md5,out_sr,chop,thresh,media_format,out_dir,orid,nchunks,creation)
+                VALUES (?,?,?,?,?,?,?,?,?)
+            """,key+(orid,len(chunks),time.strftime("%d-%m-%Y %H:%M:%S",time.gmtime())))
 
     return True
 
-def lDbFind(db,orid=None,query=None, table="parsed"):
-    wStatement = None
-    if query is not None:
-        wStatement = lDbParseQuery(query)
+def lDbResampledChunks(db,out_sr=None,chop=None,orid=None,md5=None,lazy=False,batchSize=1000,out_dir=None):
+    conditions = []
+    params = []
+    if out_dir is not None:
+        out_dir = os.path.abspath(out_dir)
+    for column,value in [("out_sr",out_sr),("chop",chop),("orid",orid),("md5",md5),("out_dir",out_dir)]:
+        if value is not None:
+            conditions.append(column+" = ?")
+            params.append(value)
+    whereSt = None
+    if len(conditions) > 0:
+        whereSt = " AND ".join(conditions)
+
+    return lDbSelect(db,whereSt=whereSt,table="resampled_chunks",params=tuple(params),lazy=lazy,batchSize=batchSize)
+
+def lDbFind(db,orid=None,query=None, table="parsed",lazy=False,batchSize=1000,fields=None):
+    wStatement,params = lDbCompileQuery(query,db,table)
+
+    return lDbSelect(db,orid,wStatement,table=table,params=params,lazy=lazy,batchSize=batchSize,fields=fields)
+
+def lDbPageKey(table):
+    if table == "parsed":
+        return "orid"
+    return "id"
+
+def lDbPageToken(table,orderBy,value,key):
+    data = json.dumps({"table":table,"orderBy":orderBy,"value":value,"key":key})
+
+    return base64.urlsafe_b64encode(data.encode("utf-8")).decode("ascii")
+
+def lDbReadPageToken(token,table,orderBy):
+    try:
+        data = json.loads(base64.urlsafe_b64decode(token.encode("ascii")).decode("utf-8"))
+    except Exception:
+        raise ValueError("Malformed page token")
+    if data["table"] != table or data["orderBy"] != orderBy:
+        raise ValueError("Page token does not belong to this query (table or orderBy changed)")
+
+    return data["value"],data["key"]
+
+def lDbPageOrder(db,table,orderBy):
+    key = lDbPageKey(table)
+    desc = False
+    expr = None
+    if orderBy is not None:
+        field = orderBy
+        if field[0] == "-":
+            desc = True
+            field = field[1:]
+        if re.match(r"^[A-Za-z_]\w*(\.\w+)*$",field) is None:
+            raise ValueError("Can not order by "+str(orderBy))
+        if field != key:
+            expr = lDbFieldExpression(field,("$eq",),lDbIndexedPaths(db,table))
+
+    return key,expr,desc
+
+def lDbFindPage(db,query=None,table="parsed",limit=100,orderBy=None,token=None,fields=None):
+    if limit is None or int(limit) <= 0:
+        raise ValueError("'limit' should be a positive integer")
+    limit = int(limit)
+    key,expr,desc = lDbPageOrder(db,table,orderBy)
+    whereSt,params = lDbCompileQuery(query,db,table)
+    params = list(params)
+
+    if fields is not None and key not in fields:
+        fields = [key]+list(fields)
+    projection = lDbProjection(fields)
+
+    conditions = []
+    if whereSt is not None:
+        conditions.append("("+whereSt+")")
 
-    return lDbSelect(db,orid,wStatement,table=table)
+    comp = ">"
+    direction = ""
+    if desc:
+        comp = "<"
+        direction = " DESC"
 
-def lDbSelect(db,orid=None,whereSt=None,freeSt=None,table="parsed"):
+    if expr is None:
+        order = key+direction
+    else:
+        projection += ","+expr+" AS _page_value"
+        order = "("+expr+" IS NULL),"+expr+direction+","+key+direction
+
+    if token is not None:
+        value,lastKey = lDbReadPageToken(token,table,orderBy)
+        if expr is None:
+            conditions.append(key+" "+comp+" ?")
+            params += [lastKey]
+        elif value is None:
+            conditions.append("("+expr+" IS NULL AND "+key+" "+comp+" ?)")
+            params += [lastKey]
+        else:
+            conditions.append("("+expr+" IS NULL OR "+expr+" "+comp+" ? OR ("+expr+" = ? AND "+key+" "+comp+" ?))")
+            params += [value,value,lastKey]
+
+    statement = 'SELECT {cols} FROM {tn}'.format(cols=projection,tn=table)
+    if len(conditions) > 0:
+        statement += " WHERE "+" AND ".join(conditions)
+    statement += " ORDER BY "+order+" LIMIT ?"
+    params.append(limit)
+
+    rows = db.connection.cursor().execute(statement,params).fetchall()
+    nextToken = None
+    if len(rows) > 0:
+        last = rows[-1]
+        value = None
+        if expr is not None:
+            value = last["_page_value"]
+        if len(rows) == limit:
+            nextToken = lDbPageToken(table,orderBy,value,last[key])
+    if expr is not None:
+        for row in rows:
+            del row["_page_value"]
+
+    return rows,nextToken
+
+def lDbIterCursor(cursor,batchSize=1000):
+    try:
+        while True:
+            rows = cursor.fetchmany(batchSize)
+            if len(rows) == 0:
+                break
+            for row in rows:
+                yield row
+    finally:
+        cursor.close()
+
+def lDbSelect(db,orid=None,whereSt=None,freeSt=None,table="parsed",params=(),lazy=False,batchSize=1000,fields=None):
     cnn = db.connection
     cursor = cnn.cursor()
+    projection = lDbProjection(fields)
 
     if freeSt is not None:
-        matches = cursor.execute('SELECT {freeSt}'.format(freeSt=freeSt)).fetchall()
+        cursor.execute('SELECT {freeSt}'.format(freeSt=freeSt),params)
     else:
         if whereSt is not None:
-            matches = cursor.execute('SELECT * FROM {tn} WHERE {whereSt}'.format(tn=table,whereSt=whereSt)).fetchall()
+            cursor.execute('SELECT {cols} FROM {tn} WHERE {whereSt}'.format(cols=projection,tn=table,whereSt=whereSt),params)
         elif orid is not None:
-            matches = cursor.execute('SELECT * FROM {tn} WHERE orid = {orid}'.format(tn=table,orid=orid)).fetchall()
+            cursor.execute('SELECT {cols} FROM {tn} WHERE orid = ?'.format(cols=projection,tn=table),(orid,))
         else:
-            matches = cursor.execute('SELECT * FROM {tn}'.format(tn=table)).fetchall()
+            cursor.execute('SELECT {cols} FROM {tn}'.format(cols=projection,tn=table))
 
-    return matches
+    if lazy:
+        return lDbIterCursor(cursor,batchSize)
 
-def lDbCount(db,where=None,query=None,groupby=None,table="parsed"):
+    return cursor.fetchall()
+
+def lDbCount(db,where=None,query=None,groupby=None,table="parsed",params=()):
 
     whereSt = None
     if where is not None:
         whereSt = where
     elif query is not None:
-        whereSt = lDbParseQuery(query)
+        whereSt,params = lDbCompileQuery(query,db,table)
 
     cnn = db.connection
     cursor = cnn.cursor()
 
     if whereSt is not None:
-        dcount = cursor.execute('SELECT count(*) as count FROM {tn} WHERE {whereSt}'.format(tn=table,whereSt=whereSt)).fetchone()
+        dcount = cursor.execute('SELECT count(*) as count FROM {tn} WHERE {whereSt}'.format(tn=table,whereSt=whereSt),params).fetchone()
     else:
         dcount = cursor.execute('SELECT count(*) as count FROM {tn}'.format(tn=table,whereSt=whereSt)).fetchone()
 
     return dcount
 
-def lDbRemove(db,orid=None,where=None,query=None,table="parsed"):
+def lDbRemove(db,orid=None,where=None,query=None,table="parsed",params=()):
 
     if where is not None:
-        matches = lDbSelect(db,orid,where,table=table)
+        matches = lDbSelect(db,orid,where,table=table,params=params)
     else:
         matches = lDbFind(db,orid,query,table=table)
 
     cnn = db.connection
     cursor = cnn.cursor()
-    for row in matches:
-        cursor.execute('DELETE FROM {tn} WHERE orid = {orid}'.format(tn="parsed",orid=row["orid"]))
-        cursor.execute('DELETE FROM {tn} WHERE orid = {orid}'.format(tn="original",orid=row["orid"]))
+    orids = [(row["orid"],) for row in matches]
+    cursor.executemany('DELETE FROM {tn} WHERE orid = ?'.format(tn="parsed"),orids)
+    cursor.executemany('DELETE FROM {tn} WHERE id = ?'.format(tn="original"),orids)
+    cursor.executemany('DELETE FROM {tn} WHERE orid = ?'.format(tn="manifest"),orids)
 
-    cnn.commit()
+    lDbCommit(db)
     return matches
 
 def lDbUpdateField(db,field,value,orid=None,query=None,table="parsed"):
-    whereSt = lDbParseQuery(query)
+    whereSt,params = lDbCompileQuery(query,db,table)
     cnn = db.connection
     cursor = cnn.cursor()
 
     if whereSt is not None:
-        cursor.execute('UPDATE {tn} SET {field} = ? WHERE {whereSt}'.format(tn=table,field=field,whereSt=whereSt),(value,))
+        cursor.execute('UPDATE {tn} SET {field} = ? WHERE {whereSt}'.format(tn=table,field=field,whereSt=whereSt),(value,)+params)
     elif orid is not None:
-        cursor.execute('UPDATE {tn} SET {field} = ? WHERE orid = {orid}'.format(tn=table,field=field,orid=orid),(value,))
+        cursor.execute('UPDATE {tn} SET {field} = ? WHERE orid = ?'.format(tn=table,field=field),(value,orid))
     else:
         cursor.execute('UPDATE {tn} SET {field} = ?'.format(tn=table,field=field),(value,))
 
-    cnn.commit()
+    lDbCommit(db)
 
     return True
 
-def lDbMerge(db1,db2,mergePath,conf1={'parseSeq':[],'operation':'concat'},conf2={'parseSeq':[],'operation':'concat'}):
-    pass
+def lDbUpdatePaths(db,rows,table="parsed"):
+    # rows: (orid, original_path, path, media_info)
+    cursor = db.connection.cursor()
+    with lDbBatch(db):
+        cursor.executemany('UPDATE {tn} SET original_path = ?, path = ?, media_info = ? WHERE orid = ?'.format(tn=table),
+                           ((originalPath,path,json.dumps(mediaInfo),orid) for orid,originalPath,path,mediaInfo in rows))
 
-def lDbAsStatements(db):
+    return True
+
+def lDbAttach(db,source,alias="merged"):
+    tmpPath = None
+    srcPath = source.connPath
+    if srcPath == ":memory:":
+        fd,tmpPath = tempfile.mkstemp(suffix=".sqlite")
+        os.close(fd)
+        lDbBackup(source,tmpPath,overwrite=True)
+        srcPath = tmpPath
+    else:
+        lDbCommit(source)
+
+    db.connection.commit()
+    db.connection.execute("ATTACH DATABASE ? AS "+alias,(srcPath,))
+
+    return tmpPath
+
+def lDbDetach(db,tmpPath=None,alias="merged"):
+    db.connection.commit()
+    db.connection.execute("DETACH DATABASE "+alias)
+    if tmpPath is not None:
+        for suffix in ["","-wal","-shm"]:
+            if os.path.isfile(tmpPath+suffix):
+                os.remove(tmpPath+suffix)
+
+    return True
+
+def lDbMergeTransform(db,conf,whereSt):
+    if conf is None or len(conf.get("parseSeq",[])) == 0:
+        return None
+
+    return lDbUpdateParseSeq(db,conf["parseSeq"],whereSt=whereSt,operation=conf.get("operation","append"),chunkSize=conf.get("chunkSize",1000),workers=conf.get("workers"))
+
+def lDbMerge(db1,db2,conf1=None,conf2=None,mediaDir=None):
+    # mediaDir: directory against which db2's relative media paths are made absolute
+    if db1.batchDepth > 0:
+        raise ValueError("Databases can not be merged inside a batch")
+
+    report = {"datastores":0,"media":0,"duplicates":0,"annotations":0,"orphans":0}
+    if mediaDir is None:
+        pathSt = "p.path"
+        infoSt = "p.media_info"
+        pathParams = ()
+    else:
+        prefix = os.path.join(os.path.abspath(mediaDir),"")
+        pathSt = "CASE WHEN instr(p.path,?) = 0 THEN ? || p.path ELSE p.path END"
+        infoSt = "CASE WHEN instr(json_extract(p.media_info,'$.path'),?) = 0 THEN json_set(p.media_info,'$.path',? || json_extract(p.media_info,'$.path')) ELSE p.media_info END"
+        pathParams = (os.sep,prefix,os.sep,prefix)
+    tmpPath = lDbAttach(db1,db2)
+    cursor = db1.connection.cursor()
+
+    try:
+        cursor.execute("DROP TABLE IF EXISTS temp.merge_ds")
+        cursor.execute("DROP TABLE IF EXISTS temp.merge_orid")
+        cursor.execute("CREATE TEMP TABLE merge_ds (old INTEGER PRIMARY KEY, new INTEGER NOT NULL)")
+        cursor.execute("CREATE TEMP TABLE merge_orid (old INTEGER PRIMARY KEY, new INTEGER NOT NULL, copied INTEGER NOT NULL)")
+        cursor.execute("CREATE INDEX temp.merge_orid_new ON merge_orid(new)")
+
+        with lDbBatch(db1):
+            cursor.execute("""
+                INSERT OR IGNORE INTO main.datastores (hash,type,conf,metadata)
+                    SELECT hash,type,conf,metadata FROM merged.datastores ORDER BY id
+                """)
+            report["datastores"] = cursor.rowcount
+            cursor.execute("""
+                INSERT INTO temp.merge_ds (old,new)
+                    SELECT s.id,m.id FROM merged.datastores s
+                    JOIN main.datastores m ON m.hash = s.hash
+                """)
+
+            offset = cursor.execute("SELECT IFNULL(MAX(id),0) AS offset FROM main.original").fetchone()["offset"]
+            cursor.execute("""
+                INSERT INTO temp.merge_orid (old,new,copied)
+                    SELECT p.orid,IFNULL(m.orid,p.orid+?),m.orid IS NULL FROM merged.parsed p
+                    LEFT JOIN main.parsed m ON m.md5 = p.md5
+                """,(offset,))
+            cursor.execute("""
+                INSERT INTO main.original (id,source,metadata)
+                    SELECT o.new,
+                           CASE WHEN d.new IS NULL THEN s.source ELSE json_set(s.source,'$.source_id',d.new) END,
+                           s.metadata
+                    FROM merged.original s
+                    JOIN temp.merge_orid o ON o.old = s.id AND o.copied
+                    LEFT JOIN temp.merge_ds d ON d.old = json_extract(s.source,'$.source_id')
+                """)
+            cursor.execute("""
+                INSERT INTO main.parsed (orid,md5,path,original_path,parse_seq,media_info,metadata)
+                    SELECT o.new,p.md5,{pathSt},p.original_path,p.parse_seq,{infoSt},p.metadata
+                    FROM merged.parsed p
+                    JOIN temp.merge_orid o ON o.old = p.orid AND o.copied
+                """.format(pathSt=pathSt,infoSt=infoSt),pathParams)
+            report["media"] = cursor.rowcount
+            cursor.execute("""
+                INSERT OR IGNORE INTO main.manifest (path,size,mtime,md5,orid)
+                    SELECT f.path,f.size,f.mtime,f.md5,o.new FROM merged.manifest f
+                    JOIN temp.merge_orid o ON o.old = f.orid
+                """)
+            cursor.execute("""
+                INSERT INTO main.annotations (notetype,orid,file_start,file_end,
+                start_time,end_time,duration,max_freq,min_freq,verts,wkt,label,groups,metadata)
+                    SELECT a.notetype,o.new,a.file_start,a.file_end,a.start_time,a.end_time,
+                           a.duration,a.max_freq,a.min_freq,a.verts,a.wkt,a.label,a.groups,a.metadata
+                    FROM merged.annotations a
+                    JOIN temp.merge_orid o ON o.old = a.orid
+                    WHERE o.copied = 1 OR NOT EXISTS (
+                        SELECT 1 FROM main.annotations b
+                        WHERE b.orid = o.new AND b.notetype = a.notetype
+                        AND b.file_start = a.file_start AND b.file_end = a.file_end
+                        AND b.label = a.label)
+                    ORDER BY a.id
+                """)
+            report["annotations"] = cursor.rowcount
+            report["orphans"] = cursor.execute("""
+                SELECT COUNT(*) AS orphans FROM merged.annotations a
+                WHERE NOT EXISTS (SELECT 1 FROM temp.merge_orid o WHERE o.old = a.orid)
+                """).fetchone()["orphans"]
+            report["duplicates"] = cursor.execute("SELECT COUNT(*) AS dups FROM temp.merge_orid WHERE NOT copied").fetchone()["dups"]
+
+        lDbDetach(db1,tmpPath)
+        tmpPath = None
+
+        report["transform1"] = lDbMergeTransform(db1,conf1,"orid NOT IN (SELECT new FROM temp.merge_orid WHERE copied)")
+        report["transform2"] = lDbMergeTransform(db1,conf2,"orid IN (SELECT new FROM temp.merge_orid WHERE copied)")
+    finally:
+        if tmpPath is not None:
+            lDbDetach(db1,tmpPath)
+        cursor.execute("DROP TABLE IF EXISTS temp.merge_ds")
+        cursor.execute("DROP TABLE IF EXISTS temp.merge_orid")
+
+    print("Merged: "+str(report["media"])+" media ("+str(report["duplicates"])+" duplicates), "+str(report["annotations"])+" annotations")
+    if report["orphans"] > 0:
+        print("Skipped "+str(report["orphans"])+" annotations without media in the merged database")
+
+    return report
+
+def lDbIterStatements(db):
     cnn = db.connection
     cnn.row_factory = lDbNoRowFactory
-    statements = [line for line in cnn.iterdump()]
-    cnn.row_factory = lDbRowFactory
+    try:
+        for line in cnn.iterdump():
+            if "annotations_rtree" not in line:
+                yield line
+    finally:
+        cnn.row_factory = lDbRowFactory
 
-    return statements
+def lDbAsStatements(db):
+    return [line for line in lDbIterStatements(db)]
 
 def lDbDump(db,dumpPath,overwrite):
     if os.path.isfile(dumpPath) and not overwrite:
         raise ValueError("File exists but 'overwrite' is False")
-    full_dump = os.linesep.join(db.asStatements())
-    f = open(dumpPath, 'w')
-    f.writelines(full_dump)
-    f.close()
+    f = lDbOpenDump(dumpPath,"w")
+    try:
+        for line in lDbIterStatements(db):
+            f.write(line)
+            f.write("\n")
+    finally:
+        f.close()
 
     return dumpPath
 
@@ -580,14 +1630,7 @@ def lDbTransfer(db,newDirPath,newName=None,overwrite=False):
         newName = db.name
     newPath = os.path.join(newDirPath,newName+".sqlite")
 
-    if os.path.isfile(newPath) and not overwrite:
-        raise ValueError("File exists but 'overwrite' is False")
-
-    if db.getType() != "RAMDb":
-        connPath = db.connPath
-        shutil.copyfile(connPath,newPath)
-        return newPath
-    else:
-        print("In memory database, transfering to disk...")
-        db.toDisk(newDirPath,newName).close()
+    if os.path.abspath(newPath) == os.path.abspath(db.connPath):
         return newPath
+
+    return lDbBackup(db,newPath,overwrite)
@@ -1,5 +1,8 @@
 import os
+import json
 import datetime,time
+from functools import lru_cache
+from collections.abc import MutableMapping
 import pytz
 from pytz import timezone
 from yuntu.core.common.utils import loadMethodFromFile
@@ -16,38 +19,107 @@ def loadParser(parserDict,parsersDir=None):
 
     return loadMethodFromFile(path,parserDict["function"])
 
-def sequentialTransform(meta,parseSeq,parsers,parsersDir=None):
-    #print(parsers)
-    metadata = meta.copy()
-    if parsers is None:
-        for parserDict in parseSeq:
+def resolveParseSeq(parseSeq,parsers,parsersDir=None):
+    resolved = []
+    for parserDict in parseSeq:
+        if parsers is None:
             parserFunction = loadParser(parserDict,parsersDir)
-            metadata = parserFunction(metadata)
-            if "kwargs" in parserDict:
-                metadata = parserFunction(metadata,**parserDict["kwargs"])
-            else:
-                metadata = parserFunction(metadata)
-    else:
-        for parserDict in parseSeq:
+        else:
             pkey = parserDict["path"]
             if pkey in parsers:
                 parserFunction = parsers[pkey]["func"]
-                if "kwargs" in parserDict:
-                    metadata = parserFunction(metadata,**parserDict["kwargs"])
-                else:
-                    metadata = parserFunction(metadata)
             else:
                 raise ValueError("Parser not in 'parsers' dict.")
 
+        kwargs = {}
+        if "kwargs" in parserDict:
+            kwargs = parserDict["kwargs"]
+
+        resolved.append((parserFunction,kwargs))
+
+    return resolved
+
+def applyParsers(meta,resolved):
+    metadata = meta.copy()
+    for parserFunction,kwargs in resolved:
+        metadata = parserFunction(metadata,**kwargs)
+
     return metadata
 
-def describeAudio(path,timeexp,md5):
-    au = Audio({"path":path,"timeexp":timeexp})
+def sequentialTransform(meta,parseSeq,parsers,parsersDir=None):
+    return applyParsers(meta,resolveParseSeq(parseSeq,parsers,parsersDir))
+
+def isPureParseSeq(parseSeq,resolved):
+    for parserDict,(parserFunction,kwargs) in zip(parseSeq,resolved):
+        if not parserDict.get("pure",False) and not getattr(parserFunction,"pure",False):
+            return False
+
+    return True
+
+def transformChunk(rows,parseSeq,parsers=None,parsersDir=None,resolved=None):
+    if resolved is None:
+        resolved = resolveParseSeq(parseSeq,parsers,parsersDir)
+
+    results = []
+    for orid,metadata in rows:
+        try:
+            results.append((orid,applyParsers(metadata,resolved),None))
+        except Exception as e:
+            results.append((orid,None,repr(e)))
+
+    return results
+
+def batchTransform(metas,parseSeq,parsers,parsersDir=None,resolved=None):
+    if resolved is None:
+        resolved = resolveParseSeq(parseSeq,parsers,parsersDir)
+
+    batch = [meta.copy() for meta in metas]
+    for parserFunction,kwargs in resolved:
+        if getattr(parserFunction,"vectorized",False):
+            batch = list(parserFunction(batch,**kwargs))
+            if len(batch) != len(metas):
+                raise ValueError("Vectorized parser returned a batch of a different size")
+        else:
+            batch = [parserFunction(metadata,**kwargs) for metadata in batch]
+
+    return batch
+
+def wavInfoAsMediaInfo(path,timeexp,wavInfo):
+    info = {}
+    info["path"] = path
+    info["filesize"] = wavInfo["filesize"]
+    info["timeexp"] = timeexp
+    info["samplerate"] = wavInfo["samplerate"]
+    info["sampwidth"] = wavInfo["sampwidth"]
+    info["length"] = wavInfo["length"]
+    info["nchannels"] = wavInfo["nchannels"]
+    info["duration"] = (float(wavInfo["length"])/float(wavInfo["samplerate"]))/timeexp
+
+    return info
+
+def describeAudio(path,timeexp,md5,wavInfo=None):
     if md5 is None:
         md5 = binaryMD5(path)
+    if wavInfo is not None:
+        return wavInfoAsMediaInfo(path,timeexp,wavInfo),md5
+
+    au = Audio({"path":path,"timeexp":timeexp})
 
     return au.getMediaInfo(),md5
 
+def describeJob(job):
+    if job["error"] is None and job["status"] != "skipped":
+        try:
+            wavInfo = job.get("wavInfo")
+            if wavInfo is not None and wavInfo.get("filesize") != job.get("size"):
+                wavInfo = None
+            job["media_info"],job["md5"] = describeAudio(job["path"],job["timeexp"],job["md5"],wavInfo)
+            job["media_info"]["md5"] = job["md5"]
+        except Exception as e:
+            job["error"] = e
+
+    return job
+
 def standardizeTime(strTime,timeZone,format='%d-%m-%Y %H:%M:%S'):
     tzObj = pytz.timezone(timeZone)
     
@@ -139,3 +211,91 @@ def addTimeFields(dataArr,timeField,tzField,format):
 def jsonExtractFormat(field,parentField):
     return "json_extract("+parentField+",'$."+field+"')"
 
+
+JSON_COLUMNS = frozenset(["metadata","media_info","parse_seq","source","conf","groups","label","verts","results"])
+DELETED = object()
+
+@lru_cache(maxsize=256)
+def rowLayout(description):
+    positions = [i for i in range(len(description)) if description[i][0][:4] != "_ix_"]
+    keys = tuple([description[i][0] for i in positions])
+    index = {keys[j]:j for j in range(len(keys))}
+    isJson = tuple([key in JSON_COLUMNS for key in keys])
+
+    return keys,index,isJson,tuple(positions)
+
+class lazyRow(MutableMapping):
+    """Sqlite row that decodes JSON columns on first access."""
+    __slots__ = ("_layout","_values","_decoded","_extra")
+
+    def __init__(self,layout,values):
+        self._layout = layout
+        self._values = values
+        self._decoded = [not flag for flag in layout[2]]
+        self._extra = None
+
+    def __getitem__(self,key):
+        index = self._layout[1]
+        if key in index:
+            pos = index[key]
+            if not self._decoded[pos]:
+                raw = self._values[pos]
+                if raw is not None:
+                    raw = json.loads(raw)
+                self._values[pos] = raw
+                self._decoded[pos] = True
+            if self._values[pos] is DELETED:
+                raise KeyError(key)
+            return self._values[pos]
+        if self._extra is not None and key in self._extra:
+            return self._extra[key]
+        raise KeyError(key)
+
+    def __setitem__(self,key,value):
+        index = self._layout[1]
+        if key in index:
+            self._values[index[key]] = value
+            self._decoded[index[key]] = True
+        else:
+            if self._extra is None:
+                self._extra = {}
+            self._extra[key] = value
+
+    def __delitem__(self,key):
+        index = self._layout[1]
+        if key in index and self._values[index[key]] is not DELETED:
+            self._values[index[key]] = DELETED
+            self._decoded[index[key]] = True
+        elif self._extra is not None and key in self._extra:
+            del self._extra[key]
+        else:
+            raise KeyError(key)
+
+    def __iter__(self):
+        for key,pos in self._layout[1].items():
+            if self._values[pos] is not DELETED:
+                yield key
+        if self._extra is not None:
+            for key in self._extra:
+                yield key
+
+    def __len__(self):
+        return len(list(iter(self)))
+
+    def __contains__(self,key):
+        index = self._layout[1]
+        if key in index:
+            return self._values[index[key]] is not DELETED
+        return self._extra is not None and key in self._extra
+
+    def __reduce__(self):
+        return (dict,(self.asDict(),))
+
+    def __repr__(self):
+        return repr(self.asDict())
+
+    def asDict(self):
+        return {key:self[key] for key in self}
+
+    def copy(self):
+        return self.asDict()
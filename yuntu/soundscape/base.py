@@ -117,6 +117,7 @@ class simpleSoundscape(metaSoundscape):
                 "fBins" : 10,
                 "fLimits" : [0,10000],
                 "readSr" : None,
+                "streamSpec" : False,
                 "transformations" : {
                     "aggr":{
                         "method":"numpy.sum"
@@ -212,6 +213,7 @@ class cronoSoundscape(simpleSoundscape):
                 "fBins" : 10,
                 "fLimits" : [0,10000],
                 "readSr" : None,
+                "streamSpec" : False,
                 "transformations" : {
                     "aggr":{
                         "method":"numpy.sum"
@@ -5,8 +5,8 @@ import yuntu.soundscape.ops as scOps
 from yuntu.core.common.utils import cleanDirectory,dumpJsonFile,loadJsonFile
 from yuntu.soundscape.utils import loadTransform, getCombinations, filterExpr
 from yuntu.soundscape.views import plot_concat,plot_aggr
-from yuntu.core.db.utils import jsonExtractFormat,catToStrTime,transformTime,standardizeTime
-from yuntu.core.db.methods import lDbSelect,lDbParseQuery
+from yuntu.core.db.utils import catToStrTime,transformTime,standardizeTime
+from yuntu.core.db.methods import lDbSelect,lDbCompileQuery,lDbParamValue,lDbFieldColumn
 from yuntu.collection.base import timedCollection,simpleCollection
 
 
@@ -96,10 +96,11 @@ def soundscapeSetIndexparams(sc,indexParams):
 
 
 def soundscapeGetFieldLevels(sc,field):
-    selectSt = "DISTINCT "+jsonExtractFormat(field,"metadata")+" AS levels FROM parsed "
-    if sc.config["globalParams"]["collectionFilter"] is not None:
-        selectSt += "WHERE "+lDbParseQuery(sc.config["globalParams"]["collectionFilter"])
-    distinct =  lDbSelect(sc.collection.db,freeSt=selectSt)
+    selectSt = "DISTINCT "+lDbFieldColumn(sc.collection.db,field,"metadata")+" AS levels FROM parsed "
+    whereSt,params = lDbCompileQuery(sc.config["globalParams"]["collectionFilter"],sc.collection.db)
+    if whereSt is not None:
+        selectSt += "WHERE "+whereSt
+    distinct =  lDbSelect(sc.collection.db,freeSt=selectSt,params=params)
     vals = []
     for row in distinct:
         vals.append(row["levels"])
@@ -112,26 +113,21 @@ def soundscapeGetFieldLevels(sc,field):
 
 def soundscapeGetGroupCount(sc,group):
     groupingFields = sc.config["globalParams"]["groupingFields"]
-    val = group[0]
-    if isinstance(val,str):
-        val = "'"+val+"'"
-    selectSt = "count(*) as gcount FROM parsed WHERE "+jsonExtractFormat(groupingFields[0],"metadata")+"="+str(val)
+    selectSt = "count(*) as gcount FROM parsed WHERE "+lDbFieldColumn(sc.collection.db,groupingFields[0],"metadata")+" = ?"
     for i in range(1,len(groupingFields)):
-        val = group[i]
-        if isinstance(val,str):
-            val = "'"+val+"'"
-        selectSt += " AND "+jsonExtractFormat(groupingFields[i],"metadata")+"="+str(val)
-    dcount = lDbSelect(sc.collection.db,freeSt=selectSt)
+        selectSt += " AND "+lDbFieldColumn(sc.collection.db,groupingFields[i],"metadata")+" = ?"
+    dcount = lDbSelect(sc.collection.db,freeSt=selectSt,params=tuple([lDbParamValue(val) for val in group[:len(groupingFields)]]))
 
     return dcount[0]["gcount"]
 
 def soundscapeInferMetadataTypes(sc,groupingFields):
     selectSt = "metadata from parsed"
-    if sc.config["globalParams"]["collectionFilter"] is not None:
-        selectSt += " WHERE "+lDbParseQuery(sc.config["globalParams"]["collectionFilter"])
+    whereSt,params = lDbCompileQuery(sc.config["globalParams"]["collectionFilter"],sc.collection.db)
+    if whereSt is not None:
+        selectSt += " WHERE "+whereSt
 
     selectSt += " limit 10"
-    metaSample = lDbSelect(sc.collection.db,freeSt=selectSt)
+    metaSample = lDbSelect(sc.collection.db,freeSt=selectSt,params=params)
 
     dTypes = {}
     for field in groupingFields:
@@ -266,7 +262,11 @@ def soundscapeSetLoadNodes(sc):
 
 
     sc.setNode("globalParams",sc.config["globalParams"])
-    sc.setNode("energyParams",sc.config["energyParams"])
+    energyParams = dict(sc.config["energyParams"])
+    energyParams["specCache"] = None
+    if sc.collection.specCache is not None:
+        energyParams["specCache"] = sc.collection.specCache.getConf()
+    sc.setNode("energyParams",energyParams)
     sc.setNode("samplingParams",sc.config["samplingParams"])
     sc.setNode("indexParams",sc.config["indexParams"])        
 
@@ -313,7 +313,7 @@ def soundscapeSetLoadNodes(sc):
     sc.setNode("eTransform",{"signal":sigTransform,"spec":specTransform,"aggr":aggrTransform,"full_spec":fullSpecTransform})
 
     colFilter = sc.config["globalParams"]["collectionFilter"]
-    dData = sc.collection.db.find(query=colFilter)
+    dData = sc.collection.db.find(query=colFilter,fields=["orid","media_info","metadata"])
 
     sc.setNode("dataInput",dData)
     sc.setNode("fragment",(scOps.loadFragment,"dataInput","groupFields","globalParams"))
@@ -9,6 +9,8 @@ from dask.delayed import delayed
 from dask.optimization import cull,inline,inline_functions,fuse
 from yuntu.core.db.utils import timeAsCat
 from yuntu.core.audio.base import Audio
+import yuntu.core.audio.utils as auUtils
+from yuntu.core.cache.base import getSpecCache
 
 
 def writeParquet(node,path):
@@ -52,18 +54,47 @@ def doTransform(e,eTransform,transformDict):
         return e
     
     
-def sliceEnergy(spec,eCols,fCuts,duration,start,stop,unitSize,eTransform,config):
+def stepBins(tbins,duration,start,unitSize):
+    startBin = min(int(round((float(tbins)/duration)*start)),tbins-1)
+    stopBin = min(startBin+unitSize,tbins-1)
+
+    return startBin,stopBin
+
+def streamWindows(blocks,tbins,duration,starts,unitSize,fSlice=None):
+    #Yields (window,offset) for each step keeping only needed columns in memory.
+    buf = None
+    offset = 0
+    for start in starts:
+        startBin,stopBin = stepBins(tbins,duration,start,unitSize)
+        while buf is None or offset+buf.shape[1] < stopBin:
+            block = next(blocks,None)
+            if block is None:
+                break
+            if fSlice is not None:
+                block = block[fSlice[0]:fSlice[1],:]
+            if buf is None:
+                buf = block
+            else:
+                buf = np.concatenate([buf,block],axis=1)
+
+        if buf is not None and startBin > offset:
+            buf = buf[:,startBin-offset:]
+            offset = startBin
+
+        yield buf,offset
+
+def sliceEnergy(spec,eCols,fCuts,duration,start,stop,unitSize,eTransform,config,specOffset=0,tbins=None):
     results = {}
     try:
-        fbins,tbins = spec.shape
+        if tbins is None:
+            tbins = spec.shape[1]
         if stop - start > config["tStep"]:
             e = spec
             nbins = tbins
         else:
-            startBin = min(int(round((float(tbins)/duration)*start)),tbins-1)
-            stopBin = min(startBin+unitSize,tbins-1)
+            startBin,stopBin = stepBins(tbins,duration,start,unitSize)
             nbins = stopBin-startBin
-            e = spec[:,startBin:stopBin]
+            e = spec[:,startBin-specOffset:stopBin-specOffset]
 
         if nbins < float(unitSize)/2:
             raise ValueError("Generated empty slice!")
@@ -114,6 +145,8 @@ def splitTime(obj,eCols,eTransform,config):
 
     au = Audio(config=media_info,fromConfig=True)
     au.unsetMask()
+    if "specCache" in config and config["specCache"] is not None:
+        au.setSpecCache(getSpecCache(**config["specCache"]))
 
     sr = media_info["samplerate"]
     if config["readSr"] is not None:
@@ -147,10 +180,18 @@ def splitTime(obj,eCols,eTransform,config):
 
         preProcess = {"transform":sTransform,"kwargs":kwargs}
 
+    streamSpec = config["streamSpec"]
+    if streamSpec and sr != media_info["samplerate"]:
+        raise ValueError("Streaming spectrograms can not be used with 'readSr'")
+
     out = []
     for chan in chanList:
         #try:
-        spec, freqs = au.getSpec(chan,config["n_fft"],config["hop_length"],preProcess=preProcess)
+        if streamSpec:
+            freqs = auUtils.specFrequencies(sr,config["n_fft"])
+            spec = au.iterSpec(chan,config["n_fft"],config["hop_length"],preProcess=preProcess)
+        else:
+            spec, freqs = au.getSpec(chan,config["n_fft"],config["hop_length"],preProcess=preProcess)
         
         if chan is None:
             chan = 99
@@ -169,7 +210,8 @@ def splitTime(obj,eCols,eTransform,config):
             if maxFreqIdx <= minFreqIdx:
                 raise ValueError("Wrong frequency limits")
 
-            spec = spec[minFreqIdx:maxFreqIdx,:]
+            if not streamSpec:
+                spec = spec[minFreqIdx:maxFreqIdx,:]
         fStep = round(int(float(freqRange)/config["fBins"]))
         fSteps = [[i*fStep,(i+1)*fStep] for i in range(config["fBins"])]
         fCuts =  [[(np.abs(freqs - x[0])).argmin(),(np.abs(freqs - x[1])).argmin()] for x in fSteps]
@@ -181,6 +223,14 @@ def splitTime(obj,eCols,eTransform,config):
         #    spec = None
 
         if spec is not None:
+            windows = None
+            if streamSpec:
+                tbins = 1+media_info["length"]//config["hop_length"]
+                fSlice = None
+                if config["fLimits"] is not None:
+                    fSlice = (minFreqIdx,maxFreqIdx)
+                windows = streamWindows(spec,tbins,fileDuration,[step*tStep for step in range(nsteps)],unitSize,fSlice)
+
             for step in range(nsteps):
                 raw = {}
                 for key in prevCols:
@@ -201,7 +251,11 @@ def splitTime(obj,eCols,eTransform,config):
                 raw["chunkAbsStart"] = startSec
                 raw["chunkAbsStop"] = stopSec
                 
-                eResults = sliceEnergy(spec,eCols,fCuts,fileDuration,fileStart,fileStop,unitSize,eTransform,config)
+                if windows is not None:
+                    window,specOffset = next(windows)
+                    eResults = sliceEnergy(window,eCols,fCuts,fileDuration,fileStart,fileStop,unitSize,eTransform,config,specOffset,tbins)
+                else:
+                    eResults = sliceEnergy(spec,eCols,fCuts,fileDuration,fileStart,fileStop,unitSize,eTransform,config)
                 for col in ["chunkTbins","chunkWeight"]+eCols:
                     raw[col] = eResults[col]
                 out.append(raw)